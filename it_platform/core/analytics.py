@@ -0,0 +1,192 @@
+"""
+讲师数据看板的预聚合
+
+rollup() 由 celery beat 定时调用，把上次水位线之后的新数据累加到小时汇总表，
+再由受影响的小时重新汇总出每日统计：
+  - 报名 / 评论 / 作业提交：有创建时间，按事件发生的小时归档
+  - 浏览 / 点赞 / 课时完成：只有累计计数，与上次快照的差值计入当前小时
+看板接口只读取汇总表，不再在请求时跨表统计。
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import (
+    Course, Enrollment, Comment, Submission, LessonProgress,
+    CourseHourlyStat, CourseDailyStat, CourseStatSnapshot, RollupCursor
+)
+
+METRICS = CourseHourlyStat.METRICS
+CURSOR_NAME = 'course_stats'
+LOCK_KEY = 'analytics:rollup_lock'
+# 只处理一分钟以前的数据，给尚未提交的事务留出时间
+ROLLUP_LAG = timedelta(minutes=1)
+
+# 指标 -> (模型, 时间字段, 课程ID路径)
+EVENT_SOURCES = {
+    'enrollments': (Enrollment, 'enrolled_at', 'course_id'),
+    'comments': (Comment, 'created_at', 'course_id'),
+    'submissions': (Submission, 'submitted_at', 'assignment__course_id'),
+}
+
+
+def _event_counts(since, until, counts):
+    for metric, (model, time_field, course_path) in EVENT_SOURCES.items():
+        window = {f'{time_field}__lte': until}
+        if since is not None:
+            window[f'{time_field}__gt'] = since
+        rows = model.objects.filter(**window).order_by().annotate(
+            bucket=TruncHour(time_field)
+        ).values(course_path, 'bucket').annotate(total=Count('pk')).values_list(course_path, 'bucket', 'total')
+        for course_id, bucket, total in rows:
+            if course_id is not None:
+                counts[(course_id, bucket)][metric] += total
+
+
+def _counter_deltas(bucket, counts):
+    """比较累计计数与快照，差值计入当前小时，并推进快照"""
+    completions = dict(
+        LessonProgress.objects.filter(is_completed=True).order_by()
+        .values('lesson__module__course_id').annotate(total=Count('pk'))
+        .values_list('lesson__module__course_id', 'total')
+    )
+    snapshots = CourseStatSnapshot.objects.in_bulk()
+    changed, created = [], []
+    for course_id, view_count, like_count in Course.objects.values_list('id', 'view_count', 'like_count'):
+        completion_count = completions.get(course_id, 0)
+        snapshot = snapshots.get(course_id)
+        is_new = snapshot is None
+        if is_new:
+            snapshot = CourseStatSnapshot(course_id=course_id)
+            created.append(snapshot)
+        deltas = {
+            'views': view_count - snapshot.view_count,
+            'likes': like_count - snapshot.like_count,
+            'completions': completion_count - snapshot.completion_count,
+        }
+        if any(deltas.values()):
+            for metric, delta in deltas.items():
+                counts[(course_id, bucket)][metric] += delta
+            snapshot.view_count, snapshot.like_count, snapshot.completion_count = view_count, like_count, completion_count
+            if not is_new:
+                changed.append(snapshot)
+    CourseStatSnapshot.objects.bulk_create(created)
+    CourseStatSnapshot.objects.bulk_update(changed, ['view_count', 'like_count', 'completion_count'])
+
+
+def _merge_hourly(counts):
+    course_ids = {course_id for course_id, _ in counts}
+    hours = {hour for _, hour in counts}
+    existing = {
+        (row.course_id, row.hour): row
+        for row in CourseHourlyStat.objects.filter(course_id__in=course_ids, hour__in=hours)
+    }
+    to_update, to_create = [], []
+    for (course_id, hour), values in counts.items():
+        row = existing.get((course_id, hour))
+        if row is None:
+            to_create.append(CourseHourlyStat(course_id=course_id, hour=hour, **values))
+        else:
+            for metric, value in values.items():
+                setattr(row, metric, getattr(row, metric) + value)
+            to_update.append(row)
+    CourseHourlyStat.objects.bulk_create(to_create, batch_size=500)
+    CourseHourlyStat.objects.bulk_update(to_update, METRICS, batch_size=500)
+
+
+def _refresh_daily(counts):
+    """按受影响的 (课程, 日期) 从小时表重新汇总每日统计"""
+    days = defaultdict(set)
+    for course_id, hour in counts:
+        days[timezone.localdate(hour)].add(course_id)
+
+    for day, course_ids in days.items():
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        totals = CourseHourlyStat.objects.filter(
+            course_id__in=course_ids, hour__gte=start, hour__lt=start + timedelta(days=1)
+        ).order_by().values('course_id').annotate(**{metric: Sum(metric) for metric in METRICS})
+        existing = {
+            row.course_id: row for row in CourseDailyStat.objects.filter(course_id__in=course_ids, date=day)
+        }
+        to_update, to_create = [], []
+        for total in totals:
+            course_id = total.pop('course_id')
+            row = existing.get(course_id)
+            if row is None:
+                to_create.append(CourseDailyStat(course_id=course_id, date=day, **total))
+            else:
+                for metric, value in total.items():
+                    setattr(row, metric, value)
+                to_update.append(row)
+        CourseDailyStat.objects.bulk_create(to_create, batch_size=500)
+        CourseDailyStat.objects.bulk_update(to_update, METRICS, batch_size=500)
+
+
+def rollup(now=None):
+    """增量汇总一次，返回写入的 (课程, 小时) 数；已有任务在运行时直接返回 0"""
+    if not cache.add(LOCK_KEY, 1, 60 * 10):
+        return 0
+    try:
+        now = now or timezone.now()
+        until = now - ROLLUP_LAG
+        with transaction.atomic():
+            cursor = RollupCursor.objects.select_for_update().filter(name=CURSOR_NAME).first()
+            since = cursor.position if cursor else None
+            if since is not None and since >= until:
+                return 0
+
+            counts = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+            _event_counts(since, until, counts)
+            _counter_deltas(_truncate_hour(now), counts)
+            if counts:
+                _merge_hourly(counts)
+                _refresh_daily(counts)
+            RollupCursor.objects.update_or_create(name=CURSOR_NAME, defaults={'position': until})
+        return len(counts)
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def _truncate_hour(moment):
+    local = timezone.localtime(moment)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def _date_range(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def course_series(course_ids, start, end, granularity='day'):
+    """
+    返回 (区间汇总, 时间序列)；序列中没有数据的日期/小时补 0
+    :param granularity: 'day' 读每日表，'hour' 读小时表 (适合短区间)
+    """
+    if granularity == 'hour':
+        start_at = timezone.make_aware(datetime.combine(start, time.min))
+        end_at = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        rows = CourseHourlyStat.objects.filter(course_id__in=course_ids, hour__gte=start_at, hour__lt=end_at)
+        key = 'hour'
+        buckets = [start_at + timedelta(hours=i) for i in range(int((end_at - start_at).total_seconds() // 3600))]
+    else:
+        rows = CourseDailyStat.objects.filter(course_id__in=course_ids, date__gte=start, date__lte=end)
+        key = 'date'
+        buckets = list(_date_range(start, end))
+
+    by_bucket = {
+        row.pop(key): row
+        for row in rows.order_by().values(key).annotate(**{metric: Sum(metric) for metric in METRICS})
+    }
+    empty = dict.fromkeys(METRICS, 0)
+    series, summary = [], dict(empty)
+    for bucket in buckets:
+        values = {metric: value or 0 for metric, value in by_bucket.get(bucket, empty).items()}
+        for metric in METRICS:
+            summary[metric] += values[metric]
+        series.append({key: bucket, **values})
+    return summary, series
@@ -0,0 +1,136 @@
+"""
+勋章评估引擎
+
+勋章规则很少变化，按 condition_type 分组并按阈值排序后缓存在进程内存中；
+判断可解锁的勋章只需对每种条件做一次二分查找。
+规则版本号存放在 Django 缓存中，Badge 变更时递增，进程发现版本变化后重新加载。
+只有缓存后端为各进程共享 (如 Redis) 时，其他进程才能看到版本变化；
+使用进程内的本地内存缓存时，失效只对执行变更的进程生效。
+"""
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from django.core.cache import cache
+from .models import Badge, UserBadge, UserPoints
+
+RULES_VERSION_KEY = 'badge_rules:version'
+
+# UserPoints 字段 -> 勋章 condition_type
+CONDITION_FIELDS = {
+    'points': 'total_points',
+    'continuous_days': 'continuous_days',
+    'level': 'level',
+}
+
+_lock = threading.Lock()
+_rules = None
+_rules_version = None
+
+
+def _initial_version():
+    # 版本号被淘汰后从当前时间重新开始，不会与进程中记住的旧版本号重复
+    return int(time.time())
+
+
+def _current_version():
+    version = cache.get(RULES_VERSION_KEY)
+    if version is None:
+        cache.add(RULES_VERSION_KEY, _initial_version(), None)
+        version = cache.get(RULES_VERSION_KEY, 0)
+    return version
+
+
+def _load_rules():
+    """{condition_type: (升序阈值列表, 对应的勋章ID列表)}"""
+    grouped = defaultdict(list)
+    for badge_id, condition_type, value in Badge.objects.values_list('id', 'condition_type', 'condition_value'):
+        if condition_type in CONDITION_FIELDS:
+            grouped[condition_type].append((value, badge_id))
+    rules = {}
+    for condition_type, items in grouped.items():
+        items.sort()
+        rules[condition_type] = ([value for value, _ in items], [badge_id for _, badge_id in items])
+    return rules
+
+
+def get_rules():
+    global _rules, _rules_version
+    version = _current_version()
+    if _rules is None or _rules_version != version:
+        with _lock:
+            if _rules is None or _rules_version != version:
+                _rules = _load_rules()
+                _rules_version = version
+    return _rules
+
+
+def invalidate_rules():
+    """递增规则版本号 (先确保键存在再递增，键不存在时也一定得到新的版本号)"""
+    cache.add(RULES_VERSION_KEY, _initial_version(), None)
+    try:
+        cache.incr(RULES_VERSION_KEY)
+    except ValueError:
+        # add 与 incr 之间键被淘汰
+        cache.set(RULES_VERSION_KEY, _initial_version() + 1, None)
+
+
+def eligible_badge_ids(stats, rules=None):
+    """
+    :param stats: {'points': 总积分, 'continuous_days': 连续天数, 'level': 等级}
+    :return: 满足条件的勋章ID集合
+    """
+    eligible = set()
+    for condition_type, (thresholds, badge_ids) in (rules or get_rules()).items():
+        value = stats.get(condition_type)
+        if value is not None:
+            eligible.update(badge_ids[:bisect_right(thresholds, value)])
+    return eligible
+
+
+def _stats_of(user_points):
+    return {condition_type: getattr(user_points, field) for condition_type, field in CONDITION_FIELDS.items()}
+
+
+def evaluate(user, user_points):
+    """解锁用户新满足条件的勋章，返回新解锁的勋章ID列表"""
+    eligible = eligible_badge_ids(_stats_of(user_points))
+    if not eligible:
+        return []
+    owned = set(UserBadge.objects.filter(user=user).values_list('badge_id', flat=True))
+    new_ids = sorted(eligible - owned)
+    if new_ids:
+        # 并发请求可能同时解锁同一勋章，由唯一约束兜底
+        UserBadge.objects.bulk_create(
+            [UserBadge(user=user, badge_id=badge_id) for badge_id in new_ids], ignore_conflicts=True
+        )
+    return new_ids
+
+
+def backfill(chunk_size=1000):
+    """按批次为所有用户补发已满足条件的勋章 (新增勋章后执行)，返回补发数量"""
+    rules = get_rules()
+    if not rules:
+        return 0
+    fields = ['user_id', *CONDITION_FIELDS.values()]
+    awarded = 0
+    last_id = 0
+    while True:
+        chunk = list(UserPoints.objects.filter(pk__gt=last_id).order_by('pk').values('pk', *fields)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1]['pk']
+        owned = defaultdict(set)
+        for user_id, badge_id in UserBadge.objects.filter(
+            user_id__in=[row['user_id'] for row in chunk]
+        ).values_list('user_id', 'badge_id'):
+            owned[user_id].add(badge_id)
+
+        new_badges = []
+        for row in chunk:
+            stats = {condition_type: row[field] for condition_type, field in CONDITION_FIELDS.items()}
+            for badge_id in eligible_badge_ids(stats, rules) - owned[row['user_id']]:
+                new_badges.append(UserBadge(user_id=row['user_id'], badge_id=badge_id))
+        UserBadge.objects.bulk_create(new_badges, ignore_conflicts=True)
+        awarded += len(new_badges)
+    return awarded
@@ -0,0 +1,95 @@
+"""
+课时讨论区首页缓存
+
+讨论区读多写少：每个课时前几页的评论列表预先渲染为 JSON 字节存入缓存，
+键中带有该课时的版本号，评论新增/回复/删除后 (事务提交时) 递增版本号即可整体失效。
+
+缓存条目保存 (刷新时间, 内容)，实际过期时间比刷新时间长：
+  - 条目到了刷新时间：抢到锁的一个请求负责重建，其余请求继续返回旧内容
+  - 条目不存在 (刚失效或被淘汰)：抢到锁的请求重建，其余请求短暂等待其结果，
+    超时仍未等到时自行查询但不回填
+热门课时的缓存过期时不会有大量请求同时穿透到数据库。
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'lesson_comments:{}:version'
+PAGE_KEY = 'lesson_comments:{}:{}:{}:{}'
+LOCK_TIMEOUT = 10
+# 未命中时等待其他请求重建的轮询间隔与次数
+WAIT_INTERVAL = 0.05
+WAIT_ATTEMPTS = 20
+# 缓存条目在刷新时间之后仍保留的倍数，期间可作为旧内容返回
+STALE_FACTOR = 5
+
+
+def cached_pages():
+    return getattr(settings, 'COMMENT_CACHE_PAGES', 2)
+
+
+def _refresh_timeout():
+    return getattr(settings, 'COMMENT_CACHE_TIMEOUT', 60)
+
+
+def _current_version(lesson_id):
+    key = VERSION_KEY.format(lesson_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def page_key(lesson_id, page, host=''):
+    return PAGE_KEY.format(lesson_id, _current_version(lesson_id), host, page)
+
+
+def invalidate(lesson_id):
+    """事务提交后递增该课时的版本号，使已缓存的评论页全部失效"""
+    def bump():
+        key = VERSION_KEY.format(lesson_id)
+        cache.add(key, 1, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 2, None)
+
+    transaction.on_commit(bump)
+
+
+def _rebuild(key, build):
+    """调用方已持有锁：构建内容并回填缓存"""
+    try:
+        content = build()
+        timeout = _refresh_timeout()
+        cache.set(key, (time.time() + timeout, content), timeout * STALE_FACTOR)
+        return content
+    finally:
+        cache.delete(key + ':lock')
+
+
+def get_page(lesson_id, page, build, host=''):
+    """
+    读取某课时某一页的评论列表
+    :param build: 无参函数，返回渲染好的 JSON 字节
+    :param host: 请求的主机名，分页链接中包含完整 URL
+    """
+    key = page_key(lesson_id, page, host)
+    lock_key = key + ':lock'
+    entry = cache.get(key)
+    if entry is not None:
+        refresh_at, content = entry
+        if refresh_at > time.time() or not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            return content
+        return _rebuild(key, build)
+
+    for _ in range(WAIT_ATTEMPTS):
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            return _rebuild(key, build)
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+    return build()
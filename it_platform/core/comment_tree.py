@@ -0,0 +1,65 @@
+"""
+评论树加载
+
+课时讨论区按页返回顶级评论，每条只附带最早的 K 条回复与回复总数，
+其余回复由 replies 接口分页拉取。一页评论的开销固定为几条查询：
+  1. 顶级评论本身 (分页)
+  2. 各主题的回复数 (一次 GROUP BY)
+  3. 各主题的前 K 条回复 (ROW_NUMBER() 窗口函数)
+  4. 页面中出现的所有用户名片 (一次 IN 查询)
+"""
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from .models import Comment, CustomUser
+
+REPLY_PREVIEW_SIZE = 3
+USER_CARD_FIELDS = ('id', 'username', 'nickname', 'avatar')
+
+
+def user_cards(user_ids):
+    """批量读取用户名片，返回 {用户ID: 用户}，只加载名片所需的字段"""
+    user_ids = {user_id for user_id in user_ids if user_id}
+    if not user_ids:
+        return {}
+    return CustomUser.objects.only(*USER_CARD_FIELDS).in_bulk(user_ids)
+
+
+def attach_user_cards(comments):
+    """为评论 (含回复) 填充 user / reply_to_user，避免序列化时逐条查询"""
+    cards = user_cards(
+        user_id for comment in comments for user_id in (comment.user_id, comment.reply_to_user_id)
+    )
+    for comment in comments:
+        comment.user = cards[comment.user_id]
+        if comment.reply_to_user_id in cards:
+            comment.reply_to_user = cards[comment.reply_to_user_id]
+    return comments
+
+
+def load_threads(roots, preview_size=REPLY_PREVIEW_SIZE):
+    """
+    为一页顶级评论加载回复预览
+    结果挂在 reply_preview (最早的 preview_size 条) 与 reply_count 属性上
+    """
+    roots = list(roots)
+    if not roots:
+        return roots
+    root_ids = [root.pk for root in roots]
+
+    counts = dict(
+        Comment.objects.filter(parent_id__in=root_ids).order_by()
+        .values('parent_id').annotate(total=Count('pk')).values_list('parent_id', 'total')
+    )
+    previews = {root_id: [] for root_id in root_ids}
+    if counts:
+        replies = Comment.objects.filter(parent_id__in=list(counts)).annotate(
+            position=Window(RowNumber(), partition_by=F('parent_id'), order_by=[F('created_at'), F('id')])
+        ).filter(position__lte=preview_size).order_by('parent_id', 'position')
+        for reply in replies:
+            previews[reply.parent_id].append(reply)
+
+    attach_user_cards(roots + [reply for thread in previews.values() for reply in thread])
+    for root in roots:
+        root.reply_preview = previews[root.pk]
+        root.reply_count = counts.get(root.pk, 0)
+    return roots
@@ -0,0 +1,81 @@
+"""
+好友关系访问层
+
+每个用户的邻接集合 (好友 / 我发出的待处理申请 / 我收到的待处理申请) 用一条查询取出并缓存，
+搜索结果的好友状态、好友列表等展示用途从该集合读取。
+Friendship 变更时由信号清除双方的缓存；缓存可能是进程内的 (各进程互不可见)，
+因此权限判断 (are_friends，如发私信前的校验) 不读缓存，直接查询数据库。
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from .models import Friendship
+
+ADJACENCY_KEY = 'friend_graph:{}'
+ADJACENCY_TIMEOUT = 60 * 30
+
+STATUS_FRIEND = 'friend'
+STATUS_SENT = 'sent'
+STATUS_RECEIVED = 'received'
+STATUS_NONE = 'none'
+
+
+def _load_adjacency(user_id):
+    adjacency = {'friends': set(), 'outgoing': set(), 'incoming': set()}
+    rows = Friendship.objects.filter(
+        Q(from_user_id=user_id) | Q(to_user_id=user_id)
+    ).exclude(status=Friendship.STATUS_REJECTED).order_by().values_list('from_user_id', 'to_user_id', 'status')
+    for from_id, to_id, status in rows:
+        other_id = to_id if from_id == user_id else from_id
+        if status == Friendship.STATUS_ACCEPTED:
+            adjacency['friends'].add(other_id)
+        elif from_id == user_id:
+            adjacency['outgoing'].add(other_id)
+        else:
+            adjacency['incoming'].add(other_id)
+    return adjacency
+
+
+def get_adjacency(user_id):
+    """返回 {'friends', 'outgoing', 'incoming'} 三个用户 ID 集合"""
+    key = ADJACENCY_KEY.format(user_id)
+    adjacency = cache.get(key)
+    if adjacency is None:
+        adjacency = _load_adjacency(user_id)
+        cache.set(key, adjacency, ADJACENCY_TIMEOUT)
+    return adjacency
+
+
+def friendship_statuses(user_id, other_ids):
+    """批量解析当前用户与一组用户的关系，返回 {用户ID: 'friend' / 'sent' / 'received' / 'none'}"""
+    adjacency = get_adjacency(user_id)
+    statuses = {}
+    for other_id in other_ids:
+        if other_id in adjacency['friends']:
+            statuses[other_id] = STATUS_FRIEND
+        elif other_id in adjacency['outgoing']:
+            statuses[other_id] = STATUS_SENT
+        elif other_id in adjacency['incoming']:
+            statuses[other_id] = STATUS_RECEIVED
+        else:
+            statuses[other_id] = STATUS_NONE
+    return statuses
+
+
+def are_friends(user_id, other_id):
+    """用于权限判断：直接查询数据库，不受其他进程中旧缓存的影响"""
+    return Friendship.objects.filter(
+        Q(from_user_id=user_id, to_user_id=other_id) | Q(from_user_id=other_id, to_user_id=user_id),
+        status=Friendship.STATUS_ACCEPTED,
+    ).exists()
+
+
+def friend_ids(user_id):
+    return get_adjacency(user_id)['friends']
+
+
+def invalidate(*user_ids):
+    keys = [ADJACENCY_KEY.format(user_id) for user_id in user_ids]
+    cache.delete_many(keys)
+    # 事务提交前其他请求可能读到旧数据并回填缓存，提交后再清除一次
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,106 @@
+"""
+选择题自动批改
+
+每份作业的 quiz_data 只解析一次：规范化后的答案序列 (大写选项元组) 存入缓存，
+作业更新时由信号清除。批改时把学生答案按题号对齐成同样的序列，逐位比较计分。
+答案修改后可用 regrade() 对该作业的自动批改提交重新评分，并用 bulk_update 批量写回；
+讲师人工批改过的提交 (auto_graded=False) 保持不变。
+"""
+import json
+from django.core.cache import cache
+from .models import Assignment, Submission
+
+ANSWER_KEY_CACHE_KEY = 'answer_key:{}'
+ANSWER_KEY_TIMEOUT = 60 * 60
+PASS_GRADE = 60
+REGRADE_BATCH_SIZE = 500
+
+
+class GradingError(Exception):
+    pass
+
+
+def parse_answer_key(quiz_data):
+    quiz_list = json.loads(quiz_data)
+    return tuple(str(question.get('answer') or '').strip().upper() for question in quiz_list)
+
+
+def get_answer_key(assignment):
+    """返回规范化的答案元组；题目数据无法解析时抛出 GradingError"""
+    key = ANSWER_KEY_CACHE_KEY.format(assignment.pk)
+    answer_key = cache.get(key)
+    if answer_key is None:
+        try:
+            answer_key = parse_answer_key(assignment.quiz_data)
+        except (TypeError, ValueError, AttributeError) as exc:
+            raise GradingError(str(exc))
+        cache.set(key, answer_key, ANSWER_KEY_TIMEOUT)
+    return answer_key
+
+
+def invalidate_answer_key(assignment_id):
+    cache.delete(ANSWER_KEY_CACHE_KEY.format(assignment_id))
+
+
+def _align_answers(content, size):
+    """把学生提交的 {"0": "A", "1": "c"} 对齐成与答案等长的大写序列"""
+    answers = json.loads(content)
+    if not isinstance(answers, dict):
+        raise ValueError("答案格式错误")
+    return [str(answers.get(str(idx)) or '').strip().upper() for idx in range(size)]
+
+
+def score(answer_key, content):
+    """
+    批改一份提交，返回 (状态, 分数, 评语)
+    与原有规则一致：未设置答案的题目不得分，60 分及以上为通过
+    """
+    total = len(answer_key)
+    if total == 0:
+        return Submission.STATUS_PENDING, None, "系统错误：题目数据为空"
+    try:
+        answers = _align_answers(content, total)
+    except (TypeError, ValueError):
+        return Submission.STATUS_PENDING, None, "自动批改出错，请联系讲师人工审核。"
+    correct = sum(1 for expected, given in zip(answer_key, answers) if expected and given == expected)
+    grade = int(correct / total * 100)
+    status = Submission.STATUS_PASSED if grade >= PASS_GRADE else Submission.STATUS_REJECTED
+    return status, grade, f"系统自动批改：共 {total} 题，答对 {correct} 题。"
+
+
+def grade_submission(assignment, content):
+    """为新提交评分；非选择题或没有题目数据时返回待批改"""
+    if assignment.assignment_type != Assignment.TYPE_CHOICE or not assignment.quiz_data:
+        return Submission.STATUS_PENDING, None, ""
+    try:
+        answer_key = get_answer_key(assignment)
+    except GradingError:
+        return Submission.STATUS_PENDING, None, "自动批改出错，请联系讲师人工审核。"
+    return score(answer_key, content)
+
+
+def regrade(assignment):
+    """按当前答案重新评分该作业的自动批改提交，返回分数或状态发生变化的提交数"""
+    if assignment.assignment_type != Assignment.TYPE_CHOICE or not assignment.quiz_data:
+        return 0
+    invalidate_answer_key(assignment.pk)
+    try:
+        answer_key = get_answer_key(assignment)
+    except GradingError:
+        return 0
+
+    changed, updated = [], 0
+    queryset = Submission.objects.filter(assignment=assignment, auto_graded=True).only(
+        'id', 'content', 'status', 'grade', 'feedback'
+    )
+    for submission in queryset.iterator(chunk_size=REGRADE_BATCH_SIZE):
+        result = score(answer_key, submission.content)
+        if result != (submission.status, submission.grade, submission.feedback):
+            submission.status, submission.grade, submission.feedback = result
+            changed.append(submission)
+        if len(changed) >= REGRADE_BATCH_SIZE:
+            Submission.objects.bulk_update(changed, ['status', 'grade', 'feedback'])
+            updated += len(changed)
+            changed = []
+    Submission.objects.bulk_update(changed, ['status', 'grade', 'feedback'])
+    return updated + len(changed)
@@ -0,0 +1,300 @@
+"""
+积分排行榜
+
+榜单保存在有序集合中，每次加分时增量更新，排名查询与分页都是 O(log n)：
+  - global:              总积分 (与 UserPoints.total_points 一致)
+  - category:<分类ID>:    该分类课程相关行为获得的积分
+  - weekly:<年>-W<周>:    本周获得的积分 (两周后过期)
+
+存储由 settings.LEADERBOARD_STORE 指定：配置了 Redis 时使用 ZSET，
+否则退回进程内的有序列表 (开发/测试/单进程)。
+增量更新可能因进程重启或 Redis 丢失而偏离数据库，由 celery beat 定时对账重建；
+进程内存储看不到其他进程 (包括 celery) 的加分，也收不到 beat 的重建结果，
+读取时每隔 LEADERBOARD_REBUILD_INTERVAL 秒按数据库重建一次。
+"""
+import threading
+import time as time_module
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import PointRecord, UserPoints
+
+BOARD_GLOBAL = 'global'
+BOARD_CATEGORY = 'category'
+BOARD_WEEKLY = 'weekly'
+WEEKLY_TTL = 60 * 60 * 24 * 14
+
+
+def global_board():
+    return BOARD_GLOBAL
+
+
+def category_board(category_id):
+    return f'{BOARD_CATEGORY}:{category_id}'
+
+
+def week_start(moment=None):
+    today = timezone.localdate(moment)
+    return today - timedelta(days=today.weekday())
+
+
+def weekly_board(moment=None):
+    year, week, _ = week_start(moment).isocalendar()
+    return f'{BOARD_WEEKLY}:{year}-W{week:02d}'
+
+
+class _SortedBoard:
+    """分数字典 + 按 (-分数, 用户ID) 排序的列表，二分查找定位"""
+
+    def __init__(self):
+        self.scores = {}
+        self.entries = []
+
+    def incr(self, member, delta):
+        old = self.scores.get(member)
+        if old is not None:
+            del self.entries[bisect_left(self.entries, (-old, member))]
+        score = (old or 0) + delta
+        self.scores[member] = score
+        insort(self.entries, (-score, member))
+        return score
+
+
+class InMemoryLeaderboardStore:
+    # 榜单只在本进程可见，需要定期按数据库重建
+    shared = False
+
+    def __init__(self, **kwargs):
+        self._lock = threading.Lock()
+        self._boards = defaultdict(_SortedBoard)
+        self._expires = {}
+
+    def _set_ttl(self, board, ttl):
+        # 调用方已持有锁；与 Redis EXPIRE 一致，每次写入都刷新过期时间
+        if ttl:
+            self._expires[board] = time_module.monotonic() + ttl
+
+    def _get(self, board):
+        """调用方已持有锁：返回未过期的榜单，过期的榜单随即删除"""
+        expires_at = self._expires.get(board)
+        if expires_at is not None and expires_at <= time_module.monotonic():
+            self._boards.pop(board, None)
+            del self._expires[board]
+        return self._boards.get(board)
+
+    def incr(self, board, member, delta, ttl=None):
+        with self._lock:
+            self._get(board)
+            self._boards[board].incr(member, delta)
+            self._set_ttl(board, ttl)
+
+    def replace(self, board, scores, ttl=None):
+        fresh = _SortedBoard()
+        fresh.scores = dict(scores)
+        fresh.entries = sorted((-score, member) for member, score in scores.items())
+        with self._lock:
+            if scores:
+                self._boards[board] = fresh
+                self._set_ttl(board, ttl)
+            else:
+                self._boards.pop(board, None)
+                self._expires.pop(board, None)
+
+    def rank(self, board, member):
+        """返回 (名次(从1开始), 分数)，不在榜上返回 None"""
+        with self._lock:
+            sorted_board = self._get(board)
+            if sorted_board is None or member not in sorted_board.scores:
+                return None
+            score = sorted_board.scores[member]
+            return bisect_left(sorted_board.entries, (-score, member)) + 1, score
+
+    def top(self, board, offset=0, limit=20):
+        with self._lock:
+            sorted_board = self._get(board)
+            entries = sorted_board.entries[offset:offset + limit] if sorted_board else []
+        return [(member, -neg_score) for neg_score, member in entries]
+
+    def count(self, board):
+        with self._lock:
+            sorted_board = self._get(board)
+            return len(sorted_board.scores) if sorted_board else 0
+
+    def boards(self, prefix):
+        with self._lock:
+            return [board for board in list(self._boards) if board.startswith(prefix) and self._get(board)]
+
+
+class RedisLeaderboardStore:
+    shared = True
+
+    def __init__(self, location='redis://127.0.0.1:6379/3', key_prefix='leaderboard:', **kwargs):
+        import redis
+        self._client = redis.Redis.from_url(location)
+        self.key_prefix = key_prefix
+
+    def _key(self, board):
+        return f'{self.key_prefix}{board}'
+
+    def incr(self, board, member, delta, ttl=None):
+        pipe = self._client.pipeline()
+        pipe.zincrby(self._key(board), delta, member)
+        if ttl:
+            pipe.expire(self._key(board), ttl)
+        pipe.execute()
+
+    def replace(self, board, scores, ttl=None):
+        # 先写入临时键再 RENAME，重建期间读到的始终是完整榜单
+        key, tmp_key = self._key(board), self._key(board) + ':rebuild'
+        pipe = self._client.pipeline()
+        pipe.delete(tmp_key)
+        items = list(scores.items())
+        for i in range(0, len(items), 1000):
+            pipe.zadd(tmp_key, dict(items[i:i + 1000]))
+        if items:
+            pipe.rename(tmp_key, key)
+            if ttl:
+                pipe.expire(key, ttl)
+        else:
+            pipe.delete(key)
+        pipe.execute()
+
+    def rank(self, board, member):
+        pipe = self._client.pipeline()
+        pipe.zrevrank(self._key(board), member)
+        pipe.zscore(self._key(board), member)
+        rank, score = pipe.execute()
+        if rank is None:
+            return None
+        return rank + 1, int(score)
+
+    def top(self, board, offset=0, limit=20):
+        rows = self._client.zrevrange(self._key(board), offset, offset + limit - 1, withscores=True)
+        return [(int(member), int(score)) for member, score in rows]
+
+    def count(self, board):
+        return self._client.zcard(self._key(board))
+
+    def boards(self, prefix):
+        start = len(self.key_prefix)
+        return [
+            key.decode()[start:] for key in self._client.scan_iter(match=self._key(prefix) + '*')
+            if not key.endswith(b':rebuild')
+        ]
+
+
+_store = None
+_store_lock = threading.Lock()
+_built_at = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = dict(getattr(settings, 'LEADERBOARD_STORE', {}))
+                backend = import_string(config.pop('BACKEND', 'core.leaderboard.InMemoryLeaderboardStore'))
+                _store = backend(**{key.lower(): value for key, value in config.items()})
+    return _store
+
+
+def reset_store():
+    global _store, _built_at
+    _store = None
+    _built_at = None
+
+
+def _rebuild_interval():
+    return getattr(settings, 'LEADERBOARD_REBUILD_INTERVAL', 60)
+
+
+def _ensure_built():
+    """
+    首次读取时若榜单为空 (进程刚启动或 Redis 被清空) 先按数据库重建；
+    进程内存储另外每隔 LEADERBOARD_REBUILD_INTERVAL 秒重建一次，纠正其他进程加分造成的偏差
+    """
+    global _built_at
+    store = get_store()
+    now = time_module.monotonic()
+    if _built_at is None:
+        if not store.count(global_board()):
+            reconcile()
+        _built_at = now
+    elif not getattr(store, 'shared', False) and now - _built_at >= _rebuild_interval():
+        with _store_lock:
+            if now - _built_at >= _rebuild_interval():
+                reconcile()
+                _built_at = now
+
+
+def record_awards(awards):
+    """
+    事务提交后把加分同步到各榜单
+    :param awards: [(user_id, points, category_id), ...]
+    """
+    awards = [award for award in awards if award[1]]
+    if not awards:
+        return
+
+    def apply():
+        store = get_store()
+        weekly = weekly_board()
+        for user_id, points, category_id in awards:
+            store.incr(global_board(), user_id, points)
+            store.incr(weekly, user_id, points, ttl=WEEKLY_TTL)
+            if category_id:
+                store.incr(category_board(category_id), user_id, points)
+
+    transaction.on_commit(apply)
+
+
+def get_page(board, offset=0, limit=20):
+    """返回 [(用户ID, 分数), ...]"""
+    _ensure_built()
+    return get_store().top(board, offset, limit)
+
+
+def get_rank(board, user_id):
+    """返回 (名次, 分数)，不在榜上返回 None"""
+    _ensure_built()
+    return get_store().rank(board, user_id)
+
+
+def get_count(board):
+    _ensure_built()
+    return get_store().count(board)
+
+
+def reconcile():
+    """按数据库重建总榜、本周榜与各分类榜，返回重建的榜单数"""
+    store = get_store()
+    store.replace(global_board(), dict(
+        UserPoints.objects.filter(total_points__gt=0).values_list('user_id', 'total_points')
+    ))
+
+    start = timezone.make_aware(datetime.combine(week_start(), time.min))
+    weekly = {}
+    for user_id, total in PointRecord.objects.filter(
+        created_at__gte=start
+    ).order_by().values('user_id').annotate(total=Sum('points')).values_list('user_id', 'total'):
+        weekly[user_id] = total
+    store.replace(weekly_board(), weekly, ttl=WEEKLY_TTL)
+
+    by_category = defaultdict(dict)
+    rows = PointRecord.objects.filter(category__isnull=False).order_by().values(
+        'category_id', 'user_id'
+    ).annotate(total=Sum('points')).values_list('category_id', 'user_id', 'total')
+    for category_id, user_id, total in rows:
+        by_category[category_id][user_id] = total
+    stale = set(store.boards(f'{BOARD_CATEGORY}:')) - {category_board(c) for c in by_category}
+    for category_id, scores in by_category.items():
+        store.replace(category_board(category_id), scores)
+    for board in stale:
+        store.replace(board, {})
+    return 2 + len(by_category)
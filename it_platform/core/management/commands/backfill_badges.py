@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.badges import backfill
+
+
+class Command(BaseCommand):
+    help = "为所有用户补发已满足条件的勋章 (新增或调整勋章后执行)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每批处理的用户数')
+
+    def handle(self, *args, **options):
+        count = backfill(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"已补发 {count} 枚勋章"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.view_counter import flush_course_views
+
+
+class Command(BaseCommand):
+    help = "将 Redis 缓冲中累积的课程观看次数批量写回数据库 (未运行 celery beat 时可用 cron 调用)"
+
+    def handle(self, *args, **options):
+        flushed = flush_course_views()
+        self.stdout.write(self.style.SUCCESS(f"已合并 {flushed} 次观看"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "重建课程全文检索索引"
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"已索引 {count} 门课程"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.user_search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "重建用户检索词索引 (用户名/昵称前缀)"
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"已索引 {count} 个用户"))
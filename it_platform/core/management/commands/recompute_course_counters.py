@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from core.models import Category, Course
+
+
+class Command(BaseCommand):
+    help = "根据点赞/报名/收藏关联表重新计算课程 (及分类点赞总数) 的冗余计数字段，用于修复计数漂移"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='course_ids',
+                            help="只重算指定课程ID (可重复传入)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="每批重算的课程数量")
+
+    def handle(self, *args, **options):
+        course_ids = options['course_ids']
+        batch_size = options['batch_size']
+
+        if course_ids:
+            updated = Course.recompute_counters(course_ids)
+        else:
+            updated = 0
+            ids = list(Course.objects.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(ids), batch_size):
+                updated += Course.recompute_counters(ids[start:start + batch_size])
+        Category.recompute_total_likes()
+
+        self.stdout.write(self.style.SUCCESS(f"已重算 {updated} 门课程的计数"))
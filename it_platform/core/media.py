@@ -0,0 +1,146 @@
+"""
+受保护媒体文件的分段 (HTTP Range) 传输
+
+支持 Range / If-Range / ETag / If-None-Match；整文件响应使用 FileResponse，
+可由 WSGI 服务器的 file_wrapper (sendfile) 零拷贝发送。部署在 nginx / apache
+之后时，可通过 MEDIA_ACCEL_REDIRECT 把实际传输交给反向代理完成。
+
+<video> 标签无法携带请求头，播放地址使用短期有效的签名 (只对某个课时有效)，
+而不是把账号 Token 放进 URL，避免其出现在访问日志与 Referer 中。
+"""
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+STREAM_CHUNK_SIZE = 64 * 1024
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+LESSON_SIGNING_SALT = 'core.media.lesson'
+# mimetypes 对 HLS 分片的猜测不可靠 (.ts 会被识别为 Qt 翻译文件)
+_CONTENT_TYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.ts': 'video/mp2t'}
+
+
+def _signed_url_ttl():
+    return getattr(settings, 'LESSON_MEDIA_URL_TTL', 60 * 60 * 2)
+
+
+def sign_lesson(lesson_id, user_id):
+    """生成只对该课时有效的签名 (记录签发用户便于审计)"""
+    return signing.TimestampSigner(salt=LESSON_SIGNING_SALT).sign(f'{lesson_id}.{user_id}')
+
+
+def check_lesson_signature(signature, lesson_id):
+    """签名有效、未过期且属于该课时时返回 True"""
+    if not signature:
+        return False
+    try:
+        value = signing.TimestampSigner(salt=LESSON_SIGNING_SALT).unsign(signature, max_age=_signed_url_ttl())
+    except signing.BadSignature:
+        return False
+    return value.split('.')[0] == str(lesson_id)
+
+
+def _etag(stat):
+    return f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def parse_range(header, size):
+    """
+    解析单段 Range 头，返回 (start, end) 闭区间；
+    无法识别 (含多段范围) 时返回 None 表示按整文件响应，越界时抛出 ValueError
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # bytes=-N 表示最后 N 个字节
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        raise ValueError('Range not satisfiable')
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith('W/'):
+        return value == etag
+    modified = parse_http_date_safe(value)
+    return modified is not None and int(mtime) <= modified
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _accel_response(name, path, content_type, prefix):
+    mode = getattr(settings, 'MEDIA_ACCEL_REDIRECT', '')
+    response = HttpResponse(content_type=content_type)
+    if mode == 'nginx':
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + name.lstrip('/')
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_file(request, name, root=None, accel_prefix=None):
+    """
+    以支持断点续传/拖动的方式返回 root (默认 MEDIA_ROOT) 下的文件
+    :param name: 相对于 root 的文件名 (FileField.name)，调用方负责确认其不越出 root
+    :param accel_prefix: nginx X-Accel-Redirect 的 internal location，默认 MEDIA_ACCEL_PREFIX
+    """
+    path = os.path.join(root or settings.MEDIA_ROOT, name)
+    stat = os.stat(path)
+    content_type = (_CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+                    or mimetypes.guess_type(path)[0] or 'application/octet-stream')
+
+    if getattr(settings, 'MEDIA_ACCEL_REDIRECT', ''):
+        if accel_prefix is None:
+            accel_prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        return _accel_response(name, path, content_type, accel_prefix)
+
+    etag = _etag(stat)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    byte_range = None
+    if _if_range_matches(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(_read_range(path, start, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    """
+    根据现有的点赞/报名/收藏数据回填冗余计数
+    """
+    Course = apps.get_model('core', 'Course')
+    CustomUser = apps.get_model('core', 'CustomUser')
+    Enrollment = apps.get_model('core', 'Enrollment')
+
+    def count_of(model):
+        return Coalesce(Subquery(
+            model.objects.filter(course_id=OuterRef('pk')).order_by().values('course_id')
+            .annotate(total=Count('*')).values('total')
+        ), 0)
+
+    Course.objects.update(
+        like_count=count_of(Course.likes.through),
+        enrollment_count=count_of(Enrollment),
+        favorite_count=count_of(CustomUser.favorited_courses.through),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_add_banner_announcement_progress_points'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='enrollment_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='报名人数'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='favorite_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='收藏数'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='点赞数'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['-like_count'], name='core_course_like_co_3c393a_idx'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# 课程全文检索索引 (仅 SQLite 使用 FTS5 虚拟表)
+
+import re
+
+from django.db import migrations
+
+# 迁移中固定当时的分词规则，core/search.py 之后的修改不影响本迁移
+SEARCH_TABLE = 'core_course_search'
+_CJK = r'\u3400-\u9fff\uf900-\ufaff'
+_TOKEN_RE = re.compile(rf'[{_CJK}]+|[0-9a-z]+')
+_CJK_RE = re.compile(rf'[{_CJK}]+')
+
+
+def tokenize(text):
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').lower()):
+        if _CJK_RE.fullmatch(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Course = apps.get_model('core', 'Course')
+    Lesson = apps.get_model('core', 'Lesson')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            f"title, description, lessons, instructor, tokenize='unicode61 remove_diacritics 2')"
+        )
+        for course in Course.objects.select_related('instructor').iterator():
+            lessons = Lesson.objects.filter(module__course_id=course.pk).values_list('title', flat=True)
+            instructor = course.instructor
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, lessons, instructor) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [
+                    course.pk,
+                    ' '.join(tokenize(course.title)),
+                    ' '.join(tokenize(course.description)),
+                    ' '.join(tokenize(' '.join(lessons))),
+                    ' '.join(tokenize(f'{instructor.username} {instructor.nickname}')) if instructor else '',
+                ]
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_course_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='transcode_progress',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='转码进度(%)'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='transcode_status',
+            field=models.CharField(choices=[('none', '无视频'), ('pending', '排队中'), ('processing', '转码中'), ('ready', '已完成'), ('failed', '失败')], default='none', max_length=20, verbose_name='转码状态'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='video_duration',
+            field=models.FloatField(blank=True, null=True, verbose_name='视频时长(秒)'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='video_poster',
+            field=models.CharField(blank=True, max_length=255, verbose_name='视频封面URL'),
+        ),
+    ]
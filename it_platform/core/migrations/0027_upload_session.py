@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:49
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_lesson_hls_transcoding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255, verbose_name='课时标题')),
+                ('order', models.PositiveIntegerField(default=0, verbose_name='课时顺序')),
+                ('filename', models.CharField(max_length=255, verbose_name='原文件名')),
+                ('total_size', models.BigIntegerField(verbose_name='文件总大小(字节)')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='已接收字节数')),
+                ('checksum', models.CharField(blank=True, max_length=64, verbose_name='文件SHA-256')),
+                ('status', models.CharField(choices=[('uploading', '上传中'), ('completed', '已完成')], default='uploading', max_length=20, verbose_name='状态')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('lesson', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_session', to='core.lesson', verbose_name='生成的课时')),
+                ('module', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='core.module', verbose_name='目标章节')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL, verbose_name='上传者')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
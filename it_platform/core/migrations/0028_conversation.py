@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    """
+    根据已有消息生成会话摘要
+    """
+    Message = apps.get_model('core', 'Message')
+    Conversation = apps.get_model('core', 'Conversation')
+
+    summaries = {}
+    for message in Message.objects.order_by('created_at', 'id').iterator():
+        preview = message.content[:100] if message.content else ('[附件]' if message.attachment else '')
+        # 发给自己的消息只对应一个会话，且不计未读 (与 Conversation.record_message 一致)
+        for owner_id, peer_id in {(message.sender_id, message.receiver_id), (message.receiver_id, message.sender_id)}:
+            summary = summaries.setdefault((owner_id, peer_id), {'unread_count': 0})
+            summary.update(last_message_id=message.id, last_message_preview=preview,
+                           last_message_at=message.created_at)
+        if not message.is_read and message.sender_id != message.receiver_id:
+            summaries[(message.receiver_id, message.sender_id)]['unread_count'] += 1
+
+    Conversation.objects.bulk_create(
+        [Conversation(owner_id=owner_id, peer_id=peer_id, **summary)
+         for (owner_id, peer_id), summary in summaries.items()],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_preview', models.CharField(blank=True, max_length=100, verbose_name='最后消息摘要')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True, verbose_name='最后消息时间')),
+                ('unread_count', models.PositiveIntegerField(default=0, verbose_name='未读数')),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message', verbose_name='最后一条消息')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL, verbose_name='所属用户')),
+                ('peer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='联系人')),
+            ],
+            options={
+                'ordering': ['-last_message_at'],
+                'indexes': [models.Index(fields=['owner', '-last_message_at', '-id'], name='core_conver_owner_i_e9becb_idx')],
+                'unique_together': {('owner', 'peer')},
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
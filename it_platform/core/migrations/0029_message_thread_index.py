@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_conversation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', 'created_at'], name='core_messag_sender__cfe019_idx'),
+        ),
+    ]
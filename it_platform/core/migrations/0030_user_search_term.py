@@ -0,0 +1,86 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:57
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+# 迁移中固定当时的检索词规则，core/user_search.py 之后的修改不影响本迁移
+MAX_TERM_LENGTH = 32
+WEIGHT_USERNAME, WEIGHT_NICKNAME, WEIGHT_INFIX, WEIGHT_PINYIN = 0, 1, 2, 3
+_CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize(text):
+    return _SPACE_RE.sub('', (text or '').lower())[:MAX_TERM_LENGTH]
+
+
+def user_terms(username, nickname):
+    terms = {}
+
+    def add(term, weight):
+        term = term[:MAX_TERM_LENGTH]
+        if term and weight < terms.get(term, weight + 1):
+            terms[term] = weight
+
+    username, nickname = normalize(username), normalize(nickname)
+    add(username, WEIGHT_USERNAME)
+    add(nickname, WEIGHT_NICKNAME)
+    for text in (username, nickname):
+        for i in range(1, len(text)):
+            add(text[i:], WEIGHT_INFIX)
+    if lazy_pinyin is not None and _CJK_RE.search(nickname):
+        add(''.join(lazy_pinyin(nickname)), WEIGHT_PINYIN)
+        add(''.join(lazy_pinyin(nickname, style=Style.FIRST_LETTER)), WEIGHT_PINYIN)
+    return terms
+
+
+def populate_search_terms(apps, schema_editor):
+    """
+    为已有用户生成检索词
+    """
+    CustomUser = apps.get_model('core', 'CustomUser')
+    UserSearchTerm = apps.get_model('core', 'UserSearchTerm')
+
+    batch = []
+    for user_id, username, nickname in CustomUser.objects.values_list('id', 'username', 'nickname').iterator():
+        batch.extend(
+            UserSearchTerm(user_id=user_id, term=term, weight=weight)
+            for term, weight in user_terms(username, nickname).items()
+        )
+        if len(batch) >= 1000:
+            UserSearchTerm.objects.bulk_create(batch)
+            batch = []
+    UserSearchTerm.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_message_thread_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=32, verbose_name='检索词')),
+                ('weight', models.PositiveSmallIntegerField(default=2, verbose_name='匹配优先级')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '用户检索词',
+                'verbose_name_plural': '用户检索词',
+                'indexes': [models.Index(fields=['weight', 'term', 'user'], name='core_userse_weight_23a578_idx')],
+            },
+        ),
+        migrations.RunPython(populate_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_user_search_term'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pointrecord',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='幂等键'),
+        ),
+        migrations.AddConstraint(
+            model_name='pointrecord',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotency_key'), name='unique_point_record_idempotency_key'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_point_record_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pointrecord',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='point_records', to='core.category', verbose_name='所属分类'),
+        ),
+        migrations.AddIndex(
+            model_name='pointrecord',
+            index=models.Index(fields=['created_at'], name='core_pointr_created_887bef_idx'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def initialize_snapshots(apps, schema_editor):
+    """
+    以当前的累计浏览/点赞/完成数作为基线，历史累计值不计入首个汇总小时；
+    报名/评论/提交有时间戳，由首次汇总任务按原始时间回填
+    """
+    Course = apps.get_model('core', 'Course')
+    LessonProgress = apps.get_model('core', 'LessonProgress')
+    CourseStatSnapshot = apps.get_model('core', 'CourseStatSnapshot')
+
+    completions = dict(
+        LessonProgress.objects.filter(is_completed=True).order_by()
+        .values('lesson__module__course_id').annotate(total=Count('id'))
+        .values_list('lesson__module__course_id', 'total')
+    )
+    CourseStatSnapshot.objects.bulk_create([
+        CourseStatSnapshot(
+            course_id=course_id, view_count=view_count, like_count=like_count,
+            completion_count=completions.get(course_id, 0)
+        )
+        for course_id, view_count, like_count in Course.objects.values_list('id', 'view_count', 'like_count')
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_point_record_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStatSnapshot',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat_snapshot', serialize=False, to='core.course', verbose_name='课程')),
+                ('view_count', models.PositiveIntegerField(default=0)),
+                ('like_count', models.PositiveIntegerField(default=0)),
+                ('completion_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('position', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CourseDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('views', models.IntegerField(default=0, verbose_name='浏览量')),
+                ('enrollments', models.IntegerField(default=0, verbose_name='新增报名')),
+                ('likes', models.IntegerField(default=0, verbose_name='新增点赞(净值)')),
+                ('comments', models.IntegerField(default=0, verbose_name='新增评论')),
+                ('submissions', models.IntegerField(default=0, verbose_name='作业提交')),
+                ('completions', models.IntegerField(default=0, verbose_name='课时完成')),
+                ('date', models.DateField(verbose_name='统计日期')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='core.course', verbose_name='课程')),
+            ],
+            options={
+                'verbose_name': '课程每日统计',
+                'verbose_name_plural': '课程每日统计',
+                'unique_together': {('course', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CourseHourlyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('views', models.IntegerField(default=0, verbose_name='浏览量')),
+                ('enrollments', models.IntegerField(default=0, verbose_name='新增报名')),
+                ('likes', models.IntegerField(default=0, verbose_name='新增点赞(净值)')),
+                ('comments', models.IntegerField(default=0, verbose_name='新增评论')),
+                ('submissions', models.IntegerField(default=0, verbose_name='作业提交')),
+                ('completions', models.IntegerField(default=0, verbose_name='课时完成')),
+                ('hour', models.DateTimeField(verbose_name='统计小时')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hourly_stats', to='core.course', verbose_name='课程')),
+            ],
+            options={
+                'verbose_name': '课程小时统计',
+                'verbose_name_plural': '课程小时统计',
+                'unique_together': {('course', 'hour')},
+            },
+        ),
+        migrations.RunPython(initialize_snapshots, migrations.RunPython.noop),
+    ]
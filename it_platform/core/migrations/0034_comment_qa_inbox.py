@@ -0,0 +1,57 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef, Subquery
+
+
+def populate_comment_course(apps, schema_editor):
+    """
+    为已有评论写入所属课程与讲师，并标记讲师尚未回复的学员提问
+    """
+    Comment = apps.get_model('core', 'Comment')
+    Lesson = apps.get_model('core', 'Lesson')
+    lessons = Lesson.objects.filter(pk=OuterRef('lesson_id'))
+    Comment.objects.update(
+        course_id=Subquery(lessons.values('module__course_id')[:1]),
+        instructor_id=Subquery(lessons.values('module__course__instructor_id')[:1]),
+    )
+    instructor_replied = Comment.objects.filter(parent_id=OuterRef('pk'), user_id=OuterRef('instructor_id'))
+    Comment.objects.filter(parent__isnull=True).exclude(user_id=F('instructor_id')).exclude(
+        instructor_id__isnull=True
+    ).filter(~Exists(instructor_replied)).update(is_unanswered=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_course_stat_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='course',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='core.course', verbose_name='所属课程'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='instructor',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='course_comments', to=settings.AUTH_USER_MODEL, verbose_name='课程讲师'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='is_unanswered',
+            field=models.BooleanField(default=False, verbose_name='待讲师回复'),
+        ),
+        migrations.RunPython(populate_comment_course, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['instructor', 'is_unanswered', '-created_at', '-id'], name='core_commen_instruc_88b5ba_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['course', 'created_at'], name='core_commen_course__fbdc1c_idx'),
+        ),
+    ]
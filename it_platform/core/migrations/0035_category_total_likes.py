@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:21
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_total_likes(apps, schema_editor):
+    """
+    按课程点赞计数汇总已有分类的点赞总数
+    """
+    Category = apps.get_model('core', 'Category')
+    Course = apps.get_model('core', 'Course')
+    Category.objects.update(total_likes=Coalesce(Subquery(
+        Course.objects.filter(category_id=OuterRef('pk')).order_by().values('category_id')
+        .annotate(total=Sum('like_count')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_comment_qa_inbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='total_likes',
+            field=models.PositiveIntegerField(default=0, verbose_name='点赞总数'),
+        ),
+        migrations.RunPython(populate_total_likes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# 分词规则扩展到带重音的字母、假名与谚文后，按新规则重建课程全文索引 (仅 SQLite)
+
+import re
+
+from django.db import migrations
+
+# 迁移中固定当时的分词规则，core/search.py 之后的修改不影响本迁移
+SEARCH_TABLE = 'core_course_search'
+_CJK = r'\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_RE = re.compile(rf'[{_CJK}]+|[^\W{_CJK}]+')
+_CJK_RE = re.compile(rf'[{_CJK}]+')
+
+
+def tokenize(text):
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').lower()):
+        if _CJK_RE.fullmatch(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def rebuild_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Course = apps.get_model('core', 'Course')
+    Lesson = apps.get_model('core', 'Lesson')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        for course in Course.objects.select_related('instructor').iterator():
+            lessons = Lesson.objects.filter(module__course_id=course.pk).values_list('title', flat=True)
+            instructor = course.instructor
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, lessons, instructor) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [
+                    course.pk,
+                    ' '.join(tokenize(course.title)),
+                    ' '.join(tokenize(course.description)),
+                    ' '.join(tokenize(' '.join(lessons))),
+                    ' '.join(tokenize(f'{instructor.username} {instructor.nickname}')) if instructor else '',
+                ]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_category_total_likes'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_rebuild_course_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='write_lease_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='分片写入占用截止时间'),
+        ),
+    ]
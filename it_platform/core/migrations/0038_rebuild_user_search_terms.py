@@ -0,0 +1,69 @@
+# 中间片段检索词截断为前 8 个字符后，按新规则重建用户检索词 (检索词总量由平方级降为线性)
+
+import re
+
+from django.db import migrations
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+# 迁移中固定当时的检索词规则，core/user_search.py 之后的修改不影响本迁移
+MAX_TERM_LENGTH = 32
+MAX_INFIX_LENGTH = 8
+WEIGHT_USERNAME, WEIGHT_NICKNAME, WEIGHT_INFIX, WEIGHT_PINYIN = 0, 1, 2, 3
+_CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize(text):
+    return _SPACE_RE.sub('', (text or '').lower())[:MAX_TERM_LENGTH]
+
+
+def user_terms(username, nickname):
+    terms = {}
+
+    def add(term, weight):
+        term = term[:MAX_TERM_LENGTH]
+        if term and weight < terms.get(term, weight + 1):
+            terms[term] = weight
+
+    username, nickname = normalize(username), normalize(nickname)
+    add(username, WEIGHT_USERNAME)
+    add(nickname, WEIGHT_NICKNAME)
+    for text in (username, nickname):
+        for i in range(1, len(text)):
+            add(text[i:i + MAX_INFIX_LENGTH], WEIGHT_INFIX)
+    if lazy_pinyin is not None and _CJK_RE.search(nickname):
+        add(''.join(lazy_pinyin(nickname)), WEIGHT_PINYIN)
+        add(''.join(lazy_pinyin(nickname, style=Style.FIRST_LETTER)), WEIGHT_PINYIN)
+    return terms
+
+
+def rebuild_search_terms(apps, schema_editor):
+    CustomUser = apps.get_model('core', 'CustomUser')
+    UserSearchTerm = apps.get_model('core', 'UserSearchTerm')
+
+    UserSearchTerm.objects.all().delete()
+    batch = []
+    for user_id, username, nickname in CustomUser.objects.values_list('id', 'username', 'nickname').iterator():
+        batch.extend(
+            UserSearchTerm(user_id=user_id, term=term, weight=weight)
+            for term, weight in user_terms(username, nickname).items()
+        )
+        if len(batch) >= 1000:
+            UserSearchTerm.objects.bulk_create(batch)
+            batch = []
+    UserSearchTerm.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_uploadsession_write_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_terms, migrations.RunPython.noop),
+    ]
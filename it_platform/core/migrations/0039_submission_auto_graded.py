@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:55
+
+from django.db import migrations, models
+from django.db.models import Q
+
+# 迁移时自动批改写入的评语 (core/grading.py 之后的修改不影响本迁移)
+AUTO_FEEDBACK_PREFIX = '系统自动批改：'
+AUTO_ERROR_FEEDBACKS = ['自动批改出错，请联系讲师人工审核。', '系统错误：题目数据为空']
+
+
+def mark_auto_graded(apps, schema_editor):
+    """
+    已有提交中评语仍为自动批改结果的选择题提交视为自动批改
+    """
+    Submission = apps.get_model('core', 'Submission')
+    Submission.objects.filter(
+        Q(feedback__startswith=AUTO_FEEDBACK_PREFIX) | Q(feedback__in=AUTO_ERROR_FEEDBACKS),
+        assignment__assignment_type='choice',
+    ).update(auto_graded=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_rebuild_user_search_terms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='auto_graded',
+            field=models.BooleanField(default=False, verbose_name='自动批改'),
+        ),
+        migrations.RunPython(mark_auto_graded, migrations.RunPython.noop),
+    ]
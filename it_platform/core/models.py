@@ -1,5 +1,8 @@
 import json
-from django.db import models
+import uuid
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from django.utils.text import slugify
@@ -33,10 +36,41 @@ class CustomUser(AbstractUser):
         verbose_name="收藏的课程"
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['-date_joined', '-id']),  # 用户管理列表游标分页
+        ]
+
     def __str__(self):
         return self.nickname if self.nickname else self.username
 
 
+# --- 1.1 用户检索词 (用户名/昵称的前缀索引，随用户保存维护) ---
+class UserSearchTerm(models.Model):
+    WEIGHT_USERNAME = 0
+    WEIGHT_NICKNAME = 1
+    WEIGHT_INFIX = 2
+    WEIGHT_PINYIN = 3
+
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE,
+        related_name='search_terms', verbose_name="用户"
+    )
+    term = models.CharField(verbose_name="检索词", max_length=32)
+    weight = models.PositiveSmallIntegerField(verbose_name="匹配优先级", default=WEIGHT_INFIX)
+
+    class Meta:
+        verbose_name = "用户检索词"
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 按优先级逐层做 term 范围扫描，user_id 包含在索引中无需回表
+            models.Index(fields=['weight', 'term', 'user']),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
 # --- 2. 课程分类 ---
 class Category(models.Model):
     name = models.CharField(verbose_name="分类名称", max_length=100, unique=True)
@@ -45,6 +79,8 @@ class Category(models.Model):
         help_text="用于URL的短标签"
     )
     order = models.IntegerField(verbose_name="热门权重", default=0, help_text="数值越大，排序越靠前")
+    # 冗余计数：分类下所有课程的点赞数之和，由点赞接口原子增减，课程更换分类时重算
+    total_likes = models.PositiveIntegerField(verbose_name="点赞总数", default=0)
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -58,6 +94,20 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def recompute_total_likes(cls, category_ids=None):
+        """
+        按课程的点赞计数重新汇总分类点赞总数，返回更新的分类数
+        :param category_ids: 只重算指定分类，为 None 时重算全部
+        """
+        queryset = cls.objects.all()
+        if category_ids is not None:
+            queryset = queryset.filter(pk__in=category_ids)
+        return queryset.update(total_likes=Coalesce(Subquery(
+            Course.objects.filter(category_id=OuterRef('pk')).order_by().values('category_id')
+            .annotate(total=Sum('like_count')).values('total')
+        ), 0))
+
 
 # --- 3. 课程模型 ---
 class Course(models.Model):
@@ -99,6 +149,11 @@ class Course(models.Model):
         db_index=True
     )
 
+    # 冗余计数字段：由点赞/收藏/报名的写入路径原子维护，列表与排行直接读取
+    like_count = models.PositiveIntegerField(verbose_name="点赞数", default=0)
+    enrollment_count = models.PositiveIntegerField(verbose_name="报名人数", default=0)
+    favorite_count = models.PositiveIntegerField(verbose_name="收藏数", default=0)
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -106,11 +161,33 @@ class Course(models.Model):
             models.Index(fields=['category', '-created_at']),
             models.Index(fields=['instructor', '-created_at']),
             models.Index(fields=['-view_count']),
+            models.Index(fields=['-like_count']),
         ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def recompute_counters(cls, course_ids=None):
+        """
+        根据关联表重新计算冗余计数（修复漂移），返回更新的课程数
+        :param course_ids: 只重算指定课程，为 None 时重算全部
+        """
+        def count_of(model):
+            return Coalesce(Subquery(
+                model.objects.filter(course_id=OuterRef('pk')).order_by().values('course_id')
+                .annotate(total=Count('*')).values('total')
+            ), 0)
+
+        queryset = cls.objects.all()
+        if course_ids is not None:
+            queryset = queryset.filter(pk__in=course_ids)
+        return queryset.update(
+            like_count=count_of(cls.likes.through),
+            enrollment_count=count_of(Enrollment),
+            favorite_count=count_of(CustomUser.favorited_courses.through),
+        )
+
 
 # --- 4. 章节 ---
 class Module(models.Model):
@@ -138,6 +215,19 @@ class Lesson(models.Model):
         (LESSON_TEXT, '文本'),
     ]
 
+    TRANSCODE_NONE = 'none'
+    TRANSCODE_PENDING = 'pending'
+    TRANSCODE_PROCESSING = 'processing'
+    TRANSCODE_READY = 'ready'
+    TRANSCODE_FAILED = 'failed'
+    TRANSCODE_STATUS_CHOICES = [
+        (TRANSCODE_NONE, '无视频'),
+        (TRANSCODE_PENDING, '排队中'),
+        (TRANSCODE_PROCESSING, '转码中'),
+        (TRANSCODE_READY, '已完成'),
+        (TRANSCODE_FAILED, '失败'),
+    ]
+
     module = models.ForeignKey(
         Module, on_delete=models.CASCADE,
         related_name='lessons', verbose_name="所属章节", db_index=True
@@ -153,6 +243,13 @@ class Lesson(models.Model):
         null=True, blank=True
     )
     video_m3u8_url = models.URLField(verbose_name="HLS视频URL", null=True, blank=True)
+    transcode_status = models.CharField(
+        verbose_name="转码状态", max_length=20,
+        choices=TRANSCODE_STATUS_CHOICES, default=TRANSCODE_NONE
+    )
+    transcode_progress = models.PositiveSmallIntegerField(verbose_name="转码进度(%)", default=0)
+    video_duration = models.FloatField(verbose_name="视频时长(秒)", null=True, blank=True)
+    video_poster = models.CharField(verbose_name="视频封面URL", max_length=255, blank=True)
     content = models.TextField(verbose_name="文本内容", blank=True)
     order = models.PositiveIntegerField(verbose_name="课时顺序", default=0, db_index=True)
 
@@ -167,6 +264,55 @@ class Lesson(models.Model):
         return self.title
 
 
+# --- 5.1 视频分片上传会话 (可断点续传) ---
+class UploadSession(models.Model):
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, '上传中'),
+        (STATUS_COMPLETED, '已完成'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='upload_sessions', verbose_name="上传者"
+    )
+    module = models.ForeignKey(
+        Module, on_delete=models.CASCADE,
+        related_name='upload_sessions', verbose_name="目标章节"
+    )
+    title = models.CharField(verbose_name="课时标题", max_length=255)
+    order = models.PositiveIntegerField(verbose_name="课时顺序", default=0)
+    filename = models.CharField(verbose_name="原文件名", max_length=255)
+    total_size = models.BigIntegerField(verbose_name="文件总大小(字节)")
+    offset = models.BigIntegerField(verbose_name="已接收字节数", default=0)
+    checksum = models.CharField(verbose_name="文件SHA-256", max_length=64, blank=True)
+    status = models.CharField(
+        verbose_name="状态", max_length=20,
+        choices=STATUS_CHOICES, default=STATUS_UPLOADING
+    )
+    # 正在写入分片的请求占用会话直到该时间，防止并发请求写入同一偏移量
+    write_lease_until = models.DateTimeField(verbose_name="分片写入占用截止时间", null=True, blank=True)
+    lesson = models.OneToOneField(
+        Lesson, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='upload_session', verbose_name="生成的课时"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size})"
+
+    @property
+    def partial_name(self):
+        """上传过程中的临时文件 (相对 MEDIA_ROOT)"""
+        return f"lesson_videos_mp4/uploads/{self.id}.part"
+
+
 # --- 6. 注册 (购买) ---
 class Enrollment(models.Model):
     student = models.ForeignKey(
@@ -213,6 +359,64 @@ class LessonProgress(models.Model):
         return f"{self.student.username} - {self.lesson.title}"
 
 
+# --- 7.1 课程数据汇总 (讲师数据看板只读取这些汇总表，由 celery 任务增量填充) ---
+class CourseStatBase(models.Model):
+    views = models.IntegerField(verbose_name="浏览量", default=0)
+    enrollments = models.IntegerField(verbose_name="新增报名", default=0)
+    likes = models.IntegerField(verbose_name="新增点赞(净值)", default=0)
+    comments = models.IntegerField(verbose_name="新增评论", default=0)
+    submissions = models.IntegerField(verbose_name="作业提交", default=0)
+    completions = models.IntegerField(verbose_name="课时完成", default=0)
+
+    METRICS = ('views', 'enrollments', 'likes', 'comments', 'submissions', 'completions')
+
+    class Meta:
+        abstract = True
+
+
+class CourseHourlyStat(CourseStatBase):
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE,
+        related_name='hourly_stats', verbose_name="课程"
+    )
+    hour = models.DateTimeField(verbose_name="统计小时")
+
+    class Meta:
+        unique_together = ('course', 'hour')
+        verbose_name = "课程小时统计"
+        verbose_name_plural = verbose_name
+
+
+class CourseDailyStat(CourseStatBase):
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE,
+        related_name='daily_stats', verbose_name="课程"
+    )
+    date = models.DateField(verbose_name="统计日期")
+
+    class Meta:
+        unique_together = ('course', 'date')
+        verbose_name = "课程每日统计"
+        verbose_name_plural = verbose_name
+
+
+class CourseStatSnapshot(models.Model):
+    """没有事件时间的累计计数 (浏览/点赞/完成) 上次汇总时的值，两次汇总之差计入当前小时"""
+    course = models.OneToOneField(
+        Course, on_delete=models.CASCADE, primary_key=True,
+        related_name='stat_snapshot', verbose_name="课程"
+    )
+    view_count = models.PositiveIntegerField(default=0)
+    like_count = models.PositiveIntegerField(default=0)
+    completion_count = models.PositiveIntegerField(default=0)
+
+
+class RollupCursor(models.Model):
+    """增量汇总任务的水位线：上次已处理到的时间点"""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField()
+
+
 # --- 8. 讲师申请 ---
 class InstructorApplication(models.Model):
     STATUS_PENDING = 'pending'
@@ -261,14 +465,42 @@ class Comment(models.Model):
         related_name='replies_received', verbose_name="回复对象"
     )
 
+    # 冗余字段：所属课程与课程讲师 (创建时写入)，讲师答疑列表无需再经 课时→章节→课程 多表关联
+    course = models.ForeignKey(
+        Course, null=True, blank=True, on_delete=models.CASCADE,
+        related_name='comments', verbose_name="所属课程", db_index=False
+    )
+    instructor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='course_comments', verbose_name="课程讲师", db_index=False
+    )
+    # 学员的顶级提问在讲师回复之前为 True
+    is_unanswered = models.BooleanField(verbose_name="待讲师回复", default=False)
+
     class Meta:
         ordering = ['created_at']
         indexes = [
+            models.Index(fields=['-created_at', '-id']),
             models.Index(fields=['lesson', 'created_at']),
             models.Index(fields=['user', 'created_at']),
             models.Index(fields=['parent', 'created_at']),
+            # 讲师答疑列表：按 (讲师, 是否待回复) 定位后直接按时间倒序翻页
+            models.Index(fields=['instructor', 'is_unanswered', '-created_at', '-id']),
+            models.Index(fields=['course', 'created_at']),
         ]
 
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        if self.course_id is None:
+            self.course_id, self.instructor_id = Lesson.objects.filter(pk=self.lesson_id).values_list(
+                'module__course_id', 'module__course__instructor_id'
+            ).get()
+        if is_new:
+            self.is_unanswered = self.parent_id is None and self.user_id != self.instructor_id
+        super().save(*args, **kwargs)
+        if is_new and self.parent_id is not None and self.user_id == self.instructor_id:
+            Comment.objects.filter(pk=self.parent_id, is_unanswered=True).update(is_unanswered=False)
+
     def __str__(self):
         return f"{self.user.username} 评论 {self.lesson.title}"
 
@@ -367,11 +599,17 @@ class Submission(models.Model):
     )
     feedback = models.TextField(verbose_name="讲师评语", blank=True)
     grade = models.PositiveIntegerField(verbose_name="评分", null=True, blank=True)
+    # 结果来自自动批改 (讲师人工批改后置为 False，重新评分时跳过)
+    auto_graded = models.BooleanField(verbose_name="自动批改", default=False)
     submitted_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-submitted_at']
         unique_together = ('assignment', 'student')
+        indexes = [
+            models.Index(fields=['-submitted_at', '-id']),
+            models.Index(fields=['student', '-submitted_at']),
+        ]
 
     def __str__(self):
         return f"{self.student.username} 提交 {self.assignment.title}"
@@ -402,12 +640,92 @@ class Message(models.Model):
             models.Index(fields=['receiver', '-created_at']),  # 收件箱查询优化
             models.Index(fields=['sender', '-created_at']),    # 发件箱查询优化
             models.Index(fields=['receiver', 'is_read']),      # 未读消息查询优化
+            models.Index(fields=['sender', 'receiver', 'created_at']),  # 双人聊天记录分页
         ]
 
     def __str__(self):
         return f"{self.sender} -> {self.receiver}: {self.content[:20]}"
 
 
+# --- 12.1 会话摘要 (每个用户与每个联系人一行，随收发消息维护) ---
+class Conversation(models.Model):
+    PREVIEW_LENGTH = 100
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='conversations', verbose_name="所属用户"
+    )
+    peer = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='+', verbose_name="联系人"
+    )
+    last_message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', verbose_name="最后一条消息"
+    )
+    last_message_preview = models.CharField(verbose_name="最后消息摘要", max_length=PREVIEW_LENGTH, blank=True)
+    last_message_at = models.DateTimeField(verbose_name="最后消息时间", null=True, blank=True)
+    unread_count = models.PositiveIntegerField(verbose_name="未读数", default=0)
+
+    class Meta:
+        unique_together = ('owner', 'peer')
+        ordering = ['-last_message_at']
+        indexes = [
+            models.Index(fields=['owner', '-last_message_at', '-id']),  # 收件箱按最近消息排序
+        ]
+
+    def __str__(self):
+        return f"{self.owner} <-> {self.peer} ({self.unread_count} 未读)"
+
+    @staticmethod
+    def preview_of(message):
+        if message.content:
+            return message.content[:Conversation.PREVIEW_LENGTH]
+        return '[附件]' if message.attachment else ''
+
+    @classmethod
+    def record_message(cls, message):
+        """新消息写入后更新双方的会话摘要，接收方未读数 +1 (发给自己的消息不计未读)"""
+        fields = {
+            'last_message': message,
+            'last_message_preview': cls.preview_of(message),
+            'last_message_at': message.created_at,
+        }
+        sides = [(message.sender_id, message.receiver_id, 0)]
+        if message.receiver_id != message.sender_id:
+            sides.append((message.receiver_id, message.sender_id, 1))
+        for owner_id, peer_id, unread in sides:
+            updated = cls.objects.filter(owner_id=owner_id, peer_id=peer_id).update(
+                unread_count=models.F('unread_count') + unread, **fields
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(owner_id=owner_id, peer_id=peer_id, unread_count=unread, **fields)
+                except IntegrityError:
+                    # 并发创建时对方已插入，退回到原子更新
+                    cls.objects.filter(owner_id=owner_id, peer_id=peer_id).update(
+                        unread_count=models.F('unread_count') + unread, **fields
+                    )
+
+    @classmethod
+    def rebuild(cls, owner_id, peer_id):
+        """根据消息表重新计算一个会话 (消息被删除后调用)"""
+        thread = Message.objects.filter(
+            models.Q(sender_id=owner_id, receiver_id=peer_id) | models.Q(sender_id=peer_id, receiver_id=owner_id)
+        )
+        last = thread.order_by('-created_at', '-id').first()
+        if last is None:
+            cls.objects.filter(owner_id=owner_id, peer_id=peer_id).delete()
+            return
+        cls.objects.filter(owner_id=owner_id, peer_id=peer_id).update(
+            last_message=last,
+            last_message_preview=cls.preview_of(last),
+            last_message_at=last.created_at,
+            unread_count=thread.filter(receiver_id=owner_id, is_read=False).exclude(sender_id=owner_id).count(),
+        )
+
+
 # --- 13. 好友关系模型 (新增) ---
 class Friendship(models.Model):
     STATUS_PENDING = 'pending'
@@ -554,12 +872,25 @@ class PointRecord(models.Model):
     )
     points = models.IntegerField(verbose_name="积分变化", default=0)
     description = models.CharField(verbose_name="描述", max_length=200, blank=True)
+    # 与课程相关的行为 (观看/提交作业等) 记录课程分类，用于分类排行榜
+    category = models.ForeignKey(
+        Category, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='point_records', verbose_name="所属分类"
+    )
+    # 客户端重试时携带相同的幂等键，同一用户同一键只记一次分
+    idempotency_key = models.CharField(verbose_name="幂等键", max_length=64, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-created_at']
         verbose_name = "积分记录"
         verbose_name_plural = "积分记录"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_point_record_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),  # 周榜按时间范围汇总
+        ]
 
     def __str__(self):
         return f"{self.user.username} {self.action}: {self.points}分"
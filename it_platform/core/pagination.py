@@ -0,0 +1,32 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class OptionalCursorPagination(PageNumberPagination):
+    """
+    默认沿用页码分页 (兼容旧客户端)；请求携带 ?pagination=cursor 或 ?cursor= 时
+    切换为基于索引的游标 (keyset) 分页，翻页不再需要 OFFSET 与 COUNT(*)。
+
+    游标排序字段由视图的 cursor_ordering 指定，应与已有的 (时间, id) 索引一致。
+    """
+    cursor_query_param = 'cursor'
+    default_ordering = ('-created_at', '-id')
+
+    def _use_cursor(self, request):
+        params = request.query_params
+        return params.get('pagination') == 'cursor' or self.cursor_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self._cursor_paginator = None
+        if not self._use_cursor(request):
+            return super().paginate_queryset(queryset, request, view)
+
+        paginator = CursorPagination()
+        paginator.ordering = getattr(view, 'cursor_ordering', self.default_ordering)
+        paginator.page_size = self.get_page_size(request)
+        self._cursor_paginator = paginator
+        return paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self._cursor_paginator is not None:
+            return self._cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
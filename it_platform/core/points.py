@@ -0,0 +1,136 @@
+"""
+积分引擎
+
+所有加分都在一个事务内完成：先写积分记录 (幂等键重复时直接返回已有结果)，
+再用一条 UPDATE 以 F() 表达式累加总分，并在 SQL 中计算等级与连续学习天数，
+不在 Python 中读-改-写，并发请求不会丢失更新。
+批量加分 (如观看进度上报) 用一次 bulk_create 写入记录、一条 UPDATE 更新所有相关用户。
+事务提交后同步更新排行榜 (core/leaderboard.py)。
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from .models import PointRecord, UserPoints
+from . import leaderboard
+
+POINTS_RULES = {
+    PointRecord.ACTION_WATCH: 5,
+    PointRecord.ACTION_COMMENT: 3,
+    PointRecord.ACTION_SUBMIT: 10,
+    PointRecord.ACTION_LOGIN: 2,
+}
+# 每 100 分升一级
+LEVEL_STEP = 100
+
+
+class AwardResult:
+    def __init__(self, user_points, points_added, duplicate=False):
+        self.user_points = user_points
+        self.points_added = points_added
+        self.duplicate = duplicate
+
+
+def _streak_expression(today):
+    # 今天已活跃则保持不变，昨天活跃则 +1，否则 (含从未活跃) 重置为 1
+    return Case(
+        When(last_active_date=today, then=F('continuous_days')),
+        When(last_active_date=today - timedelta(days=1), then=F('continuous_days') + 1),
+        default=Value(1),
+        output_field=IntegerField(),
+    )
+
+
+def _apply(user_deltas, today):
+    """一条 UPDATE 累加多个用户的积分；UPDATE 中的表达式都基于更新前的值计算"""
+    UserPoints.objects.bulk_create(
+        [UserPoints(user_id=user_id) for user_id in user_deltas], ignore_conflicts=True
+    )
+    if len(user_deltas) == 1:
+        (user_id, delta), = user_deltas.items()
+        queryset = UserPoints.objects.filter(user_id=user_id)
+        delta = Value(delta)
+    else:
+        queryset = UserPoints.objects.filter(user_id__in=list(user_deltas))
+        delta = Case(
+            *[When(user_id=user_id, then=Value(value)) for user_id, value in user_deltas.items()],
+            default=Value(0), output_field=IntegerField(),
+        )
+    queryset.update(
+        total_points=F('total_points') + delta,
+        level=1 + (F('total_points') + delta) / LEVEL_STEP,
+        continuous_days=_streak_expression(today),
+        last_active_date=today,
+    )
+
+
+def award(user, action, idempotency_key=None, points=None, description='', category_id=None):
+    """
+    为用户加分，返回 AwardResult
+    :param idempotency_key: 相同的键重复提交时不再加分，返回当前积分
+    :param category_id: 与课程相关的行为所属的分类，计入分类排行榜
+    """
+    if points is None:
+        points = POINTS_RULES[action]
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                PointRecord.objects.create(
+                    user=user, action=action, points=points,
+                    description=description or f"获得{points}积分",
+                    idempotency_key=idempotency_key or None, category_id=category_id,
+                )
+        except IntegrityError:
+            existing = PointRecord.objects.get(user=user, idempotency_key=idempotency_key)
+            user_points, _ = UserPoints.objects.get_or_create(user=user)
+            return AwardResult(user_points, existing.points, duplicate=True)
+
+        _apply({user.pk: points}, timezone.localdate())
+        leaderboard.record_awards([(user.pk, points, category_id)])
+    return AwardResult(UserPoints.objects.get(user=user), points)
+
+
+def award_batch(events):
+    """
+    批量加分
+    :param events: 可迭代的 dict，键为 user_id / action / points、idempotency_key、category_id (可选)
+    :return: 实际入账的事件数 (幂等键重复的事件被跳过)
+    与其他请求并发写入同一幂等键时整批回滚并抛出 IntegrityError，重试即可
+    """
+    records, seen_keys = [], set()
+    for event in events:
+        key = event.get('idempotency_key') or None
+        if key is not None:
+            if (event['user_id'], key) in seen_keys:
+                continue
+            seen_keys.add((event['user_id'], key))
+        points = event.get('points')
+        if points is None:
+            points = POINTS_RULES[event['action']]
+        records.append(PointRecord(
+            user_id=event['user_id'], action=event['action'], points=points,
+            description=event.get('description') or f"获得{points}积分", idempotency_key=key,
+            category_id=event.get('category_id'),
+        ))
+    if not records:
+        return 0
+
+    with transaction.atomic():
+        if seen_keys:
+            # 一次查询过滤掉已入账的幂等键
+            existing = set(PointRecord.objects.filter(
+                user_id__in={user_id for user_id, _ in seen_keys},
+                idempotency_key__in={key for _, key in seen_keys},
+            ).values_list('user_id', 'idempotency_key'))
+            records = [r for r in records if (r.user_id, r.idempotency_key) not in existing]
+        if not records:
+            return 0
+        PointRecord.objects.bulk_create(records)
+
+        user_deltas = defaultdict(int)
+        for record in records:
+            user_deltas[record.user_id] += record.points
+        _apply(user_deltas, timezone.localdate())
+        leaderboard.record_awards([(r.user_id, r.points, r.category_id) for r in records])
+    return len(records)
@@ -0,0 +1,113 @@
+"""
+首页课程榜单 (popular / newest / top_liked)
+
+榜单对所有匿名访问者都相同，因此预先序列化为 JSON 字节存入缓存，
+接口直接返回缓存内容而不访问数据库。课程增删改时整体失效 (版本号递增)，
+并由 celery beat 定时重建以吸收观看/点赞计数的变化。
+
+榜单在请求之外构建，封面等文件地址按 settings.SITE_URL 生成绝对地址；
+未配置 SITE_URL 时为相对路径 (如 /media/course_covers/...)，由客户端按 API 地址补全。
+"""
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.cache import cache
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from .models import Category, Course
+from .serializers import CourseListSerializer
+from .view_counter import apply_pending_views
+
+RAIL_ORDERING = {
+    'popular': '-view_count',
+    'newest': '-created_at',
+    'top_liked': '-like_count',
+}
+VERSION_KEY = 'homepage_rails:version'
+RAIL_KEY = 'homepage_rails:{}:{}:{}'
+SLUGS_KEY = 'homepage_rails:{}:category_slugs'
+EMPTY_RAIL = b'[]'
+
+
+def _rail_size():
+    return getattr(settings, 'HOMEPAGE_RAIL_SIZE', 3)
+
+
+def _rail_timeout():
+    return getattr(settings, 'HOMEPAGE_RAIL_TIMEOUT', 60 * 10)
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def _rail_key(kind, category_slug=None):
+    return RAIL_KEY.format(_current_version(), kind, category_slug or '*')
+
+
+def _serializer_context():
+    """按 SITE_URL 构造请求上下文，使文件字段输出绝对地址"""
+    site_url = getattr(settings, 'SITE_URL', '')
+    if not site_url:
+        return {}
+    parts = urlsplit(site_url)
+    request = RequestFactory().get('/', HTTP_HOST=parts.netloc, secure=parts.scheme == 'https')
+    return {'request': Request(request)}
+
+
+def build_rail(kind, category_slug=None):
+    """查询并序列化一个榜单，返回 JSON 字节"""
+    queryset = Course.objects.select_related('instructor', 'category')
+    if category_slug:
+        queryset = queryset.filter(category__slug=category_slug)
+    courses = apply_pending_views(list(queryset.order_by(RAIL_ORDERING[kind])[:_rail_size()]))
+    return JSONRenderer().render(CourseListSerializer(courses, many=True, context=_serializer_context()).data)
+
+
+def _category_slugs():
+    """已有分类的 slug 集合，与榜单共用版本号 (分类增删改时一并失效)"""
+    key = SLUGS_KEY.format(_current_version())
+    slugs = cache.get(key)
+    if slugs is None:
+        slugs = frozenset(Category.objects.values_list('slug', flat=True))
+        cache.set(key, slugs, _rail_timeout())
+    return slugs
+
+
+def get_rail(kind, category_slug=None):
+    """
+    读取缓存中的榜单，未命中时现场构建并回填
+    不存在的分类直接返回空榜单，不为任意 ?category= 取值创建缓存条目
+    """
+    if category_slug and category_slug not in _category_slugs():
+        return EMPTY_RAIL
+    key = _rail_key(kind, category_slug)
+    content = cache.get(key)
+    if content is None:
+        content = build_rail(kind, category_slug)
+        cache.set(key, content, _rail_timeout())
+    return content
+
+
+def refresh_rails():
+    """重建全站及每个分类的全部榜单，返回写入的榜单数量"""
+    slugs = [None] + list(Category.objects.values_list('slug', flat=True))
+    entries = {}
+    for kind in RAIL_ORDERING:
+        for slug in slugs:
+            entries[_rail_key(kind, slug)] = build_rail(kind, slug)
+    cache.set_many(entries, _rail_timeout())
+    return len(entries)
+
+
+def invalidate_rails():
+    """递增版本号，使所有已缓存的榜单失效"""
+    cache.add(VERSION_KEY, 1, None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
@@ -0,0 +1,222 @@
+"""
+实时推送 (Server-Sent Events)
+
+业务代码通过 notify(user_id, event_type, data) 发布事件，事件在事务提交后写入
+通道层；/api/realtime/stream/ 为每个连接订阅该用户的频道，并以 SSE 格式推送给浏览器。
+
+推送流是长连接，只在以 ASGI 方式部署并开启 REALTIME_ENABLED 时提供 (WSGI 下无法逐条发送)。
+EventSource 无法设置请求头，前端先用 Token 换取短期有效的连接票据 (issue_ticket)，
+再以 ?ticket= 建立连接，账号 Token 不会出现在 URL 中。
+
+通道层由 settings.REALTIME_CHANNEL_LAYER 指定：
+  - InMemoryChannelLayer: 进程内发布/订阅，适用于开发、测试与单进程部署
+  - RedisChannelLayer:    基于 Redis PUBLISH/SUBSCRIBE，多个 ASGI 进程共享
+"""
+import asyncio
+import json
+import threading
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+CHANNEL_NAME = 'realtime:user:{}'
+TICKET_SALT = 'core.realtime.ticket'
+
+EVENT_MESSAGE = 'message.new'
+EVENT_FRIEND_REQUEST = 'friend.request'
+EVENT_FRIEND_ACCEPTED = 'friend.accepted'
+EVENT_COMMENT_REPLY = 'comment.reply'
+EVENT_SUBMISSION_GRADED = 'submission.graded'
+
+
+def is_enabled():
+    return getattr(settings, 'REALTIME_ENABLED', False)
+
+
+def issue_ticket(user_id):
+    """签发建立推送连接用的票据 (有效期 REALTIME_TICKET_TTL 秒)"""
+    return signing.TimestampSigner(salt=TICKET_SALT).sign(str(user_id))
+
+
+def check_ticket(ticket):
+    """票据有效时返回用户 ID，否则返回 None"""
+    if not ticket:
+        return None
+    try:
+        value = signing.TimestampSigner(salt=TICKET_SALT).unsign(
+            ticket, max_age=getattr(settings, 'REALTIME_TICKET_TTL', 60)
+        )
+    except signing.BadSignature:
+        return None
+    return int(value)
+
+
+def encode_event(event_type, data):
+    return json.dumps({
+        'id': uuid.uuid4().hex,
+        'type': event_type,
+        'data': data,
+    }, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def format_sse(raw):
+    """把一条事件 JSON 转成 SSE 帧"""
+    event = json.loads(raw)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+
+class InMemoryChannelLayer:
+    """
+    进程内通道层：每个订阅者一个 asyncio.Queue。
+    发布方可能在同步视图的线程池中，因此通过 call_soon_threadsafe 投递到订阅者的事件循环。
+    """
+
+    def __init__(self, capacity=100, **kwargs):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def publish(self, channel, raw):
+        with self._lock:
+            targets = list(self._subscribers.get(channel, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, raw)
+            except RuntimeError:
+                # 订阅者的事件循环已关闭，等待其自行退订
+                pass
+
+    @staticmethod
+    def _put(queue, raw):
+        try:
+            queue.put_nowait(raw)
+        except asyncio.QueueFull:
+            # 客户端消费过慢时丢弃新事件，避免占满内存；前端重连后会重新拉取列表
+            pass
+
+    def subscribe(self, channel):
+        return _InMemorySubscription(self, channel)
+
+    def _add(self, channel, entry):
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(entry)
+
+    def _discard(self, channel, entry):
+        with self._lock:
+            entries = self._subscribers.get(channel)
+            if entries is not None:
+                entries.discard(entry)
+                if not entries:
+                    del self._subscribers[channel]
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+class _InMemorySubscription:
+    def __init__(self, layer, channel):
+        self.layer = layer
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize=layer.capacity)
+        self._entry = (asyncio.get_running_loop(), self.queue)
+        layer._add(channel, self._entry)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.layer._discard(self.channel, self._entry)
+
+
+class RedisChannelLayer:
+    """基于 Redis PUBLISH/SUBSCRIBE 的通道层，所有 ASGI 进程订阅同一个 Redis"""
+
+    def __init__(self, location='redis://127.0.0.1:6379/2', **kwargs):
+        import redis
+        self.location = location
+        self._client = redis.Redis.from_url(location)
+
+    def publish(self, channel, raw):
+        self._client.publish(channel, raw)
+
+    def subscribe(self, channel):
+        return _RedisSubscription(self.location, channel)
+
+
+class _RedisSubscription:
+    def __init__(self, location, channel):
+        import redis.asyncio as aioredis
+        self.client = aioredis.Redis.from_url(location)
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.channel = channel
+        self._subscribed = False
+
+    async def get(self, timeout):
+        if not self._subscribed:
+            await self.pubsub.subscribe(self.channel)
+            self._subscribed = True
+        message = await self.pubsub.get_message(timeout=timeout)
+        if message is None:
+            return None
+        data = message['data']
+        return data.decode() if isinstance(data, bytes) else data
+
+    async def close(self):
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+_layer = None
+_layer_lock = threading.Lock()
+
+
+def get_channel_layer():
+    global _layer
+    if _layer is None:
+        with _layer_lock:
+            if _layer is None:
+                config = dict(getattr(settings, 'REALTIME_CHANNEL_LAYER', {}))
+                backend = import_string(config.pop('BACKEND', 'core.realtime.InMemoryChannelLayer'))
+                _layer = backend(**{key.lower(): value for key, value in config.items()})
+    return _layer
+
+
+def reset_channel_layer():
+    """丢弃当前通道层实例 (修改配置后或测试中使用)"""
+    global _layer
+    _layer = None
+
+
+def notify(user_id, event_type, data):
+    """
+    向指定用户推送一条事件。
+    在事务提交后才真正发布，避免客户端收到事件后读不到对应的数据。
+    """
+    if not user_id:
+        return
+    raw = encode_event(event_type, data)
+    channel = CHANNEL_NAME.format(user_id)
+    transaction.on_commit(lambda: get_channel_layer().publish(channel, raw))
+
+
+async def event_stream(user_id, keepalive=None):
+    """订阅用户频道并持续产出 SSE 帧，空闲时发送注释行保活"""
+    if keepalive is None:
+        keepalive = getattr(settings, 'REALTIME_KEEPALIVE_SECONDS', 15)
+    subscription = get_channel_layer().subscribe(CHANNEL_NAME.format(user_id))
+    try:
+        # 先发送一条 retry 指令，浏览器断线后按该间隔自动重连
+        yield 'retry: 3000\n\n'
+        while True:
+            raw = await subscription.get(keepalive)
+            yield ': keepalive\n\n' if raw is None else format_sse(raw)
+    finally:
+        await subscription.close()
@@ -0,0 +1,218 @@
+"""
+课程全文检索
+
+SQLite 下使用 FTS5 虚拟表 core_course_search (rowid 即课程ID) 建立索引，
+覆盖课程标题、描述、课时标题与讲师名称，按 BM25 排序。
+中文没有空格分词，入库前先切成二元组 (bigram)，查询时用同样的规则切分；
+其他数据库退回到 icontains 查询。索引由 core/signals.py 中的信号增量维护。
+二元组索引无法命中单个汉字，分词也会丢弃标点符号 (如 C++、C#)，这类查询同样退回 icontains。
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from rest_framework import filters
+from .models import Course, Lesson
+
+SEARCH_TABLE = 'core_course_search'
+# bm25 列权重：title, description, lessons, instructor
+BM25_WEIGHTS = (10.0, 1.0, 3.0, 2.0)
+
+# 中日韩文字 (汉字、假名、谚文) 没有空格分词，按二元组切分
+_CJK = r'\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_RE = re.compile(rf'[{_CJK}]+|[^\W{_CJK}]+')
+_CJK_RE = re.compile(rf'[{_CJK}]+')
+_SINGLE_CJK_RE = re.compile(rf'(?<![{_CJK}])[{_CJK}](?![{_CJK}])')
+
+
+def tokenize(text):
+    """其他文字按单词切分 (含带重音的字母)，连续的中日韩文字切成重叠的二元组"""
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').lower()):
+        if _CJK_RE.fullmatch(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def needs_fallback(query):
+    """查询含有单个汉字或分词会丢弃的字符时，全文索引无法准确匹配"""
+    text = (query or '').lower()
+    return bool(_SINGLE_CJK_RE.search(text) or _TOKEN_RE.sub('', text).split())
+
+
+def build_match_query(query, prefix=True):
+    """
+    把用户输入转换为 FTS5 MATCH 表达式，所有词项都必须命中
+    :param prefix: 最后一个词按前缀匹配 (输入联想)
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    if prefix:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _document(course):
+    instructor = course.instructor
+    lessons = Lesson.objects.filter(module__course_id=course.pk).values_list('title', flat=True)
+    return (
+        ' '.join(tokenize(course.title)),
+        ' '.join(tokenize(course.description)),
+        ' '.join(tokenize(' '.join(lessons))),
+        ' '.join(tokenize(f'{instructor.username} {instructor.nickname}')) if instructor else '',
+    )
+
+
+class SQLiteFTSBackend:
+    def search(self, query, limit=20, prefix=True):
+        if needs_fallback(query):
+            return LikeBackend().search(query, limit=limit, prefix=prefix)
+        match = build_match_query(query, prefix)
+        if not match:
+            return []
+        weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+        sql = (
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY bm25({SEARCH_TABLE}, {weights})'
+        )
+        params = [match]
+        if limit:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, query, prefix=False):
+        """以子查询形式筛选，命中的课程ID不经过 Python，也不受绑定参数个数限制"""
+        if needs_fallback(query):
+            return LikeBackend().filter(queryset, query, prefix)
+        match = build_match_query(query, prefix)
+        if not match:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match]
+        ))
+
+    def index(self, course):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [course.pk])
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, description, lessons, instructor) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [course.pk, *_document(course)]
+            )
+
+    def remove(self, course_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [course_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        count = 0
+        for course in Course.objects.select_related('instructor').iterator():
+            self.index(course)
+            count += 1
+        return count
+
+
+class LikeBackend:
+    """非 SQLite 数据库的兜底实现，无需维护索引"""
+
+    def search(self, query, limit=20, prefix=True):
+        if not query.split():
+            return []
+        ids = self.filter(Course.objects.all(), query).order_by('-created_at').values_list('pk', flat=True)
+        return list(ids[:limit] if limit else ids)
+
+    def filter(self, queryset, query, prefix=False):
+        words = query.split()
+        if not words:
+            return queryset.none()
+        matched = Course.objects.all()
+        for word in words:
+            matched = matched.filter(
+                Q(title__icontains=word) | Q(description__icontains=word) |
+                Q(modules__lessons__title__icontains=word) |
+                Q(instructor__username__icontains=word) | Q(instructor__nickname__icontains=word)
+            )
+        return queryset.filter(pk__in=matched.values('pk'))
+
+    def index(self, course):
+        pass
+
+    def remove(self, course_id):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+def get_backend():
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return LikeBackend()
+
+
+def search_course_ids(query, limit=20, prefix=True):
+    """返回按相关度排序的课程ID列表"""
+    return get_backend().search(query, limit=limit, prefix=prefix)
+
+
+def index_course(course_id):
+    course = Course.objects.select_related('instructor').filter(pk=course_id).first()
+    if course is None:
+        get_backend().remove(course_id)
+    else:
+        get_backend().index(course)
+
+
+def remove_course(course_id):
+    get_backend().remove(course_id)
+
+
+def rebuild_index():
+    return get_backend().rebuild()
+
+
+def highlight(text, query, snippet_length=None):
+    """
+    用 <mark> 标记查询词 (先做 HTML 转义)
+    :param snippet_length: 指定时截取首个命中词附近的片段
+    """
+    text = text or ''
+    terms = sorted(set(_TOKEN_RE.findall(query.lower())), key=len, reverse=True)
+    if not terms:
+        return escape(text[:snippet_length] if snippet_length else text)
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+
+    if snippet_length and len(text) > snippet_length:
+        match = pattern.search(text)
+        start = max(0, match.start() - snippet_length // 4) if match else 0
+        text = ('…' if start else '') + text[start:start + snippet_length] + '…'
+    parts, last = [], 0
+    for match in pattern.finditer(text):
+        parts.append(escape(text[last:match.start()]))
+        parts.append(f'<mark>{escape(match.group(0))}</mark>')
+        last = match.end()
+    parts.append(escape(text[last:]))
+    return ''.join(parts)
+
+
+class CourseSearchFilter(filters.BaseFilterBackend):
+    """
+    替代 SearchFilter：?search= 通过全文索引筛选，保持原有排序
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return get_backend().filter(queryset, query)
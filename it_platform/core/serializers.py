@@ -1,13 +1,29 @@
 import json
+from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from .models import (
     CustomUser, Course, Module, Lesson, Enrollment,
     Category, InstructorApplication, Comment, Note, Assignment, Submission, Message, Friendship,
-    Banner, Announcement, VideoProgress, UserPoints, PointRecord, Badge, UserBadge
+    Banner, Announcement, VideoProgress, UserPoints, PointRecord, Badge, UserBadge, UploadSession,
+    Conversation
 )
 
 
+# --- 稀疏字段集：GET 请求可通过 ?fields=id,title 只返回需要的字段 ---
+class SparseFieldsetMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = request.query_params.get('fields')
+        if requested:
+            allowed = {name.strip() for name in requested.split(',') if name.strip()}
+            for name in set(self.fields) - allowed:
+                self.fields.pop(name)
+
+
 # --- 1. 用户序列化 (普通用途) ---
 class UserSerializer(serializers.ModelSerializer):
     enrollments = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
@@ -28,6 +44,13 @@ class UserSerializer(serializers.ModelSerializer):
         return value
 
 
+# --- 用户名片序列化 (列表中嵌入的精简用户信息) ---
+class UserCardSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CustomUser
+        fields = ['id', 'username', 'nickname', 'avatar']
+
+
 # --- 2. 修改密码序列化 ---
 class ChangePasswordSerializer(serializers.Serializer):
     old_password = serializers.CharField(required=True)
@@ -81,7 +104,11 @@ class CourseAssignmentSerializer(serializers.ModelSerializer):
     def get_my_submission(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            submission = obj.submissions.filter(student=request.user).first()
+            # 优先使用视图层预取的当前用户提交记录，避免每个作业单独查询
+            if hasattr(obj, 'my_submissions'):
+                submission = obj.my_submissions[0] if obj.my_submissions else None
+            else:
+                submission = obj.submissions.filter(student=request.user).first()
             if submission:
                 return {
                     'id': submission.id,
@@ -101,8 +128,10 @@ class LessonSerializer(serializers.ModelSerializer):
         model = Lesson
         fields = [
             'id', 'module', 'title', 'lesson_type',
-            'content', 'video_mp4_file', 'video_m3u8_url', 'order'
+            'content', 'video_mp4_file', 'video_m3u8_url', 'order',
+            'transcode_status', 'transcode_progress', 'video_duration', 'video_poster'
         ]
+        read_only_fields = ['transcode_status', 'transcode_progress', 'video_duration', 'video_poster']
 
     def validate_title(self, value):
         if not value or not value.strip():
@@ -110,6 +139,27 @@ class LessonSerializer(serializers.ModelSerializer):
         return value.strip()
 
 
+# --- 4.1 视频分片上传会话序列化 ---
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'module', 'title', 'order', 'filename', 'total_size', 'checksum',
+                  'offset', 'status', 'lesson', 'created_at']
+        read_only_fields = ['offset', 'status', 'lesson', 'created_at']
+
+    def validate_total_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("文件大小无效")
+        if value > settings.LESSON_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError("文件超过大小限制")
+        return value
+
+    def validate_checksum(self, value):
+        if value and len(value) != 64:
+            raise serializers.ValidationError("checksum 应为 SHA-256 十六进制字符串")
+        return value.lower()
+
+
 # --- 5. 章节序列化 ---
 class ModuleSerializer(serializers.ModelSerializer):
     lessons = LessonSerializer(many=True, read_only=True)
@@ -125,10 +175,10 @@ class ModuleSerializer(serializers.ModelSerializer):
 
 
 # --- 6. 课程列表序列化 (List) ---
-class CourseListSerializer(serializers.ModelSerializer):
-    instructor = UserSerializer(read_only=True)
+class CourseListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    instructor = UserCardSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
-    like_count = serializers.SerializerMethodField()
+    like_count = serializers.IntegerField(read_only=True)
     view_count = serializers.IntegerField(read_only=True)
 
     class Meta:
@@ -139,21 +189,18 @@ class CourseListSerializer(serializers.ModelSerializer):
             'like_count', 'view_count'
         ]
 
-    def get_like_count(self, obj):
-        return getattr(obj, 'like_count', obj.likes.count())
-
     def get_view_count(self, obj):
         return getattr(obj, 'view_count', obj.view_count)
 
 
 # --- 7. 课程详情序列化 (Detail) ---
-class CourseDetailSerializer(serializers.ModelSerializer):
+class CourseDetailSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     modules = ModuleSerializer(many=True, read_only=True)
     instructor = UserSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     assignments = CourseAssignmentSerializer(many=True, read_only=True)
 
-    like_count = serializers.SerializerMethodField()
+    like_count = serializers.IntegerField(read_only=True)
     is_liked = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     view_count = serializers.IntegerField(read_only=True)
@@ -167,18 +214,19 @@ class CourseDetailSerializer(serializers.ModelSerializer):
             'assignments'
         ]
 
-    def get_like_count(self, obj):
-        return obj.likes.count()
-
     def get_is_liked(self, obj):
         user = self.context.get('request').user if self.context.get('request') else None
         if user and user.is_authenticated:
+            if hasattr(obj, 'is_liked'):
+                return obj.is_liked
             return obj.likes.filter(pk=user.pk).exists()
         return False
 
     def get_is_favorited(self, obj):
         user = self.context.get('request').user if self.context.get('request') else None
         if user and user.is_authenticated:
+            if hasattr(obj, 'is_favorited'):
+                return obj.is_favorited
             return user.favorited_courses.filter(pk=obj.pk).exists()
         return False
 
@@ -208,18 +256,19 @@ class InstructorApplicationSerializer(serializers.ModelSerializer):
 
 # --- 9. 评论序列化 ---
 class ReplySerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
-    reply_to_user = UserSerializer(read_only=True)
+    user = UserCardSerializer(read_only=True)
+    reply_to_user = UserCardSerializer(read_only=True)
 
     class Meta:
         model = Comment
         fields = ['id', 'user', 'content', 'created_at', 'parent', 'reply_to_user']
 
 
-class CommentSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True)
-    replies = ReplySerializer(many=True, read_only=True)
-    reply_to_user = UserSerializer(read_only=True)
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    user = UserCardSerializer(read_only=True)
+    replies = serializers.SerializerMethodField()
+    reply_count = serializers.SerializerMethodField()
+    reply_to_user = UserCardSerializer(read_only=True)
 
     parent = serializers.PrimaryKeyRelatedField(
         queryset=Comment.objects.all(), write_only=True, allow_null=True, required=False
@@ -232,9 +281,22 @@ class CommentSerializer(serializers.ModelSerializer):
         model = Comment
         fields = [
             'id', 'user', 'lesson', 'content', 'created_at',
-            'parent', 'replies', 'reply_to_user', 'reply_to_user_id'
+            'parent', 'replies', 'reply_count', 'reply_to_user', 'reply_to_user_id'
         ]
-        read_only_fields = ['user', 'created_at', 'replies', 'reply_to_user']
+        read_only_fields = ['user', 'created_at', 'replies', 'reply_count', 'reply_to_user']
+
+    def get_replies(self, obj):
+        # 讨论区列表由 comment_tree.load_threads 预先加载前几条回复，其余场景返回全部回复
+        replies = getattr(obj, 'reply_preview', None)
+        if replies is None:
+            replies = obj.replies.all()
+        return ReplySerializer(replies, many=True, context=self.context).data
+
+    def get_reply_count(self, obj):
+        reply_count = getattr(obj, 'reply_count', None)
+        if reply_count is None:
+            reply_count = len(obj.replies.all())
+        return reply_count
 
     def validate_content(self, value):
         if not value or not value.strip():
@@ -253,6 +315,20 @@ class CommentSerializer(serializers.ModelSerializer):
         return data
 
 
+# --- 讲师答疑列表 ---
+class InstructorQASerializer(serializers.ModelSerializer):
+    user = UserCardSerializer(read_only=True)
+    lesson_title = serializers.CharField(source='lesson.title', read_only=True)
+    course_title = serializers.CharField(source='course.title', read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = [
+            'id', 'user', 'lesson', 'lesson_title', 'course', 'course_title', 'content', 'created_at', 'is_unanswered'
+        ]
+        read_only_fields = fields
+
+
 # --- 10. 笔记序列化 ---
 class NoteSerializer(serializers.ModelSerializer):
     lesson_title = serializers.CharField(source='lesson.title', read_only=True)
@@ -267,8 +343,8 @@ class NoteSerializer(serializers.ModelSerializer):
 
 
 # --- 11. 作业相关序列化 ---
-class SubmissionSerializer(serializers.ModelSerializer):
-    student = UserSerializer(read_only=True)
+class SubmissionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    student = UserCardSerializer(read_only=True)
     assignment_title = serializers.CharField(source='assignment.title', read_only=True)
     course_title = serializers.CharField(source='assignment.course.title', read_only=True)
     assignment_type = serializers.CharField(source='assignment.assignment_type', read_only=True)
@@ -277,8 +353,8 @@ class SubmissionSerializer(serializers.ModelSerializer):
         model = Submission
         fields = ['id', 'assignment', 'assignment_title', 'course_title', 'assignment_type', 'student', 'content',
                   'status', 'feedback',
-                  'grade', 'submitted_at', 'attachment']
-        read_only_fields = ['student', 'submitted_at']
+                  'grade', 'auto_graded', 'submitted_at', 'attachment']
+        read_only_fields = ['student', 'auto_graded', 'submitted_at']
 
 
 class AssignmentSerializer(serializers.ModelSerializer):
@@ -304,9 +380,9 @@ class AdminUserSerializer(serializers.ModelSerializer):
 
 
 # --- 13. 私信序列化 ---
-class MessageSerializer(serializers.ModelSerializer):
-    sender = UserSerializer(read_only=True)
-    receiver = UserSerializer(read_only=True)
+class MessageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    sender = UserCardSerializer(read_only=True)
+    receiver = UserCardSerializer(read_only=True)
     receiver_username = serializers.CharField(write_only=True)
     attachment = serializers.FileField(required=False, allow_null=True)
 
@@ -338,10 +414,19 @@ class MessageSerializer(serializers.ModelSerializer):
         return message
 
 
+# --- 13.1 会话摘要序列化 ---
+class ConversationSerializer(serializers.ModelSerializer):
+    peer = UserCardSerializer(read_only=True)
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'peer', 'last_message', 'last_message_preview', 'last_message_at', 'unread_count']
+
+
 # --- 14. 好友关系序列化 (新增) ---
-class FriendshipSerializer(serializers.ModelSerializer):
-    from_user = UserSerializer(read_only=True)
-    to_user = UserSerializer(read_only=True)
+class FriendshipSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    from_user = UserCardSerializer(read_only=True)
+    to_user = UserCardSerializer(read_only=True)
     to_username = serializers.CharField(write_only=True)
 
     class Meta:
@@ -0,0 +1,296 @@
+from django.db.models import Exists, F, OuterRef
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import (
+    Course, CustomUser, Enrollment, Module, Lesson, Message, Conversation, Friendship, Comment, Submission,
+    Badge, Assignment, Category
+)
+from . import realtime, friend_graph, user_search, badges, grading, comment_cache, tiered_cache
+from .rails import invalidate_rails
+from .search import index_course, remove_course
+from .serializers import MessageSerializer, FriendshipSerializer, UserCardSerializer
+
+
+# --- 1. 课程冗余计数维护 ---
+def _affected_course_ids(instance, pk_set):
+    if isinstance(instance, Course):
+        return {instance.pk}
+    return set(pk_set or ())
+
+
+def _sync_m2m_counter(instance, action, pk_set):
+    # 点赞/收藏接口直接操作中间表并用 F() 增减计数，不会触发此信号；
+    # 这里只兜底后台编辑等走 m2m 管理器的写入，按关联表精确重算受影响的课程
+    # 返回重算过的课程 id，供调用方继续处理
+    if action == 'pre_clear' and not isinstance(instance, Course):
+        instance._cleared_course_ids = set(
+            instance.liked_courses.values_list('pk', flat=True)
+        ) | set(instance.favorited_courses.values_list('pk', flat=True))
+        return set()
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return set()
+
+    course_ids = _affected_course_ids(instance, pk_set)
+    if action == 'post_clear' and not isinstance(instance, Course):
+        course_ids = getattr(instance, '_cleared_course_ids', set())
+    if course_ids:
+        Course.recompute_counters(course_ids)
+    return course_ids
+
+
+@receiver(m2m_changed, sender=Course.likes.through)
+def course_likes_changed(sender, instance, action, pk_set, **kwargs):
+    course_ids = _sync_m2m_counter(instance, action, pk_set)
+    if not course_ids:
+        return
+    # 只重算受影响课程所属的分类
+    if isinstance(instance, Course):
+        category_ids = {instance.category_id} - {None}
+    else:
+        category_ids = set(
+            Course.objects.filter(pk__in=course_ids, category__isnull=False).values_list('category_id', flat=True)
+        )
+    if category_ids:
+        Category.recompute_total_likes(category_ids)
+        tiered_cache.invalidate_on_commit(tiered_cache.NAMESPACE_CATEGORIES)
+
+
+@receiver(m2m_changed, sender=CustomUser.favorited_courses.through)
+def course_favorites_changed(sender, instance, action, pk_set, **kwargs):
+    _sync_m2m_counter(instance, action, pk_set)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_created(sender, instance, created, **kwargs):
+    if created:
+        Course.objects.filter(pk=instance.course_id).update(enrollment_count=F('enrollment_count') + 1)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    Course.objects.filter(pk=instance.course_id, enrollment_count__gt=0).update(
+        enrollment_count=F('enrollment_count') - 1
+    )
+
+
+# --- 2. 首页榜单失效 ---
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def course_changed(sender, **kwargs):
+    invalidate_rails()
+
+
+# --- 2.1 分类点赞总数与分类列表缓存 ---
+@receiver(pre_save, sender=Course)
+def course_remember_category(sender, instance, **kwargs):
+    instance._previous_category_id = None
+    if instance.pk:
+        instance._previous_category_id = Course.objects.filter(pk=instance.pk).values_list(
+            'category_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Course)
+def course_category_changed(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_category_id', None)
+    if created or previous == instance.category_id:
+        return
+    Category.recompute_total_likes({previous, instance.category_id} - {None})
+    tiered_cache.invalidate_on_commit(tiered_cache.NAMESPACE_CATEGORIES)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted_category(sender, instance, **kwargs):
+    if instance.category_id:
+        Category.recompute_total_likes([instance.category_id])
+        tiered_cache.invalidate_on_commit(tiered_cache.NAMESPACE_CATEGORIES)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, **kwargs):
+    tiered_cache.invalidate_on_commit(tiered_cache.NAMESPACE_CATEGORIES)
+
+
+# --- 2.2 评论冗余讲师字段维护 ---
+@receiver(post_save, sender=Course)
+def course_sync_comment_instructor(sender, instance, created, **kwargs):
+    if not created:
+        Comment.objects.filter(course=instance).exclude(
+            instructor_id=instance.instructor_id
+        ).update(instructor_id=instance.instructor_id)
+
+
+def _move_comments(comments, course_id):
+    # 课时/章节移动到其他课程后，评论的冗余课程与讲师跟随新课程
+    instructor_id = Course.objects.filter(pk=course_id).values_list('instructor_id', flat=True).first()
+    comments.exclude(course_id=course_id).update(course_id=course_id, instructor_id=instructor_id)
+
+
+@receiver(post_save, sender=Module)
+def module_sync_comment_course(sender, instance, created, **kwargs):
+    if not created:
+        _move_comments(Comment.objects.filter(lesson__module=instance), instance.course_id)
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_sync_comment_course(sender, instance, created, **kwargs):
+    if not created:
+        course_id = Module.objects.filter(pk=instance.module_id).values_list('course_id', flat=True).first()
+        _move_comments(Comment.objects.filter(lesson=instance), course_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_reopen_question(sender, instance, **kwargs):
+    # 讲师删除回复后，若该提问已没有讲师的回复，重新标记为待回复
+    if instance.parent_id is None or instance.user_id != instance.instructor_id:
+        return
+    instructor_replies = Comment.objects.filter(parent_id=OuterRef('pk'), user_id=OuterRef('instructor_id'))
+    Comment.objects.filter(pk=instance.parent_id, is_unanswered=False).exclude(
+        user_id=instance.instructor_id
+    ).update(is_unanswered=~Exists(instructor_replies))
+
+
+# --- 3. 课程全文索引增量维护 ---
+@receiver(post_save, sender=Course)
+def course_saved_reindex(sender, instance, **kwargs):
+    index_course(instance.pk)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted_reindex(sender, instance, **kwargs):
+    remove_course(instance.pk)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def lesson_changed_reindex(sender, instance, **kwargs):
+    # 级联删除时章节可能已不存在，此时由课程/章节自身的信号处理
+    course_id = Module.objects.filter(pk=instance.module_id).values_list('course_id', flat=True).first()
+    if course_id:
+        index_course(course_id)
+
+
+@receiver(post_delete, sender=Module)
+def module_deleted_reindex(sender, instance, **kwargs):
+    if Course.objects.filter(pk=instance.course_id).exists():
+        index_course(instance.course_id)
+
+
+@receiver(post_save, sender=CustomUser)
+def instructor_renamed_reindex(sender, instance, update_fields=None, **kwargs):
+    # 登录等只更新部分字段的保存不影响索引
+    if update_fields is not None and not {'username', 'nickname'} & set(update_fields):
+        return
+    for course_id in instance.courses_taught.values_list('pk', flat=True):
+        index_course(course_id)
+
+
+# --- 3.1 用户检索词维护 ---
+@receiver(post_save, sender=CustomUser)
+def user_renamed_reindex(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'username', 'nickname'} & set(update_fields):
+        return
+    user_search.index_user(instance)
+
+
+# --- 4. 私信会话摘要维护 ---
+@receiver(post_save, sender=Message)
+def message_created(sender, instance, created, **kwargs):
+    if created:
+        Conversation.record_message(instance)
+        realtime.notify(instance.receiver_id, realtime.EVENT_MESSAGE, MessageSerializer(instance).data)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    Conversation.rebuild(instance.sender_id, instance.receiver_id)
+    Conversation.rebuild(instance.receiver_id, instance.sender_id)
+
+
+# --- 5. 好友关系缓存失效 ---
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def friendship_graph_changed(sender, instance, **kwargs):
+    friend_graph.invalidate(instance.from_user_id, instance.to_user_id)
+
+
+# --- 6. 勋章规则缓存失效 ---
+@receiver(post_save, sender=Badge)
+@receiver(post_delete, sender=Badge)
+def badge_rules_changed(sender, **kwargs):
+    badges.invalidate_rules()
+
+
+# --- 7. 选择题答案缓存失效 ---
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def assignment_answer_key_changed(sender, instance, **kwargs):
+    grading.invalidate_answer_key(instance.pk)
+
+
+# --- 8. 课时讨论区缓存失效 ---
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_invalidate_page_cache(sender, instance, **kwargs):
+    comment_cache.invalidate(instance.lesson_id)
+
+
+# --- 9. 实时推送事件 ---
+@receiver(pre_save, sender=Friendship)
+def friendship_remember_status(sender, instance, **kwargs):
+    # 记录保存前的状态，只在 pending -> accepted 时推送“申请已通过”
+    instance._previous_status = None
+    if instance.pk:
+        instance._previous_status = Friendship.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+
+
+@receiver(post_save, sender=Friendship)
+def friendship_changed(sender, instance, created, **kwargs):
+    if created and instance.status == Friendship.STATUS_PENDING:
+        realtime.notify(instance.to_user_id, realtime.EVENT_FRIEND_REQUEST, FriendshipSerializer(instance).data)
+    elif (not created and instance.status == Friendship.STATUS_ACCEPTED
+          and getattr(instance, '_previous_status', None) == Friendship.STATUS_PENDING):
+        realtime.notify(instance.from_user_id, realtime.EVENT_FRIEND_ACCEPTED, FriendshipSerializer(instance).data)
+
+
+@receiver(post_save, sender=Comment)
+def comment_replied(sender, instance, created, **kwargs):
+    if not created or instance.parent_id is None:
+        return
+    target_id = instance.reply_to_user_id or instance.parent.user_id
+    if target_id == instance.user_id:
+        return
+    realtime.notify(target_id, realtime.EVENT_COMMENT_REPLY, {
+        'id': instance.id,
+        'parent': instance.parent_id,
+        'lesson': instance.lesson_id,
+        'user': UserCardSerializer(instance.user).data,
+        'content': instance.content,
+        'created_at': instance.created_at,
+    })
+
+
+@receiver(pre_save, sender=Submission)
+def submission_remember_grade(sender, instance, **kwargs):
+    # 记录保存前的批改状态，只有批改结果真正变化时才推送
+    instance._previous_grade = None
+    if instance.pk:
+        instance._previous_grade = Submission.objects.filter(pk=instance.pk).values_list('status', 'grade').first()
+
+
+@receiver(post_save, sender=Submission)
+def submission_graded(sender, instance, created, **kwargs):
+    if instance.status == Submission.STATUS_PENDING:
+        return
+    if getattr(instance, '_previous_grade', None) == (instance.status, instance.grade):
+        return
+    realtime.notify(instance.student_id, realtime.EVENT_SUBMISSION_GRADED, {
+        'id': instance.id,
+        'assignment': instance.assignment_id,
+        'status': instance.status,
+        'grade': instance.grade,
+        'feedback': instance.feedback,
+    })
@@ -1,19 +1,25 @@
-import time
 import os
-from celery import shared_task
-from .models import Lesson
+from celery import chord, shared_task
+from . import transcoding
+from .models import Assignment, Lesson
+from .view_counter import flush_course_views
+from .rails import refresh_rails
+from .points import award_batch
+from . import leaderboard, analytics, grading, uploads
+from django.db import IntegrityError
 import logging
 
 logger = logging.getLogger(__name__)
 
-# 【重要说明】:
-# 在实际生产环境中, 视频转码需要用到 FFmpeg, 并上传到阿里云/S3。
-# 这里我们用一个 time.sleep(10) 来"模拟"这个耗时 10 秒的转码过程。
+# 视频转码的具体实现见 core/transcoding.py (FFmpeg 多码率 HLS)，
+# 这里只负责用 Celery chord 编排各步骤。
+
 
 @shared_task(bind=True, max_retries=3)
 def process_video_upload(self, lesson_id, file_path):
     """
-    处理视频上传任务
+    处理视频上传任务：探测信息、截取封面，然后把各码率档位的转码
+    拆分为独立任务并行执行，全部完成后生成 master.m3u8
     :param lesson_id: 课时ID
     :param file_path: 视频文件路径
     :return: 处理结果
@@ -26,41 +32,21 @@ def process_video_upload(self, lesson_id, file_path):
         if not os.path.exists(file_path):
             logger.error(f"文件不存在: {file_path}")
             raise FileNotFoundError(f"视频文件不存在: {file_path}")
-        
-        # 模拟视频处理（实际应该使用FFmpeg进行转码）
-        logger.info(f"开始处理视频，预计需要10秒...")
-        time.sleep(10)
-        
-        # 获取课时对象
-        lesson = Lesson.objects.get(pk=lesson_id)
-        
-        # 更新课时状态
-        # 在实际生产环境中，这里应该：
-        # 1. 使用FFmpeg将MP4转换为HLS格式
-        # 2. 上传到云存储（如阿里云OSS、AWS S3等）
-        # 3. 获取HLS播放列表URL
-        
-        # 保存相对路径到 video_m3u8_url，前端会自动补全 API_URL
-        # 格式: /media/lesson_videos_mp4/xxx.mp4
-        if lesson.video_mp4_file:
-            # 获取文件的相对路径（相对于 MEDIA_ROOT）
-            file_path = lesson.video_mp4_file.name
-            # 确保路径以 /media/ 开头（前端需要这个格式）
-            if not file_path.startswith('/'):
-                from django.conf import settings
-                lesson.video_m3u8_url = f"{settings.MEDIA_URL}{file_path}"
-            else:
-                lesson.video_m3u8_url = file_path
-            logger.info(f"保存视频URL: {lesson.video_m3u8_url}")
-        else:
-            logger.error("lesson.video_mp4_file 为空，无法保存视频URL")
-            
-        lesson.lesson_type = Lesson.LESSON_VIDEO
-        lesson.content = ""  # 清空"视频正在处理中..."的提示
-        lesson.save()
-
-        logger.info(f"--- [任务完成] Lesson ID: {lesson_id} 视频处理成功! URL已更新。 ---")
-        return {"status": "success", "lesson_id": lesson_id, "message": "Video processing successful"}
+
+        if not Lesson.objects.filter(pk=lesson_id).exists():
+            raise Lesson.DoesNotExist
+
+        info = transcoding.prepare(lesson_id, file_path)
+        renditions = info['renditions']
+        logger.info(f"视频时长 {info['duration']:.1f} 秒，生成档位: {', '.join(renditions)}")
+
+        header = [
+            transcode_rendition.s(lesson_id, file_path, name, info['duration'], renditions)
+            for name in renditions
+        ]
+        callback = finalize_video_upload.s(lesson_id, renditions).on_error(mark_transcode_failed.s(lesson_id))
+        chord(header)(callback)
+        return {"status": "dispatched", "lesson_id": lesson_id, "renditions": renditions}
 
     except Lesson.DoesNotExist:
         error_msg = f"Lesson ID {lesson_id} 不存在, 任务失败。"
@@ -69,29 +55,129 @@ def process_video_upload(self, lesson_id, file_path):
     except FileNotFoundError as e:
         error_msg = f"文件不存在: {str(e)}"
         logger.error(error_msg)
-        # 更新课时状态为错误
-        try:
-            lesson = Lesson.objects.get(pk=lesson_id)
-            lesson.content = f"视频处理失败: {error_msg}"
-            lesson.save()
-        except Exception as e:
-            logger.warning(f"无法更新课时状态: {str(e)}")
+        _mark_failed(lesson_id, f"视频处理失败: {error_msg}")
         return {"status": "error", "message": error_msg}
     except Exception as e:
         error_msg = f"处理视频时发生未知错误: {str(e)}"
         logger.error(error_msg, exc_info=True)
-        
-        # 更新课时状态为错误
-        try:
-            lesson = Lesson.objects.get(pk=lesson_id)
-            lesson.content = f"视频处理失败，请重新上传。错误: {str(e)}"
-            lesson.save()
-        except Exception as ex:
-            logger.warning(f"无法更新课时状态: {str(ex)}")
-        
+
         # 如果重试次数未达到上限，则重试
         if self.request.retries < self.max_retries:
             logger.info(f"任务失败，将在10秒后重试 (第 {self.request.retries + 1} 次)...")
             raise self.retry(countdown=10, exc=e)
-        
-        return {"status": "error", "message": error_msg}
\ No newline at end of file
+
+        _mark_failed(lesson_id, f"视频处理失败，请重新上传。错误: {str(e)}")
+        return {"status": "error", "message": error_msg}
+
+
+@shared_task(bind=True, max_retries=3)
+def transcode_rendition(self, lesson_id, file_path, name, duration, renditions):
+    """转码单个码率档位 (已完成的档位会被跳过，可安全重试)"""
+    try:
+        transcoding.transcode_rendition(lesson_id, file_path, name, duration, renditions)
+        logger.info(f"Lesson ID: {lesson_id} 档位 {name} 转码完成")
+        return name
+    except Exception as e:
+        logger.warning(f"Lesson ID: {lesson_id} 档位 {name} 转码失败: {e}")
+        raise self.retry(countdown=10, exc=e)
+
+
+@shared_task
+def finalize_video_upload(results, lesson_id, renditions):
+    """所有档位完成后生成 master.m3u8 并更新课时"""
+    transcoding.write_master_playlist(lesson_id, renditions)
+    logger.info(f"--- [任务完成] Lesson ID: {lesson_id} 视频处理成功! URL已更新。 ---")
+    return {"status": "success", "lesson_id": lesson_id, "message": "Video processing successful"}
+
+
+@shared_task
+def mark_transcode_failed(request, exc, traceback, lesson_id):
+    """转码任务组的错误回调"""
+    logger.error(f"Lesson ID: {lesson_id} 转码失败: {exc}")
+    _mark_failed(lesson_id, f"视频处理失败，请重新上传。错误: {exc}")
+
+
+def _mark_failed(lesson_id, message):
+    try:
+        Lesson.objects.filter(pk=lesson_id).update(
+            transcode_status=Lesson.TRANSCODE_FAILED, content=message
+        )
+    except Exception as e:
+        logger.warning(f"无法更新课时状态: {str(e)}")
+
+
+@shared_task
+def flush_course_views_task():
+    """
+    将 Redis 缓冲中累积的课程观看次数批量写回数据库 (由 celery beat 定时触发)
+    """
+    flushed = flush_course_views()
+    if flushed:
+        logger.info(f"--- 已合并 {flushed} 次课程观看到数据库 ---")
+    return flushed
+
+
+
+@shared_task
+def refresh_homepage_rails_task():
+    """
+    重建首页榜单缓存 (由 celery beat 定时触发)
+    """
+    count = refresh_rails()
+    logger.info(f"--- 已重建 {count} 个首页榜单 ---")
+    return count
+
+
+@shared_task(bind=True, max_retries=3)
+def award_points_batch_task(self, events):
+    """
+    批量入账积分事件 (如观看进度上报汇总后提交)
+    幂等键并发冲突时整批回滚，重试时已入账的事件会被跳过
+    """
+    try:
+        return award_batch(events)
+    except IntegrityError as exc:
+        raise self.retry(exc=exc, countdown=1)
+
+
+@shared_task
+def reconcile_leaderboards_task():
+    """
+    按数据库重建积分排行榜，纠正增量更新的偏差 (由 celery beat 定时触发)
+    """
+    count = leaderboard.reconcile()
+    logger.info(f"--- 已重建 {count} 个积分排行榜 ---")
+    return count
+
+
+@shared_task
+def rollup_course_stats_task():
+    """
+    增量汇总讲师数据看板的小时/每日统计 (由 celery beat 定时触发)
+    """
+    count = analytics.rollup()
+    logger.info(f"--- 已汇总 {count} 条课程小时统计 ---")
+    return count
+
+
+@shared_task
+def regrade_assignment_task(assignment_id):
+    """
+    选择题答案修改后，重新评分该作业的全部提交
+    """
+    assignment = Assignment.objects.filter(pk=assignment_id).first()
+    if assignment is None:
+        return 0
+    count = grading.regrade(assignment)
+    logger.info(f"--- 作业 {assignment_id} 重新评分，{count} 份提交的成绩发生变化 ---")
+    return count
+
+
+@shared_task
+def cleanup_upload_sessions_task():
+    """
+    清理过期的分片上传会话与孤儿临时文件 (由 celery beat 定时触发)
+    """
+    count = uploads.cleanup_expired()
+    logger.info(f"--- 已清理 {count} 个过期的上传临时文件 ---")
+    return count
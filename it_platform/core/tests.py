@@ -1,8 +1,36 @@
 # core/tests.py
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from asgiref.sync import sync_to_async
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from django.urls import reverse
-from .models import CustomUser, Course, Category, InstructorApplication
+from django.db import connection
+from django.core.management import call_command
+from django.core.cache import cache
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from it_platform.celery import app as celery_app
+from .models import (
+    CustomUser, Course, Category, InstructorApplication, Module, Lesson, Assignment, Submission, Enrollment,
+    Message, UploadSession, Friendship, UserSearchTerm, PointRecord, UserPoints, Badge, UserBadge, Comment,
+    CourseDailyStat, Conversation, Note
+)
+from . import realtime, leaderboard, analytics, grading, comment_cache, tiered_cache, view_counter, uploads, friend_graph, user_search, badges, rails
+from .view_counter import get_pending_views
+from .tasks import process_video_upload
+from .points import award_batch
 
 
 class CoreAPITests(APITestCase):
@@ -105,4 +133,1409 @@ class CoreAPITests(APITestCase):
 
         # 6. 【核心验证】: 刷新数据库中的学生对象，检查其角色是否已更新
         self.student_user.refresh_from_db()
-        self.assertEqual(self.student_user.role, CustomUser.ROLE_INSTRUCTOR)
\ No newline at end of file
+        self.assertEqual(self.student_user.role, CustomUser.ROLE_INSTRUCTOR)
+
+class CourseDetailQueryTests(APITestCase):
+
+    def setUp(self):
+        self.instructor = CustomUser.objects.create_user(
+            username='detail_instructor', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        self.student = CustomUser.objects.create_user(
+            username='detail_student', password='password123', role=CustomUser.ROLE_STUDENT
+        )
+
+    def _build_course(self, title, module_count, lessons_per_module, assignment_count):
+        course = Course.objects.create(title=title, description='desc', instructor=self.instructor)
+        for m in range(module_count):
+            module = Module.objects.create(course=course, title=f'章节 {m}', order=m)
+            for l in range(lessons_per_module):
+                Lesson.objects.create(module=module, title=f'课时 {l}', order=l)
+        for a in range(assignment_count):
+            assignment = Assignment.objects.create(course=course, title=f'作业 {a}', description='desc')
+            Submission.objects.create(assignment=assignment, student=self.student, content='answer')
+        course.likes.add(self.student)
+        return course
+
+    def _count_queries(self, course):
+        url = reverse('course-detail', kwargs={'pk': course.id})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response.data
+
+    def test_detail_query_count_is_independent_of_course_size(self):
+        """
+        详情接口的查询数不应随章节、课时、作业数量增长
+        """
+        self.client.force_authenticate(user=self.student)
+        small = self._build_course('小课程', 1, 1, 1)
+        big = self._build_course('大课程', 8, 6, 5)
+
+        small_queries, _ = self._count_queries(small)
+        big_queries, data = self._count_queries(big)
+
+        self.assertEqual(small_queries, big_queries)
+        self.assertEqual(len(data['modules']), 8)
+        self.assertEqual(data['like_count'], 1)
+        self.assertTrue(data['is_liked'])
+        self.assertFalse(data['is_favorited'])
+        self.assertEqual(data['assignments'][0]['my_submission']['content'], 'answer')
+
+
+class CourseCounterTests(APITestCase):
+
+    def setUp(self):
+        self.instructor = CustomUser.objects.create_user(
+            username='counter_instructor', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        self.student = CustomUser.objects.create_user(username='counter_student', password='password123')
+        self.course = Course.objects.create(title='计数课程', description='desc', instructor=self.instructor)
+
+    def test_toggle_views_and_enrollment_maintain_counters(self):
+        """
+        点赞/收藏/报名应同步维护课程上的冗余计数，重算命令可修复漂移
+        """
+        self.client.force_authenticate(user=self.student)
+        like_url = reverse('course-like-toggle', kwargs={'course_id': self.course.id})
+        favorite_url = reverse('course-favorite-toggle', kwargs={'course_id': self.course.id})
+
+        response = self.client.post(like_url)
+        self.assertEqual(response.data, {'liked': True, 'like_count': 1})
+        self.client.post(favorite_url)
+        Enrollment.objects.create(student=self.student, course=self.course)
+
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.like_count, self.course.favorite_count, self.course.enrollment_count), (1, 1, 1))
+
+        response = self.client.post(like_url)
+        self.assertEqual(response.data, {'liked': False, 'like_count': 0})
+
+        # 后台编辑走 m2m 管理器，由信号兜底
+        self.course.likes.add(self.instructor)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.like_count, 1)
+
+        Course.objects.filter(pk=self.course.pk).update(like_count=99, favorite_count=0, enrollment_count=7)
+        call_command('recompute_course_counters', stdout=StringIO())
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.like_count, self.course.favorite_count, self.course.enrollment_count), (1, 1, 1))
+
+
+class CourseViewBufferTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        view_counter.reset_buffer()
+        self.addCleanup(view_counter.reset_buffer)
+        self.course = Course.objects.create(title='观看课程', description='desc')
+
+    def test_unbuffered_views_update_database(self):
+        """
+        未配置共享缓冲时直接写库；不存在的课程返回 404 且不写入任何计数
+        """
+        url = reverse('course-record-view', kwargs={'pk': self.course.id})
+        self.client.post(url)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.view_count, 1)
+        response = self.client.post(reverse('course-record-view', kwargs={'pk': self.course.id + 1000}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(COURSE_VIEW_BUFFER={'BACKEND': 'core.view_counter.InMemoryViewBuffer'})
+    def test_record_view_is_buffered_until_flush(self):
+        """
+        观看次数先写入缓存，popular 可见未落库的增量，刷新后写回数据库
+        """
+        url = reverse('course-record-view', kwargs={'pk': self.course.id})
+        for _ in range(3):
+            self.assertEqual(self.client.post(url).status_code, status.HTTP_200_OK)
+
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.view_count, 0)
+        response = self.client.get(reverse('course-popular'))
+        self.assertEqual(response.json()[0]['view_count'], 3)
+
+        call_command('flush_course_views', stdout=StringIO())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.view_count, 3)
+        self.assertEqual(get_pending_views([self.course.id]), {})
+
+    def test_redis_take_tolerates_concurrent_flush(self):
+        """
+        另一轮 flush 已把 pending 改名时 RENAMENX 报 no such key，视为没有可取的增量
+        """
+        import redis
+        client = mock.Mock()
+        client.renamenx.side_effect = redis.ResponseError('no such key')
+        client.hgetall.return_value = {}
+        with mock.patch('redis.Redis.from_url', return_value=client):
+            buffer = view_counter.RedisViewBuffer()
+        self.assertEqual(buffer.take(), {})
+        client.renamenx.assert_called_once_with(buffer.pending_key, buffer.processing_key)
+
+
+class HomepageRailTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.course = Course.objects.create(title='榜单课程', description='desc')
+
+    def test_rails_are_served_from_cache_and_invalidated_on_change(self):
+        """
+        榜单命中缓存时不访问数据库，新建课程后榜单失效并重建
+        """
+        url = reverse('course-newest')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual([c['id'] for c in response.json()], [self.course.id])
+
+        newer = Course.objects.create(title='新课程', description='desc')
+        response = self.client.get(url)
+        self.assertEqual(response.json()[0]['id'], newer.id)
+
+    def test_unknown_category_is_not_cached(self):
+        """
+        不存在的分类返回空榜单且不产生缓存条目；新建分类后可正常查询
+        """
+        url = reverse('course-newest')
+        self.client.get(url)
+        self.assertEqual(self.client.get(url, {'category': 'no-such-slug'}).json(), [])
+        self.assertFalse([key for key in cache._cache if 'no-such-slug' in key])
+
+        category = Category.objects.create(name='榜单分类', slug='no-such-slug')
+        Course.objects.filter(pk=self.course.pk).update(category=category)
+        self.assertEqual([c['id'] for c in self.client.get(url, {'category': 'no-such-slug'}).json()], [self.course.id])
+
+    def test_rail_file_urls_use_site_url(self):
+        """
+        配置 SITE_URL 时榜单中的封面为绝对地址，未配置时为相对路径
+        """
+        Course.objects.filter(pk=self.course.pk).update(cover_image='course_covers/rail.png')
+        with self.settings(SITE_URL='https://api.example.com'):
+            self.assertEqual(
+                json.loads(rails.build_rail('newest'))[0]['cover_image'],
+                'https://api.example.com/media/course_covers/rail.png'
+            )
+        with self.settings(SITE_URL=''):
+            self.assertEqual(json.loads(rails.build_rail('newest'))[0]['cover_image'], '/media/course_covers/rail.png')
+
+
+class SparseFieldsetTests(APITestCase):
+
+    def setUp(self):
+        self.instructor = CustomUser.objects.create_user(
+            username='card_instructor', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        Course.objects.create(title='名片课程', description='desc', instructor=self.instructor)
+
+    def test_course_list_uses_user_card_and_supports_fields_param(self):
+        """
+        课程列表中的讲师只返回名片字段，?fields= 可裁剪返回字段
+        """
+        response = self.client.get(reverse('course-list'))
+        self.assertEqual(
+            set(response.data['results'][0]['instructor']), {'id', 'username', 'nickname', 'avatar'}
+        )
+
+        response = self.client.get(reverse('course-list'), {'fields': 'id,title'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+
+class CourseSearchTests(APITestCase):
+
+    def setUp(self):
+        self.instructor = CustomUser.objects.create_user(
+            username='search_teacher', password='password123', nickname='王老师', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        self.ml = Course.objects.create(title='机器学习入门', description='从零开始', instructor=self.instructor)
+        self.web = Course.objects.create(title='Django Web 开发', description='介绍机器学习部署')
+        module = Module.objects.create(course=self.web, title='第一章')
+        Lesson.objects.create(module=module, title='Kubernetes 实战')
+
+    def test_search_ranks_and_highlights_cjk_and_prefix_queries(self):
+        """
+        中文按二元组检索，标题命中排在描述命中之前，支持前缀联想与课时标题、讲师检索
+        """
+        url = reverse('course-search')
+        response = self.client.get(url, {'q': '机器学习'})
+        self.assertEqual([c['id'] for c in response.data], [self.ml.id, self.web.id])
+        self.assertEqual(response.data[0]['highlight']['title'], '<mark>机器学习</mark>入门')
+
+        response = self.client.get(url, {'q': 'kube'})
+        self.assertEqual([c['id'] for c in response.data], [self.web.id])
+
+        response = self.client.get(url, {'q': '王老师'})
+        self.assertEqual([c['id'] for c in response.data], [self.ml.id])
+
+        self.ml.delete()
+        response = self.client.get(reverse('course-list'), {'search': '机器学习'})
+        self.assertEqual([c['id'] for c in response.data['results']], [self.web.id])
+
+    def test_single_cjk_symbols_and_broad_filters(self):
+        """
+        单个汉字、带符号与重音的查询退回 icontains；列表筛选以子查询执行，不受命中数量限制
+        """
+        cpp = Course.objects.create(title='C++ 程序设计', description='Café 指针')
+        url = reverse('course-list')
+        response = self.client.get(url, {'search': '学'})
+        self.assertEqual({c['id'] for c in response.data['results']}, {self.ml.id, self.web.id})
+        response = self.client.get(url, {'search': 'C++'})
+        self.assertEqual([c['id'] for c in response.data['results']], [cpp.id])
+        response = self.client.get(reverse('course-search'), {'q': 'café'})
+        self.assertEqual([c['id'] for c in response.data], [cpp.id])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'search': '机器学习'})
+        self.assertEqual(response.data['count'], 2)
+        self.assertTrue(all('MATCH' in q['sql'] for q in ctx.captured_queries if 'core_course' in q['sql']))
+
+
+class CursorPaginationTests(APITestCase):
+
+    def setUp(self):
+        self.sender = CustomUser.objects.create_user(username='cursor_sender', password='password123')
+        self.receiver = CustomUser.objects.create_user(username='cursor_receiver', password='password123')
+        for i in range(25):
+            Message.objects.create(sender=self.sender, receiver=self.receiver, content=f'消息 {i}')
+
+    def test_inbox_supports_opt_in_cursor_pagination(self):
+        """
+        默认仍为页码分页；?pagination=cursor 时改为游标分页，逐页不重复不遗漏
+        """
+        self.client.force_authenticate(user=self.receiver)
+        url = reverse('message-inbox')
+
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 25)
+
+        response = self.client.get(url, {'pagination': 'cursor'})
+        self.assertNotIn('count', response.data)
+        first_page = [m['id'] for m in response.data['results']]
+        response = self.client.get(response.data['next'])
+        second_page = [m['id'] for m in response.data['results']]
+
+        self.assertEqual(len(first_page), 20)
+        self.assertEqual(len(second_page), 5)
+        self.assertEqual(first_page + second_page, sorted(first_page + second_page, reverse=True))
+        self.assertIsNone(response.data['next'])
+
+
+class LessonVideoRangeTests(APITestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        os.makedirs(os.path.join(self.media_root, 'lesson_videos_mp4'))
+        with open(os.path.join(self.media_root, 'lesson_videos_mp4', 'demo.mp4'), 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+
+        self.instructor = CustomUser.objects.create_user(
+            username='video_instructor', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        self.student = CustomUser.objects.create_user(username='video_student', password='password123')
+        self.outsider = CustomUser.objects.create_user(username='video_outsider', password='password123')
+        course = Course.objects.create(title='视频课程', description='desc', instructor=self.instructor)
+        module = Module.objects.create(course=course, title='章节')
+        self.lesson = Lesson.objects.create(module=module, title='视频', video_mp4_file='lesson_videos_mp4/demo.mp4')
+        Enrollment.objects.create(student=self.student, course=course)
+        self.url = reverse('lesson-video', kwargs={'lesson_id': self.lesson.id})
+
+    def test_range_requests_and_permissions(self):
+        """
+        已报名学生可按 Range 分段获取视频，未报名用户被拒绝
+        """
+        with self.settings(MEDIA_ROOT=self.media_root):
+            self.client.force_authenticate(user=self.outsider)
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+            self.client.force_authenticate(user=self.student)
+            response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+            self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+            etag = response['ETag']
+            response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+            self.assertEqual(response.status_code, 200)
+            response.close()
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+            self.assertEqual(response.status_code, 416)
+
+    def test_signed_url_is_scoped_to_lesson(self):
+        """
+        播放地址使用课时签名而非账号 Token；签名不能用于其他课时，过期后失效
+        """
+        other = Lesson.objects.create(
+            module=self.lesson.module, title='另一个视频', video_mp4_file='lesson_videos_mp4/demo.mp4'
+        )
+        self.client.force_authenticate(user=self.outsider)
+        self.assertEqual(self.client.get(reverse('lesson-video-url', args=[self.lesson.id])).status_code, 403)
+
+        self.client.force_authenticate(user=self.student)
+        url = self.client.get(reverse('lesson-video-url', args=[self.lesson.id])).data['mp4']
+        self.assertNotIn(Token.objects.get_or_create(user=self.student)[0].key, url)
+        signature = url.split('sig=')[1]
+        self.client.force_authenticate(user=None)
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            response.close()
+            other_url = reverse('lesson-video', kwargs={'lesson_id': other.id})
+            self.assertEqual(self.client.get(other_url, {'sig': signature}).status_code, 401)
+            token = Token.objects.get(user=self.student).key
+            self.assertEqual(self.client.get(self.url, {'token': token}).status_code, 401)
+            with self.settings(LESSON_MEDIA_URL_TTL=-1):
+                self.assertEqual(self.client.get(url).status_code, 401)
+
+
+@override_settings(HLS_TRANSCODER='core.transcoding.FakeTranscoder')
+class VideoTranscodeTests(APITestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.hls_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.hls_root)
+        self.source = os.path.join(self.media_root, 'source.mp4')
+        with open(self.source, 'wb') as f:
+            f.write(b'fake mp4')
+
+        course = Course.objects.create(title='转码课程', description='desc')
+        module = Module.objects.create(course=course, title='章节')
+        self.lesson = Lesson.objects.create(module=module, title='视频', content='视频正在处理中...')
+
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+    def test_pipeline_writes_master_playlist_and_is_idempotent(self):
+        """
+        转码生成各档位与 master.m3u8，更新课时时长/封面/进度，重复执行结果不变
+        """
+        with self.settings(MEDIA_ROOT=self.media_root, HLS_ROOT=self.hls_root):
+            process_video_upload.apply(args=(self.lesson.id, self.source))
+            self.lesson.refresh_from_db()
+            self.assertEqual(self.lesson.transcode_status, Lesson.TRANSCODE_READY)
+            self.assertEqual(self.lesson.transcode_progress, 100)
+            self.assertEqual(self.lesson.video_duration, 15.0)
+            self.assertEqual(self.lesson.video_poster, f'/media/lesson_posters/{self.lesson.id}.jpg')
+            self.assertIsNone(self.lesson.video_m3u8_url)
+
+            hls_dir = os.path.join(self.hls_root, str(self.lesson.id))
+            with open(os.path.join(hls_dir, 'master.m3u8')) as f:
+                master = f.read()
+            self.assertIn('360p/index.m3u8', master)
+            self.assertIn('720p/index.m3u8', master)
+            self.assertNotIn('1080p', master)
+            self.assertEqual(len([n for n in os.listdir(os.path.join(hls_dir, '720p')) if n.endswith('.ts')]), 3)
+
+            process_video_upload.apply(args=(self.lesson.id, self.source))
+            with open(os.path.join(hls_dir, 'master.m3u8')) as f:
+                self.assertEqual(f.read(), master)
+
+    def test_hls_is_served_only_with_lesson_signature(self):
+        """
+        HLS 输出不在 MEDIA_ROOT 下；播放列表与分片只能通过签名路径访问，签名限定课时，不能越出课时目录
+        """
+        student = CustomUser.objects.create_user(username='hls_student', password='password123')
+        Enrollment.objects.create(student=student, course=self.lesson.module.course)
+        self.client.force_authenticate(user=student)
+        with self.settings(MEDIA_ROOT=self.media_root, HLS_ROOT=self.hls_root):
+            process_video_upload.apply(args=(self.lesson.id, self.source))
+            self.assertFalse(os.path.exists(os.path.join(self.media_root, 'lesson_hls')))
+
+            master_url = self.client.get(reverse('lesson-video-url', args=[self.lesson.id])).data['hls']
+            response = self.client.get(master_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/vnd.apple.mpegurl')
+            self.assertIn('720p/index.m3u8', b''.join(response.streaming_content).decode())
+
+            segment_url = master_url.replace('master.m3u8', '720p/seg_00000.ts')
+            response = self.client.get(segment_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'video/mp2t')
+
+            self.client.force_authenticate(user=None)
+            self.assertEqual(self.client.get(segment_url).status_code, 200)
+            self.assertEqual(self.client.get(segment_url.replace('/hls/', '/hls/x')).status_code, 403)
+            other = Lesson.objects.create(module=self.lesson.module, title='其他')
+            signature = segment_url.split('/hls/')[1].split('/')[0]
+            other_url = reverse('lesson-hls', args=[other.id, signature, 'master.m3u8'])
+            self.assertEqual(self.client.get(other_url).status_code, 403)
+            escape_url = reverse('lesson-hls', args=[self.lesson.id, signature, '../../secret'])
+            self.assertEqual(self.client.get(escape_url).status_code, 404)
+
+
+@override_settings(HLS_TRANSCODER='core.transcoding.FakeTranscoder')
+class ResumableUploadTests(APITestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', False)
+
+        self.instructor = CustomUser.objects.create_user(
+            username='upload_instructor', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        course = Course.objects.create(title='上传课程', description='desc', instructor=self.instructor)
+        self.module = Module.objects.create(course=course, title='章节')
+        self.client.force_authenticate(user=self.instructor)
+
+    def _patch(self, url, offset, data, **extra):
+        return self.client.generic(
+            'PATCH', url, data, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset), **extra
+        )
+
+    def test_chunked_upload_resumes_and_creates_lesson(self):
+        """
+        分片按偏移量追加，偏移量不一致返回 409，可通过 HEAD 续传，完成后生成课时并转码
+        """
+        payload = os.urandom(3000)
+        with self.settings(MEDIA_ROOT=self.media_root, HLS_ROOT=os.path.join(self.media_root, 'hls')):
+            response = self.client.post(reverse('lesson-upload-list'), {
+                'module': self.module.id, 'title': '分片视频', 'filename': 'demo.mp4',
+                'total_size': len(payload), 'checksum': hashlib.sha256(payload).hexdigest(),
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            url = response['Location']
+
+            digest = base64.b64encode(hashlib.sha256(payload[:1000]).digest()).decode()
+            response = self._patch(url, 0, payload[:1000], HTTP_UPLOAD_CHECKSUM=f'sha256 {digest}')
+            self.assertEqual(response['Upload-Offset'], '1000')
+
+            response = self._patch(url, 0, payload[:1000])
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+            response = self.client.head(url)
+            self.assertEqual(response['Upload-Offset'], '1000')
+
+            response = self._patch(url, 1000, payload[1000:])
+            self.assertEqual(response.data['status'], UploadSession.STATUS_COMPLETED)
+
+            lesson = Lesson.objects.get(pk=response.data['lesson'])
+            with open(lesson.video_mp4_file.path, 'rb') as f:
+                self.assertEqual(f.read(), payload)
+            self.assertEqual(lesson.transcode_status, Lesson.TRANSCODE_READY)
+
+    def test_offset_is_claimed_before_writing_and_stale_uploads_are_cleaned(self):
+        """
+        其他请求正在写入时返回 409 且不写入数据；过期会话与孤儿临时文件被定时清理
+        """
+        with self.settings(MEDIA_ROOT=self.media_root):
+            response = self.client.post(reverse('lesson-upload-list'), {
+                'module': self.module.id, 'title': '并发分片', 'filename': 'demo.mp4', 'total_size': 100,
+            }, format='json')
+            url = response['Location']
+            session = UploadSession.objects.get(pk=response.data['id'])
+            self.assertTrue(uploads.claim(session, 0))
+
+            response = self._patch(url, 0, b'x' * 50)
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            with open(os.path.join(self.media_root, session.partial_name), 'rb') as f:
+                self.assertEqual(f.read(), b'')
+
+            uploads.release(session, 0, 0)
+            response = self._patch(url, 0, b'x' * 50)
+            self.assertEqual(response['Upload-Offset'], '50')
+
+            orphan = os.path.join(self.media_root, uploads.PARTIAL_DIR, 'orphan.part')
+            open(orphan, 'wb').close()
+            os.utime(orphan, (0, 0))
+            UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now() - timedelta(days=2))
+            self.assertEqual(uploads.cleanup_expired(), 2)
+            self.assertFalse(UploadSession.objects.filter(pk=session.pk).exists())
+            self.assertEqual(os.listdir(os.path.join(self.media_root, uploads.PARTIAL_DIR)), [])
+
+    def test_retry_while_completing_does_not_complete_twice(self):
+        """
+        最后一个分片写完、仍在校验文件时重试的请求返回 409，上传只完成一次
+        """
+        payload = b'x' * 100
+        with self.settings(MEDIA_ROOT=self.media_root, HLS_ROOT=os.path.join(self.media_root, 'hls')):
+            response = self.client.post(reverse('lesson-upload-list'), {
+                'module': self.module.id, 'title': '重试分片', 'filename': 'demo.mp4', 'total_size': len(payload),
+            }, format='json')
+            url = response['Location']
+
+            retries = []
+            finalize = uploads.finalize
+
+            def finalize_with_retry(session):
+                retries.append(self._patch(url, len(payload), b''))
+                return finalize(session)
+
+            with mock.patch.object(uploads, 'finalize', side_effect=finalize_with_retry):
+                response = self._patch(url, 0, payload)
+            self.assertEqual(response.data['status'], UploadSession.STATUS_COMPLETED)
+            self.assertEqual(retries[0].status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(Lesson.objects.filter(title='重试分片').count(), 1)
+
+            response = self._patch(url, len(payload), b'')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['lesson'], Lesson.objects.get(title='重试分片').id)
+
+
+class ConversationSummaryTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username='conv_alice', password='password123')
+        self.bob = CustomUser.objects.create_user(username='conv_bob', password='password123')
+        self.carol = CustomUser.objects.create_user(username='conv_carol', password='password123')
+
+    def test_conversations_track_last_message_and_unread(self):
+        """
+        会话列表按最近消息排序并返回未读数，打开对话后未读清零
+        """
+        Message.objects.create(sender=self.bob, receiver=self.alice, content='你好')
+        Message.objects.create(sender=self.bob, receiver=self.alice, content='在吗')
+        Message.objects.create(sender=self.alice, receiver=self.carol, content='作业写完了吗')
+
+        self.client.force_authenticate(user=self.alice)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('message-conversations'))
+        results = response.data['results']
+        self.assertEqual([c['peer']['id'] for c in results], [self.carol.id, self.bob.id])
+        self.assertEqual(results[1]['last_message_preview'], '在吗')
+        self.assertEqual(results[1]['unread_count'], 2)
+        self.assertEqual(self.client.get(reverse('message-unread')).data, {'unread': 2})
+
+        self.client.get(reverse('message-history'), {'target_id': self.bob.id})
+        self.assertEqual(self.client.get(reverse('message-unread')).data, {'unread': 0})
+
+    def test_message_to_self_is_not_unread(self):
+        """
+        发给自己的消息只更新会话摘要，不增加未读数 (按消息表重建时同样不计)
+        """
+        Message.objects.create(sender=self.alice, receiver=self.alice, content='备忘')
+        conversation = Conversation.objects.get(owner=self.alice, peer=self.alice)
+        self.assertEqual(conversation.last_message_preview, '备忘')
+        self.assertEqual(conversation.unread_count, 0)
+
+        Conversation.rebuild(self.alice.id, self.alice.id)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.unread_count, 0)
+
+
+class MessageHistoryTests(APITestCase):
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username='history_alice', password='password123')
+        self.bob = CustomUser.objects.create_user(username='history_bob', password='password123')
+        self.messages = [
+            Message.objects.create(sender=self.bob, receiver=self.alice, content=f'消息 {i}') for i in range(7)
+        ]
+        self.client.force_authenticate(user=self.alice)
+        self.url = reverse('message-history')
+
+    def test_history_pages_backwards_and_syncs_forwards(self):
+        """
+        默认返回最近的消息，before 向前翻页，since_id 增量同步，已读标记到返回的最新一条为止
+        """
+        response = self.client.get(self.url, {'target_id': self.bob.id, 'limit': 3})
+        self.assertEqual([m['content'] for m in response.data], ['消息 4', '消息 5', '消息 6'])
+        self.assertEqual(response['X-Has-More'], '1')
+
+        response = self.client.get(self.url, {'target_id': self.bob.id, 'limit': 3, 'before': response.data[0]['id']})
+        self.assertEqual([m['content'] for m in response.data], ['消息 1', '消息 2', '消息 3'])
+
+        new = Message.objects.create(sender=self.bob, receiver=self.alice, content='新消息')
+        unread = Message.objects.filter(receiver=self.alice, is_read=False)
+        self.assertEqual(list(unread.values_list('id', flat=True)), [new.id])
+
+        response = self.client.get(self.url, {'target_id': self.bob.id, 'since_id': self.messages[-1].id})
+        self.assertEqual([m['id'] for m in response.data], [new.id])
+        self.assertEqual(response['X-Has-More'], '0')
+        self.assertFalse(unread.exists())
+
+
+@override_settings(REALTIME_CHANNEL_LAYER={'BACKEND': 'core.realtime.InMemoryChannelLayer'}, REALTIME_ENABLED=True)
+class RealtimePushTests(APITestCase):
+
+    def setUp(self):
+        realtime.reset_channel_layer()
+        self.alice = CustomUser.objects.create_user(username='push_alice', password='password123')
+        self.bob = CustomUser.objects.create_user(username='push_bob', password='password123')
+        self.token = Token.objects.create(user=self.alice)
+        self.url = reverse('realtime-stream')
+
+    def tearDown(self):
+        realtime.reset_channel_layer()
+
+    def _bob_sends_message(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(sender=self.bob, receiver=self.alice, content='在吗')
+
+    async def test_stream_pushes_new_message(self):
+        """
+        SSE 连接订阅当前用户的频道，事务提交后推送新私信
+        """
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        # 账号 Token 不再接受放在 URL 中
+        response = await self.async_client.get(self.url, {'token': self.token.key})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        ticket = realtime.issue_ticket(self.alice.id)
+        response = await self.async_client.get(self.url, {'ticket': ticket})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+
+        await sync_to_async(self._bob_sends_message)()
+        frame = (await asyncio.wait_for(anext(stream), 2)).decode()
+        self.assertIn('event: message.new', frame)
+        self.assertIn('在吗', frame)
+        await stream.aclose()
+
+    def test_stream_requires_asgi_and_issues_tickets(self):
+        """
+        WSGI 下推送流返回 501 而不是挂起；票据接口需要登录，未开启推送时返回 501
+        """
+        ticket = realtime.issue_ticket(self.alice.id)
+        self.assertEqual(self.client.get(self.url, {'ticket': ticket}).status_code, 501)
+
+        self.assertEqual(self.client.post(reverse('realtime-ticket')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(user=self.alice)
+        response = self.client.post(reverse('realtime-ticket'))
+        self.assertEqual(realtime.check_ticket(response.data['ticket']), self.alice.id)
+        with self.settings(REALTIME_TICKET_TTL=-1):
+            self.assertIsNone(realtime.check_ticket(response.data['ticket']))
+        with self.settings(REALTIME_ENABLED=False):
+            self.assertEqual(self.client.post(reverse('realtime-ticket')).status_code, 501)
+
+    def test_friend_request_and_grading_events(self):
+        """
+        好友申请、申请通过、作业批改结果变化时分别通知对应用户
+        """
+        layer = realtime.get_channel_layer()
+        with mock.patch.object(layer, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                friendship = Friendship.objects.create(from_user=self.bob, to_user=self.alice)
+                friendship.status = Friendship.STATUS_ACCEPTED
+                friendship.save()
+                # 只有 pending -> accepted 才推送，之后再次保存不重复通知
+                friendship.save()
+                rejected = Friendship.objects.create(
+                    from_user=self.alice, to_user=CustomUser.objects.create_user(username='push_carol'),
+                    status=Friendship.STATUS_REJECTED
+                )
+                rejected.status = Friendship.STATUS_ACCEPTED
+                rejected.save()
+
+                instructor = CustomUser.objects.create_user(
+                    username='push_teacher', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+                )
+                course = Course.objects.create(title='推送测试课程', description='desc', instructor=instructor)
+                assignment = Assignment.objects.create(course=course, title='作业一')
+                submission = Submission.objects.create(assignment=assignment, student=self.alice, content='答案')
+                submission.status, submission.grade = Submission.STATUS_PASSED, 90
+                submission.save()
+                # 批改结果未变化时不重复推送
+                submission.save()
+
+        events = [(channel, json.loads(raw)['type']) for (channel, raw), _ in publish.call_args_list]
+        self.assertEqual(events, [
+            (realtime.CHANNEL_NAME.format(self.alice.id), realtime.EVENT_FRIEND_REQUEST),
+            (realtime.CHANNEL_NAME.format(self.bob.id), realtime.EVENT_FRIEND_ACCEPTED),
+            (realtime.CHANNEL_NAME.format(self.alice.id), realtime.EVENT_SUBMISSION_GRADED),
+        ])
+
+
+class FriendGraphTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.me = CustomUser.objects.create_user(username='graph_me', password='password123')
+        self.others = [
+            CustomUser.objects.create_user(username=f'graph_user{i}', password='password123') for i in range(4)
+        ]
+        Friendship.objects.create(from_user=self.me, to_user=self.others[0], status=Friendship.STATUS_ACCEPTED)
+        Friendship.objects.create(from_user=self.me, to_user=self.others[1])
+        self.incoming = Friendship.objects.create(from_user=self.others[2], to_user=self.me)
+        self.client.force_authenticate(user=self.me)
+
+    def test_search_resolves_statuses_in_one_query(self):
+        """
+        搜索结果的好友状态由一次邻接查询批量解析，好友关系变化后缓存失效
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user-search'), {'q': 'graph_user'})
+        self.assertEqual(sum('core_friendship' in q['sql'] for q in queries.captured_queries), 1)
+        statuses = {u['username']: u['friendship_status'] for u in response.data}
+        self.assertEqual(statuses, {
+            'graph_user0': 'friend', 'graph_user1': 'sent', 'graph_user2': 'received', 'graph_user3': 'none',
+        })
+
+        response = self.client.post(reverse('friendship-accept', args=[self.incoming.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse('friendship-friends'))
+        self.assertEqual([u['username'] for u in response.data], ['graph_user0', 'graph_user2'])
+
+        response = self.client.post(reverse('message-list'), {'receiver_username': 'graph_user2', 'content': '你好'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('message-list'), {'receiver_username': 'graph_user1', 'content': '你好'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_messaging_permission_ignores_stale_adjacency_cache(self):
+        """
+        其他进程中残留的旧邻接缓存只影响展示，发私信前的好友校验以数据库为准
+        """
+        stale = friend_graph.get_adjacency(self.me.id)
+        Friendship.objects.filter(to_user=self.others[0]).update(status=Friendship.STATUS_REJECTED)
+        cache.set(friend_graph.ADJACENCY_KEY.format(self.me.id), stale)
+
+        self.assertFalse(friend_graph.are_friends(self.me.id, self.others[0].id))
+        response = self.client.post(reverse('message-list'), {'receiver_username': 'graph_user0', 'content': '你好'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class UserSearchIndexTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.me = CustomUser.objects.create_user(username='lookup_me', password='password123')
+        self.zhang = CustomUser.objects.create_user(username='zsf', nickname='张三丰', password='password123')
+        self.alpha = CustomUser.objects.create_user(username='alphacoder', password='password123')
+        self.beta = CustomUser.objects.create_user(username='betacoder', nickname='Alpha Fan', password='password123')
+        self.client.force_authenticate(user=self.me)
+
+    def test_prefix_and_infix_lookup(self):
+        """
+        用户名前缀优先于昵称与中间片段，中文昵称可按片段搜索，改名后索引同步更新
+        """
+        response = self.client.get(reverse('user-search'), {'q': 'Alpha'})
+        self.assertEqual([u['username'] for u in response.data], ['alphacoder', 'betacoder'])
+
+        response = self.client.get(reverse('user-typeahead'), {'q': '三丰'})
+        self.assertEqual([u['username'] for u in response.data], ['zsf'])
+
+        response = self.client.get(reverse('user-search'), {'q': 'lookup'})
+        self.assertEqual(response.data, [])
+
+        self.zhang.nickname = '张无忌'
+        self.zhang.save(update_fields=['nickname'])
+        self.assertFalse(UserSearchTerm.objects.filter(user=self.zhang, term='三丰').exists())
+        response = self.client.get(reverse('user-search'), {'q': str(self.zhang.id)})
+        self.assertEqual(response.data[0]['username'], 'zsf')
+
+    def test_infix_terms_are_capped_and_long_queries_verified(self):
+        """
+        中间片段检索词截断为 MAX_INFIX_LENGTH 个字符 (数量与名称长度线性相关)，
+        更长的中间片段查询核对完整名称，不返回只有前缀相同的用户
+        """
+        long_user = CustomUser.objects.create_user(username='x' + 'averyverylongusername', password='password123')
+        CustomUser.objects.create_user(username='yaveryveryshort', password='password123')
+        terms = UserSearchTerm.objects.filter(user=long_user, weight=UserSearchTerm.WEIGHT_INFIX)
+        self.assertEqual(terms.count(), len(long_user.username) - 1)
+        self.assertTrue(all(len(term.term) <= user_search.MAX_INFIX_LENGTH for term in terms))
+
+        response = self.client.get(reverse('user-search'), {'q': 'averyverylong'})
+        self.assertEqual([u['username'] for u in response.data], [long_user.username])
+
+
+class PointsLedgerTests(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='ledger_user', password='password123')
+        self.other = CustomUser.objects.create_user(username='ledger_other', password='password123')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('points-add-points')
+
+    def test_idempotent_award_and_batch(self):
+        """
+        相同幂等键重复提交只加一次分；批量事件一次入账并在 SQL 中计算等级与连续天数
+        """
+        for _ in range(2):
+            response = self.client.post(self.url, {'action': 'submit'}, HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(response.data['total_points'], 10)
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(PointRecord.objects.filter(user=self.user).count(), 1)
+        for key in (123, ['retry-1'], 'k' * 65):
+            response = self.client.post(self.url, {'action': 'submit', 'idempotency_key': key}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # 昨天活跃过：连续天数 +1
+        UserPoints.objects.filter(user=self.user).update(
+            last_active_date=timezone.localdate() - timedelta(days=1), continuous_days=3
+        )
+        events = [
+            {'user_id': self.user.id, 'action': 'watch', 'points': 95, 'idempotency_key': 'lesson-1'},
+            {'user_id': self.user.id, 'action': 'watch', 'points': 95, 'idempotency_key': 'lesson-1'},
+            {'user_id': self.other.id, 'action': 'comment'},
+            {'user_id': self.other.id, 'action': 'comment'},
+        ]
+        self.assertEqual(award_batch(events), 3)
+        self.assertEqual(award_batch(events[:1]), 0)
+
+        mine = UserPoints.objects.get(user=self.user)
+        self.assertEqual((mine.total_points, mine.level, mine.continuous_days), (105, 2, 4))
+        theirs = UserPoints.objects.get(user=self.other)
+        self.assertEqual((theirs.total_points, theirs.level, theirs.continuous_days), (6, 1, 1))
+
+
+class BadgeEngineTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='badge_user', password='password123')
+        self.other = CustomUser.objects.create_user(username='badge_other', password='password123')
+        self.first_steps = Badge.objects.create(name='起步', description='d', condition_type='points', condition_value=10)
+        self.veteran = Badge.objects.create(name='老兵', description='d', condition_type='points', condition_value=100)
+        self.streak = Badge.objects.create(name='坚持', description='d', condition_type='continuous_days', condition_value=1)
+        self.client.force_authenticate(user=self.user)
+
+    def test_cached_rules_and_backfill(self):
+        """
+        规则缓存后加分不再查询勋章表；新增勋章使缓存失效，并可通过命令批量补发
+        """
+        url = reverse('points-add-points')
+        self.client.post(url, {'action': 'submit'})
+        self.assertEqual(
+            set(UserBadge.objects.filter(user=self.user).values_list('badge_id', flat=True)),
+            {self.first_steps.id, self.streak.id}
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url, {'action': 'login'})
+        self.assertFalse(any('"core_badge"' in q['sql'] for q in queries.captured_queries))
+
+        UserPoints.objects.create(user=self.other, total_points=150, level=2)
+        newcomer = Badge.objects.create(name='新人', description='d', condition_type='level', condition_value=2)
+        out = StringIO()
+        call_command('backfill_badges', chunk_size=1, stdout=out)
+        self.assertIn('已补发 3 枚勋章', out.getvalue())
+        self.assertEqual(
+            set(UserBadge.objects.filter(user=self.other).values_list('badge_id', flat=True)),
+            {self.first_steps.id, self.veteran.id, newcomer.id}
+        )
+
+    def test_rules_reload_after_version_key_is_evicted(self):
+        """
+        版本号被缓存淘汰后再修改勋章，新版本号不会与进程记住的旧版本号相同
+        """
+        cache.delete(badges.RULES_VERSION_KEY)
+        self.assertNotIn('level', badges.get_rules())
+        cache.delete(badges.RULES_VERSION_KEY)
+        newcomer = Badge.objects.create(name='新人', description='d', condition_type='level', condition_value=1)
+        self.assertEqual(badges.get_rules()['level'], ([1], [newcomer.id]))
+
+
+@override_settings(LEADERBOARD_STORE={'BACKEND': 'core.leaderboard.InMemoryLeaderboardStore'})
+class LeaderboardTests(APITestCase):
+
+    def setUp(self):
+        leaderboard.reset_store()
+        self.users = [
+            CustomUser.objects.create_user(username=f'rank_user{i}', password='password123') for i in range(3)
+        ]
+        self.category = Category.objects.create(name='排行测试分类')
+        self.url = reverse('leaderboard')
+
+    def tearDown(self):
+        leaderboard.reset_store()
+
+    def test_rankings_follow_awards_and_reconcile(self):
+        """
+        加分后总榜/周榜/分类榜即时更新，对账按数据库纠正偏差
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            award_batch([
+                {'user_id': self.users[0].id, 'action': 'watch', 'points': 30},
+                {'user_id': self.users[1].id, 'action': 'watch', 'points': 50, 'category_id': self.category.id},
+                {'user_id': self.users[2].id, 'action': 'watch', 'points': 10, 'category_id': self.category.id},
+            ])
+
+        self.client.force_authenticate(user=self.users[2])
+        response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual([(e['user']['username'], e['score']) for e in response.data['results']],
+                         [('rank_user1', 50), ('rank_user0', 30)])
+        self.assertEqual(response.data['me'], {'rank': 3, 'score': 10})
+        self.assertEqual(response.data['total'], 3)
+
+        response = self.client.get(self.url, {'board': 'category', 'category': self.category.slug})
+        self.assertEqual([e['user']['username'] for e in response.data['results']], ['rank_user1', 'rank_user2'])
+        self.assertEqual(response.data['me'], {'rank': 2, 'score': 10})
+
+        response = self.client.get(self.url, {'board': 'weekly'})
+        self.assertEqual(response.data['total'], 3)
+
+        # 模拟增量更新丢失后的对账
+        leaderboard.get_store().incr(leaderboard.global_board(), self.users[2].id, 1000)
+        leaderboard.reconcile()
+        self.assertEqual(leaderboard.get_rank(leaderboard.global_board(), self.users[2].id), (3, 10))
+
+    def test_in_memory_store_rebuilds_periodically_and_expires_weekly_boards(self):
+        """
+        进程内榜单定期按数据库重建 (看到其他进程的加分)，周榜过期后被删除；course_id 非整数返回 400
+        """
+        self.assertEqual(leaderboard.get_count(leaderboard.global_board()), 0)
+        # 其他进程加分：本进程收不到增量更新
+        with self.captureOnCommitCallbacks(execute=False):
+            award_batch([{'user_id': self.users[0].id, 'action': 'watch', 'points': 30}])
+        with self.settings(LEADERBOARD_REBUILD_INTERVAL=3600):
+            self.assertEqual(leaderboard.get_count(leaderboard.global_board()), 0)
+        with self.settings(LEADERBOARD_REBUILD_INTERVAL=0):
+            self.assertEqual(leaderboard.get_rank(leaderboard.global_board(), self.users[0].id), (1, 30))
+
+        store = leaderboard.get_store()
+        store.incr('weekly:2000-W01', self.users[0].id, 5, ttl=60)
+        self.assertEqual(sorted(store.boards('weekly:')), ['weekly:2000-W01', leaderboard.weekly_board()])
+        with mock.patch.object(leaderboard.time_module, 'monotonic', return_value=time.monotonic() + 61):
+            self.assertEqual(store.count('weekly:2000-W01'), 0)
+            self.assertEqual(store.boards('weekly:2000'), [])
+
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.post(reverse('points-add-points'), {'action': 'watch', 'course_id': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AnalyticsRollupTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.instructor = CustomUser.objects.create_user(
+            username='rollup_teacher', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        self.course = Course.objects.create(title='汇总课程', description='desc', instructor=self.instructor)
+        self.other_course = Course.objects.create(title='另一门课程', description='desc', instructor=self.instructor)
+        lesson = Lesson.objects.create(module=Module.objects.create(course=self.course, title='章节'), title='课时')
+        assignment = Assignment.objects.create(course=self.course, title='作业')
+        for i in range(3):
+            student = CustomUser.objects.create_user(username=f'rollup_student{i}', password='password123')
+            Enrollment.objects.create(student=student, course=self.course)
+            Comment.objects.create(lesson=lesson, user=student, content='提问')
+        Submission.objects.create(assignment=assignment, student=student, content='答案')
+        Course.objects.filter(pk=self.course.pk).update(view_count=40)
+        self.client.force_authenticate(user=self.instructor)
+
+    def test_incremental_rollup_feeds_dashboard(self):
+        """
+        汇总任务只累加水位线之后的增量，看板接口从每日统计返回区间汇总与序列
+        """
+        later = timezone.now() + timedelta(minutes=5)
+        analytics.rollup(now=later)
+        Course.objects.filter(pk=self.course.pk).update(view_count=45)
+        analytics.rollup(now=later + timedelta(minutes=5))
+        # 没有新数据时重复执行不会重复累加
+        analytics.rollup(now=later + timedelta(minutes=10))
+
+        daily = CourseDailyStat.objects.get(course=self.course)
+        self.assertEqual(
+            (daily.views, daily.enrollments, daily.comments, daily.submissions), (45, 3, 3, 1)
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('instructor-analytics'), {'days': 7, 'course': self.course.id})
+        self.assertFalse(any('core_enrollment' in q['sql'] or 'core_comment' in q['sql']
+                             for q in queries.captured_queries))
+        self.assertEqual(response.data['summary']['views'], 45)
+        self.assertEqual(response.data['summary']['enrollments'], 3)
+        self.assertEqual(len(response.data['series']), 7)
+        self.assertEqual(response.data['total_students'], 3)
+
+        response = self.client.get(reverse('instructor-analytics'), {'days': 30, 'granularity': 'hour'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('instructor-analytics'), {'days': 7, 'course': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ChoiceGradingTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        celery_app.conf.task_always_eager = True
+        self.instructor = CustomUser.objects.create_user(
+            username='grading_teacher', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        course = Course.objects.create(title='测验课程', description='desc', instructor=self.instructor)
+        self.assignment = Assignment.objects.create(
+            course=course, title='单元测验', description='d', assignment_type=Assignment.TYPE_CHOICE,
+            quiz_data=json.dumps([{'answer': 'A'}, {'answer': 'b'}, {'answer': 'C'}])
+        )
+        self.students = [
+            CustomUser.objects.create_user(username=f'grading_student{i}', password='password123') for i in range(2)
+        ]
+
+    def _submit(self, student, answers):
+        self.client.force_authenticate(user=student)
+        return self.client.post(reverse('submission-list'), {
+            'assignment': self.assignment.id, 'content': json.dumps(answers)
+        })
+
+    def test_cached_key_and_bulk_regrade(self):
+        """
+        答案只解析一次；修改答案后全部提交按新答案重新评分
+        """
+        with mock.patch('core.grading.parse_answer_key', wraps=grading.parse_answer_key) as parse:
+            first = self._submit(self.students[0], {'0': 'a', '1': 'B', '2': 'D'})
+            second = self._submit(self.students[1], {'0': 'B', '1': 'B'})
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual((first.data['grade'], first.data['status']), (66, Submission.STATUS_PASSED))
+        self.assertEqual((second.data['grade'], second.data['status']), (33, Submission.STATUS_REJECTED))
+
+        self.client.force_authenticate(user=self.instructor)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('assignment-detail', args=[self.assignment.id]), {
+                'quiz_data': json.dumps([{'answer': 'B'}, {'answer': 'B'}, {'answer': 'C'}])
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        grades = dict(Submission.objects.values_list('student__username', 'grade'))
+        self.assertEqual(grades, {'grading_student0': 33, 'grading_student1': 66})
+
+    def test_regrade_keeps_hand_grades(self):
+        """
+        讲师人工批改过的提交在修改答案后不被重新评分覆盖
+        """
+        first = self._submit(self.students[0], {'0': 'a', '1': 'B', '2': 'D'})
+        self._submit(self.students[1], {'0': 'B', '1': 'B'})
+        self.assertTrue(first.data['auto_graded'])
+
+        self.client.force_authenticate(user=self.instructor)
+        response = self.client.patch(reverse('submission-detail', args=[first.data['id']]), {
+            'grade': 95, 'feedback': '思路很好'
+        })
+        self.assertFalse(response.data['auto_graded'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('assignment-detail', args=[self.assignment.id]), {
+                'quiz_data': json.dumps([{'answer': 'B'}, {'answer': 'B'}, {'answer': 'C'}])
+            })
+
+        grades = dict(Submission.objects.values_list('student__username', 'grade'))
+        self.assertEqual(grades, {'grading_student0': 95, 'grading_student1': 66})
+
+
+class CommentTreeTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        instructor = CustomUser.objects.create_user(
+            username='thread_teacher', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        course = Course.objects.create(title='讨论课程', description='desc', instructor=instructor)
+        module = Module.objects.create(course=course, title='第一章', order=1)
+        self.lesson = Lesson.objects.create(module=module, title='第一节', order=1)
+        self.users = [
+            CustomUser.objects.create_user(username=f'thread_user{i}', password='password123') for i in range(4)
+        ]
+        self.roots = []
+        for i in range(3):
+            root = Comment.objects.create(lesson=self.lesson, user=self.users[i], content=f'主题{i}')
+            self.roots.append(root)
+            for j in range(i * 3):
+                Comment.objects.create(
+                    lesson=self.lesson, user=self.users[j % 4], content=f'回复{i}-{j}',
+                    parent=root, reply_to_user=self.users[i]
+                )
+
+    def test_thread_page_has_bounded_replies_and_fixed_queries(self):
+        """
+        每个主题只带前几条回复与回复总数，查询数与回复数量无关
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('comment-list'), {'lesson_id': self.lesson.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        threads = {item['content']: item for item in response.json()['results']}
+        self.assertEqual([threads[f'主题{i}']['reply_count'] for i in range(3)], [0, 3, 6])
+        self.assertEqual(
+            [reply['content'] for reply in threads['主题2']['replies']], ['回复2-0', '回复2-1', '回复2-2']
+        )
+        self.assertEqual(threads['主题2']['replies'][1]['user']['username'], 'thread_user1')
+        self.assertEqual(threads['主题2']['replies'][0]['reply_to_user']['username'], 'thread_user2')
+        # 分页计数 + 顶级评论 + 回复数 + 回复预览 + 用户名片
+        self.assertEqual(len(ctx.captured_queries), 5)
+
+    def test_replies_endpoint_pages_thread(self):
+        """
+        replies 接口按时间正序分页返回整个主题的回复
+        """
+        url = reverse('comment-replies', args=[self.roots[2].id])
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual([r['content'] for r in response.data['results']], [f'回复2-{j}' for j in range(6)])
+
+        response = self.client.get(url, {'pagination': 'cursor'})
+        self.assertEqual([r['content'] for r in response.data['results']], [f'回复2-{j}' for j in range(6)])
+        self.assertIsNone(response.data['next'])
+
+
+class CommentPageCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        instructor = CustomUser.objects.create_user(
+            username='cache_teacher', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        course = Course.objects.create(title='缓存课程', description='desc', instructor=instructor)
+        module = Module.objects.create(course=course, title='第一章', order=1)
+        self.lesson = Lesson.objects.create(module=module, title='第一节', order=1)
+        self.user = CustomUser.objects.create_user(username='cache_reader', password='password123')
+        self.root = Comment.objects.create(lesson=self.lesson, user=self.user, content='第一条')
+
+    def _list(self, **params):
+        return self.client.get(reverse('comment-list'), {'lesson_id': self.lesson.id, **params})
+
+    def test_cached_page_invalidated_on_write(self):
+        """
+        讨论区首页命中缓存时不查询数据库；发表回复或删除评论后立即可见
+        """
+        first = self._list()
+        with self.assertNumQueries(0):
+            second = self._list()
+        self.assertEqual(json.loads(first.content), json.loads(second.content))
+
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('comment-list'), {
+                'lesson': self.lesson.id, 'content': '一条回复', 'parent': self.root.id
+            })
+        data = json.loads(self._list().content)
+        self.assertEqual(data['results'][0]['reply_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.root.delete()
+        self.assertEqual(json.loads(self._list().content)['count'], 0)
+
+    def test_single_flight_rebuild(self):
+        """
+        条目过期后只有拿到锁的请求重建，其余请求返回旧内容；条目缺失时等待重建结果
+        """
+        builds = []
+
+        def build():
+            builds.append(1)
+            return b'new'
+
+        key = comment_cache.page_key(self.lesson.id, 1)
+        cache.set(key, (0, b'old'))
+        cache.add(key + ':lock', 1)
+        self.assertEqual(comment_cache.get_page(self.lesson.id, 1, build), b'old')
+        cache.delete(key + ':lock')
+        self.assertEqual(comment_cache.get_page(self.lesson.id, 1, build), b'new')
+        self.assertEqual(len(builds), 1)
+
+        cache.delete(key)
+        cache.add(key + ':lock', 1)
+        with mock.patch('core.comment_cache.time.sleep', side_effect=lambda _: cache.set(key, (0, b'other'))):
+            self.assertEqual(comment_cache.get_page(self.lesson.id, 1, build), b'other')
+        self.assertEqual(len(builds), 1)
+
+
+class InstructorQAInboxTests(APITestCase):
+
+    def setUp(self):
+        self.instructor = CustomUser.objects.create_user(
+            username='qa_teacher', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        self.course = Course.objects.create(title='答疑课程', description='desc', instructor=self.instructor)
+        module = Module.objects.create(course=self.course, title='第一章', order=1)
+        self.lesson = Lesson.objects.create(module=module, title='第一节', order=1)
+        self.student = CustomUser.objects.create_user(username='qa_student', password='password123')
+
+    def test_unanswered_inbox(self):
+        """
+        评论写入冗余的课程/讲师字段；讲师回复后提问移出待回复列表
+        """
+        answered = Comment.objects.create(lesson=self.lesson, user=self.student, content='问题一')
+        pending = Comment.objects.create(lesson=self.lesson, user=self.student, content='问题二')
+        Comment.objects.create(lesson=self.lesson, user=self.instructor, content='讲师公告')
+        self.assertEqual((pending.course_id, pending.instructor_id), (self.course.id, self.instructor.id))
+
+        self.client.force_authenticate(user=self.instructor)
+        self.client.post(reverse('comment-list'), {
+            'lesson': self.lesson.id, 'content': '解答', 'parent': answered.id
+        })
+        Comment.objects.create(lesson=self.lesson, user=self.student, content='追问', parent=pending)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('instructor-qa'))
+        self.assertEqual([item['id'] for item in response.data['results']], [pending.id])
+        self.assertEqual(response.data['results'][0]['course_title'], '答疑课程')
+
+        response = self.client.get(reverse('instructor-qa'), {'status': 'all'})
+        self.assertEqual(response.data['count'], 3)
+
+    def test_instructor_change_moves_inbox(self):
+        """
+        课程更换讲师后，已有提问转到新讲师的答疑列表
+        """
+        Comment.objects.create(lesson=self.lesson, user=self.student, content='问题')
+        successor = CustomUser.objects.create_user(
+            username='qa_successor', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        self.course.instructor = successor
+        self.course.save()
+
+        self.client.force_authenticate(user=successor)
+        self.assertEqual(len(self.client.get(reverse('instructor-qa')).data['results']), 1)
+
+    def test_deleting_only_reply_reopens_question(self):
+        """
+        讲师删除唯一的回复后，提问回到待回复列表；仍有其他讲师回复时保持已回复
+        """
+        question = Comment.objects.create(lesson=self.lesson, user=self.student, content='问题')
+        first = Comment.objects.create(lesson=self.lesson, user=self.instructor, content='解答一', parent=question)
+        second = Comment.objects.create(lesson=self.lesson, user=self.instructor, content='解答二', parent=question)
+
+        first.delete()
+        question.refresh_from_db()
+        self.assertFalse(question.is_unanswered)
+
+        second.delete()
+        question.refresh_from_db()
+        self.assertTrue(question.is_unanswered)
+
+    def test_moving_lesson_updates_comment_course(self):
+        """
+        课时或章节移动到其他课程后，评论的冗余课程/讲师随之更新
+        """
+        comment = Comment.objects.create(lesson=self.lesson, user=self.student, content='问题')
+        other_instructor = CustomUser.objects.create_user(
+            username='qa_other', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        other_course = Course.objects.create(title='另一门课', description='desc', instructor=other_instructor)
+        other_module = Module.objects.create(course=other_course, title='第一章', order=1)
+
+        self.lesson.module = other_module
+        self.lesson.save()
+        comment.refresh_from_db()
+        self.assertEqual((comment.course_id, comment.instructor_id), (other_course.id, other_instructor.id))
+
+        other_module.course = self.course
+        other_module.save()
+        comment.refresh_from_db()
+        self.assertEqual((comment.course_id, comment.instructor_id), (self.course.id, self.instructor.id))
+
+    def test_notes_filter_by_course(self):
+        """
+        笔记可按课程过滤
+        """
+        note = Note.objects.create(user=self.student, lesson=self.lesson, content='笔记')
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(reverse('note-list'), {'course_id': self.course.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [note.id])
+        response = self.client.get(reverse('note-list'), {'course_id': self.course.id + 100})
+        self.assertEqual(response.data['count'], 0)
+
+
+class TieredCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache.reset_cache()
+        self.addCleanup(tiered_cache.reset_cache)
+
+    def test_lru_eviction_and_ttl(self):
+        """
+        L1 超出容量时淘汰最久未使用的条目，过期条目不再返回
+        """
+        l1 = tiered_cache.LRUCache(max_entries=2)
+        l1.set('a', 1, 60)
+        l1.set('b', 2, 60)
+        l1.get('a')
+        l1.set('c', 3, 60)
+        self.assertEqual((l1.get('a'), l1.get('b'), l1.get('c')), (1, None, 3))
+        l1.set('d', 4, 0)
+        self.assertIsNone(l1.get('d'))
+
+    def test_invalidation_reaches_other_workers(self):
+        """
+        两个进程共享 L2：一次 invalidate 使两边的 L1/L2 条目都失效 (另一进程在版本检查间隔后生效)
+        """
+        worker_a = tiered_cache.TieredCache(version_check_interval=0)
+        worker_b = tiered_cache.TieredCache(version_check_interval=0)
+        worker_a.set('ns', 'k', 'v1')
+        self.assertEqual(worker_b.get('ns', 'k'), 'v1')
+        self.assertEqual(worker_b.get('ns', 'k'), 'v1')
+        self.assertEqual(worker_b.metrics()['l2_hits'], 1)
+        self.assertEqual(worker_b.metrics()['l1_hits'], 1)
+
+        worker_a.invalidate('ns')
+        self.assertIsNone(worker_a.get('ns', 'k'))
+        self.assertIsNone(worker_b.get('ns', 'k'))
+        self.assertEqual(worker_b.get_or_set('ns', 'k', lambda: 'v2'), 'v2')
+        self.assertEqual(worker_a.get('ns', 'k'), 'v2')
+
+    def test_category_list_decorator(self):
+        """
+        分类列表经两级缓存返回，失效后重新计算
+        """
+        url = reverse('category-list')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.data, second.data)
+
+        Category.objects.create(name='缓存分类B')
+        tiered_cache.invalidate(tiered_cache.NAMESPACE_CATEGORIES)
+        names = {item['name'] for item in self.client.get(url).data['results']}
+        self.assertIn('缓存分类B', names)
+        self.assertEqual(tiered_cache.get_cache().metrics()['l1_hits'], 1)
+
+
+class CategoryPopularityTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache.reset_cache()
+        self.addCleanup(tiered_cache.reset_cache)
+        instructor = CustomUser.objects.create_user(
+            username='popular_teacher', password='password123', role=CustomUser.ROLE_INSTRUCTOR
+        )
+        self.frontend = Category.objects.create(name='热度分类前端')
+        self.backend = Category.objects.create(name='热度分类后端')
+        self.course = Course.objects.create(
+            title='热度课程', description='desc', instructor=instructor, category=self.frontend
+        )
+        self.user = CustomUser.objects.create_user(username='popular_user', password='password123')
+
+    def _totals(self):
+        response = self.client.get(reverse('category-list'))
+        return {item['name']: item['total_likes'] for item in response.data['results']}
+
+    def test_likes_and_category_moves_refresh_list(self):
+        """
+        点赞与课程更换分类会更新分类点赞总数，并使分类列表缓存失效
+        """
+        self.assertEqual(self._totals()['热度分类前端'], 0)
+
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('course-like-toggle', args=[self.course.id]))
+        self.client.force_authenticate(user=None)
+        with self.assertNumQueries(2):
+            totals = self._totals()
+        self.assertEqual(totals['热度分类前端'], 1)
+
+        self.course.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.category = self.backend
+            self.course.save()
+        totals = self._totals()
+        self.assertEqual((totals['热度分类前端'], totals['热度分类后端']), (0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.likes.remove(self.user)
+        self.assertEqual(self._totals()['热度分类后端'], 0)
+
+    def test_like_changes_only_recompute_affected_categories(self):
+        """
+        正向与反向修改点赞关系时，只重算受影响课程所属的分类
+        """
+        Category.objects.filter(pk=self.backend.pk).update(total_likes=99)
+
+        self.course.likes.add(self.user)
+        self.user.liked_courses.remove(self.course)
+        self.user.liked_courses.add(self.course)
+        self.user.liked_courses.clear()
+        self.user.liked_courses.add(self.course)
+
+        self.frontend.refresh_from_db()
+        self.backend.refresh_from_db()
+        self.assertEqual((self.frontend.total_likes, self.backend.total_likes), (1, 99))
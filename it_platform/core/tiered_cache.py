@@ -0,0 +1,205 @@
+"""
+两级缓存
+
+L1 为进程内的 LRU 缓存 (条目数有上限，带过期时间)，L2 为所有进程共享的 Django 缓存
+(生产环境配置 CACHE_REDIS_URL 后为 Redis，开发/测试时为本地内存缓存)。
+读取顺序 L1 → L2 → 计算，L2 命中时回填 L1。
+
+缓存按命名空间组织，实际的键中带有命名空间的版本号：
+  - 版本号保存在 L2 中，invalidate() 递增版本号，所有进程的旧条目随即失效
+  - 为避免每次读取都访问 L2，各进程在 VERSION_CHECK_INTERVAL 秒内复用已读到的版本号，
+    其他进程最多在这段时间后看到失效；调用 invalidate() 的进程立即生效
+L1 中保存的是对象本身，调用方不应修改取到的值。
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+VERSION_KEY = 'tiered:{}:version'
+ENTRY_KEY = 'tiered:{}:{}:{}'
+_MISSING = object()
+
+# 各业务使用的命名空间
+NAMESPACE_CATEGORIES = 'categories'
+
+
+def _initial_version():
+    # L2 被清空后版本号从当前时间重新开始，不会与各进程 L1 中残留的旧版本号重复
+    return int(time.time())
+
+
+class LRUCache:
+    """线程安全的进程内 LRU 缓存，每个条目有独立的过期时间"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    def __init__(self, l2='default', l1_max_entries=1000, l1_timeout=30, version_check_interval=2):
+        self.l1 = LRUCache(l1_max_entries)
+        self.l2 = caches[l2]
+        self.l1_timeout = l1_timeout
+        self.version_check_interval = version_check_interval
+        self._versions = LRUCache(l1_max_entries)
+        self._stats_lock = threading.Lock()
+        self.reset_metrics()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def reset_metrics(self):
+        with self._stats_lock:
+            self._stats = {'l1_hits': 0, 'l2_hits': 0, 'misses': 0, 'sets': 0, 'invalidations': 0}
+
+    def metrics(self):
+        """返回本进程的命中统计"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['l1_hits'] + stats['l2_hits']) / lookups, 4) if lookups else 0.0
+        stats['l1_size'] = len(self.l1)
+        return stats
+
+    def _version(self, namespace):
+        version = self._versions.get(namespace)
+        if version is None:
+            key = VERSION_KEY.format(namespace)
+            version = self.l2.get(key)
+            if version is None:
+                self.l2.add(key, _initial_version(), None)
+                version = self.l2.get(key, 1)
+            self._versions.set(namespace, version, self.version_check_interval)
+        return version
+
+    def _key(self, namespace, key):
+        return ENTRY_KEY.format(namespace, self._version(namespace), key)
+
+    def get(self, namespace, key, default=None):
+        full_key = self._key(namespace, key)
+        value = self.l1.get(full_key, _MISSING)
+        if value is not _MISSING:
+            self._count('l1_hits')
+            return value
+        value = self.l2.get(full_key, _MISSING)
+        if value is not _MISSING:
+            self._count('l2_hits')
+            self.l1.set(full_key, value, self.l1_timeout)
+            return value
+        self._count('misses')
+        return default
+
+    def set(self, namespace, key, value, timeout=300):
+        full_key = self._key(namespace, key)
+        self.l2.set(full_key, value, timeout)
+        self.l1.set(full_key, value, min(timeout, self.l1_timeout))
+        self._count('sets')
+
+    def get_or_set(self, namespace, key, compute, timeout=300):
+        value = self.get(namespace, key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(namespace, key, value, timeout)
+        return value
+
+    def invalidate(self, namespace):
+        """递增命名空间版本号，使该命名空间在所有进程中的 L1/L2 条目失效"""
+        key = VERSION_KEY.format(namespace)
+        self.l2.add(key, _initial_version(), None)
+        try:
+            version = self.l2.incr(key)
+        except ValueError:
+            version = _initial_version() + 1
+            self.l2.set(key, version, None)
+        self._versions.set(namespace, version, self.version_check_interval)
+        self._count('invalidations')
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = getattr(settings, 'TIERED_CACHE', {})
+                _cache = TieredCache(**{key.lower(): value for key, value in config.items()})
+    return _cache
+
+
+def reset_cache():
+    global _cache
+    _cache = None
+
+
+def invalidate(namespace):
+    get_cache().invalidate(namespace)
+
+
+def invalidate_on_commit(namespace):
+    """在当前事务提交后失效 (不在事务中时立即执行)"""
+    transaction.on_commit(lambda: invalidate(namespace))
+
+
+def cached_response(namespace, timeout=300, vary_on_user=False):
+    """
+    视图方法装饰器：按请求路径 (含查询参数) 缓存成功响应的 response.data
+    :param vary_on_user: 响应内容因登录用户而异时按用户分别缓存
+    缓存内容由调用方在数据变化时通过 invalidate(namespace) 失效
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.get_full_path()
+            if vary_on_user:
+                key = f'{key}|{request.user.pk or 0}'
+            tiered = get_cache()
+            data = tiered.get(namespace, key, _MISSING)
+            if data is not _MISSING:
+                return Response(data)
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                tiered.set(namespace, key, response.data, timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,226 @@
+"""
+课时视频 HLS 转码
+
+流程 (由 core.tasks 中的 Celery 任务编排)：
+1. prepare: 探测时长/分辨率、截取封面，确定要生成的码率档位
+2. transcode_rendition: 每个档位一个任务，可分布到多个 worker 并行执行
+3. write_master_playlist: 所有档位完成后生成 master.m3u8 并更新课时
+
+输出目录为 HLS_ROOT/<lesson_id>/ (不在 MEDIA_ROOT 下，不能通过 MEDIA_URL 直接访问)，
+播放列表与分片只能通过带课时签名的接口获取；每个档位先写入临时目录，
+完成后整体改名，重试时已完成的档位直接跳过，保证任务幂等。
+转码器由 settings.HLS_TRANSCODER 指定，测试环境可使用 FakeTranscoder。
+"""
+import json
+import math
+import os
+import shutil
+import subprocess
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from .models import Lesson
+
+POSTER_DIR = 'lesson_posters'
+SEGMENT_SECONDS = 6
+MASTER_PLAYLIST = 'master.m3u8'
+PROGRESS_KEY = 'hls_progress:{}:{}'
+
+
+def get_renditions():
+    # (名称, 高度, 视频码率)
+    return settings.HLS_RENDITIONS
+
+
+def get_transcoder():
+    return import_string(getattr(settings, 'HLS_TRANSCODER', 'core.transcoding.FFmpegTranscoder'))()
+
+
+def lesson_dir(lesson_id):
+    return os.path.join(settings.HLS_ROOT, str(lesson_id))
+
+
+def has_playlist(lesson_id):
+    return os.path.exists(os.path.join(lesson_dir(lesson_id), MASTER_PLAYLIST))
+
+
+def _bandwidth(bitrate):
+    return int(bitrate.rstrip('k')) * 1000
+
+
+# --- 转码器实现 ---
+class FFmpegTranscoder:
+    def probe(self, source):
+        """返回 {'duration': 秒, 'width': 宽, 'height': 高}"""
+        output = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+             '-show_entries', 'stream=width,height:format=duration', '-of', 'json', source],
+            check=True, capture_output=True, text=True
+        ).stdout
+        info = json.loads(output)
+        stream = (info.get('streams') or [{}])[0]
+        return {
+            'duration': float(info.get('format', {}).get('duration') or 0),
+            'width': stream.get('width', 0),
+            'height': stream.get('height', 0),
+        }
+
+    def extract_poster(self, source, target, duration):
+        subprocess.run(
+            ['ffmpeg', '-y', '-v', 'error', '-ss', str(min(1.0, duration / 2)), '-i', source,
+             '-frames:v', '1', '-vf', 'scale=640:-2', target],
+            check=True, capture_output=True
+        )
+
+    def transcode(self, source, output_dir, height, bitrate, duration, on_progress):
+        process = subprocess.Popen(
+            ['ffmpeg', '-y', '-v', 'error', '-i', source,
+             '-vf', f'scale=-2:{height}', '-c:v', 'libx264', '-preset', 'veryfast',
+             '-b:v', bitrate, '-maxrate', bitrate, '-bufsize', f'{_bandwidth(bitrate) * 2 // 1000}k',
+             '-c:a', 'aac', '-b:a', '128k', '-ac', '2',
+             '-hls_time', str(SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+             '-hls_segment_filename', os.path.join(output_dir, 'seg_%05d.ts'),
+             '-progress', 'pipe:1', '-nostats', os.path.join(output_dir, 'index.m3u8')],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+        )
+        for line in process.stdout:
+            # -progress 输出形如 out_time_ms=12345678 (单位实际为微秒)
+            if line.startswith('out_time_ms=') and duration:
+                value = line.split('=', 1)[1].strip()
+                if value.isdigit():
+                    on_progress(min(int(value) / 1_000_000 / duration, 1.0))
+        _, stderr = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg 转码失败: {stderr.strip()[-500:]}")
+
+
+class FakeTranscoder:
+    """不依赖 ffmpeg 的测试替身：生成结构正确的播放列表与占位分片"""
+    duration = 15.0
+    width, height = 1280, 720
+
+    def probe(self, source):
+        return {'duration': self.duration, 'width': self.width, 'height': self.height}
+
+    def extract_poster(self, source, target, duration):
+        with open(target, 'wb') as f:
+            f.write(b'poster')
+
+    def transcode(self, source, output_dir, height, bitrate, duration, on_progress):
+        segments = max(1, math.ceil(duration / SEGMENT_SECONDS))
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}',
+                 '#EXT-X-PLAYLIST-TYPE:VOD']
+        for i in range(segments):
+            name = f'seg_{i:05d}.ts'
+            with open(os.path.join(output_dir, name), 'wb') as f:
+                f.write(b'segment')
+            length = min(SEGMENT_SECONDS, duration - i * SEGMENT_SECONDS)
+            lines += [f'#EXTINF:{length:.3f},', name]
+            on_progress((i + 1) / segments)
+        lines.append('#EXT-X-ENDLIST')
+        with open(os.path.join(output_dir, 'index.m3u8'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+# --- 流水线步骤 ---
+def _select_renditions(source_height):
+    renditions = [r for r in get_renditions() if not source_height or r[1] <= source_height]
+    # 源视频低于最低档位时仍输出一档
+    return renditions or get_renditions()[:1]
+
+
+def prepare(lesson_id, source):
+    """探测视频信息并截取封面，返回需要生成的档位名称列表"""
+    transcoder = get_transcoder()
+    info = transcoder.probe(source)
+    os.makedirs(lesson_dir(lesson_id), exist_ok=True)
+
+    # 封面作为普通图片公开，放在 MEDIA_ROOT 下
+    poster_url = ''
+    try:
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, POSTER_DIR), exist_ok=True)
+        poster_name = f'{POSTER_DIR}/{lesson_id}.jpg'
+        transcoder.extract_poster(source, os.path.join(settings.MEDIA_ROOT, poster_name), info['duration'])
+        poster_url = settings.MEDIA_URL + poster_name
+    except Exception:
+        # 封面失败不影响转码
+        pass
+
+    renditions = [name for name, _, _ in _select_renditions(info['height'])]
+    Lesson.objects.filter(pk=lesson_id).update(
+        transcode_status=Lesson.TRANSCODE_PROCESSING,
+        transcode_progress=0,
+        video_duration=info['duration'] or None,
+        video_poster=poster_url,
+    )
+    return {'duration': info['duration'], 'renditions': renditions}
+
+
+def _rendition_done(path):
+    playlist = os.path.join(path, 'index.m3u8')
+    if not os.path.exists(playlist):
+        return False
+    with open(playlist) as f:
+        return '#EXT-X-ENDLIST' in f.read()
+
+
+def _report_progress(lesson_id, renditions, name, fraction):
+    cache.set(PROGRESS_KEY.format(lesson_id, name), fraction, 60 * 60 * 6)
+    values = cache.get_many([PROGRESS_KEY.format(lesson_id, r) for r in renditions])
+    percent = int(sum(values.values()) / len(renditions) * 100)
+    # 完成度由 write_master_playlist 置为 100，这里最多到 99
+    Lesson.objects.filter(pk=lesson_id, transcode_progress__lt=min(percent, 99)).update(
+        transcode_progress=min(percent, 99)
+    )
+
+
+def transcode_rendition(lesson_id, source, name, duration, renditions):
+    """生成单个档位；已完成的档位直接跳过"""
+    _, height, bitrate = next(r for r in get_renditions() if r[0] == name)
+    target = os.path.join(lesson_dir(lesson_id), name)
+    if _rendition_done(target):
+        _report_progress(lesson_id, renditions, name, 1.0)
+        return name
+
+    temp = f'{target}.partial'
+    shutil.rmtree(temp, ignore_errors=True)
+    os.makedirs(temp)
+    get_transcoder().transcode(
+        source, temp, height, bitrate, duration,
+        lambda fraction: _report_progress(lesson_id, renditions, name, fraction)
+    )
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(temp, target)
+    return name
+
+
+def write_master_playlist(lesson_id, renditions):
+    """
+    所有档位完成后写入 master.m3u8，并把课时切换为 HLS 播放
+    播放列表内均为相对路径，经签名接口访问时分片请求会带上同一签名；
+    video_m3u8_url 只用于外部 HLS 地址，本地转码结果的播放地址由 video/url 接口签发
+    """
+    output = lesson_dir(lesson_id)
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for name, height, bitrate in get_renditions():
+        if name not in renditions:
+            continue
+        if not _rendition_done(os.path.join(output, name)):
+            raise RuntimeError(f"档位 {name} 尚未完成")
+        width = int(height * 16 / 9) // 2 * 2
+        lines += [f'#EXT-X-STREAM-INF:BANDWIDTH={_bandwidth(bitrate)},RESOLUTION={width}x{height}',
+                  f'{name}/index.m3u8']
+
+    temp = os.path.join(output, 'master.m3u8.partial')
+    with open(temp, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(temp, os.path.join(output, MASTER_PLAYLIST))
+
+    Lesson.objects.filter(pk=lesson_id).update(
+        video_m3u8_url=None,
+        lesson_type=Lesson.LESSON_VIDEO,
+        content='',
+        transcode_status=Lesson.TRANSCODE_READY,
+        transcode_progress=100,
+    )
+    cache.delete_many([PROGRESS_KEY.format(lesson_id, r) for r in renditions])
@@ -0,0 +1,169 @@
+"""
+课时视频的可续传分片上传 (参考 tus 协议)
+
+分片直接从请求流按块写入磁盘上的临时文件 (按偏移量定位)，内存占用与文件大小无关；
+全部接收后在同一文件系统内改名为正式文件，不再复制数据。
+
+写入前先以偏移量为条件占用会话 (claim)，同一偏移量同时只有一个请求在写；
+最后一个分片的占用保持到课时创建完成，上传只会被完成一次；
+长时间没有进展的会话及其临时文件由 cleanup_expired 定时清理。
+"""
+import base64
+import hashlib
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from .models import UploadSession
+
+READ_BLOCK_SIZE = 1024 * 1024
+# 临时文件所在目录，与 UploadSession.partial_name 一致
+PARTIAL_DIR = 'lesson_videos_mp4/uploads'
+
+
+class UploadError(Exception):
+    """上传请求不合法，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _path(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def start(session):
+    """为新会话创建空的临时文件"""
+    path = _path(session.partial_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+
+def _lease_seconds():
+    return getattr(settings, 'LESSON_UPLOAD_LEASE_SECONDS', 15 * 60)
+
+
+def claim(session, offset):
+    """
+    占用会话以写入 offset 处的分片，成功返回 True；
+    偏移量已变化或其他请求正在写入时返回 False。写入进程异常退出时占用在超时后失效
+    """
+    now = timezone.now()
+    return bool(UploadSession.objects.filter(
+        Q(write_lease_until__isnull=True) | Q(write_lease_until__lt=now),
+        pk=session.pk, offset=offset, status=UploadSession.STATUS_UPLOADING,
+    ).update(write_lease_until=now + timedelta(seconds=_lease_seconds()), updated_at=now))
+
+
+def release(session, offset, new_offset, hold=False):
+    """
+    写入结束 (无论成功与否) 后记录新的偏移量并释放占用；
+    hold=True 时继续占用 (最后一个分片写完、正在校验并创建课时)，重试的请求不会再次完成上传
+    """
+    fields = {'offset': new_offset, 'updated_at': timezone.now()}
+    if not hold:
+        fields['write_lease_until'] = None
+    UploadSession.objects.filter(pk=session.pk, offset=offset).update(**fields)
+    session.offset = new_offset
+    if not hold:
+        session.write_lease_until = None
+
+
+def parse_checksum(header):
+    """解析 Upload-Checksum: sha256 <base64>，返回摘要字节"""
+    if not header:
+        return None
+    algorithm, _, value = header.partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError("仅支持 sha256 校验", status_code=400)
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except ValueError:
+        raise UploadError("Upload-Checksum 格式错误")
+
+
+def write_chunk(session, stream, offset, length, expected_digest=None):
+    """
+    从 stream 读取 length 字节写入临时文件的 offset 处，返回新的偏移量；
+    分片校验失败时丢弃本次写入
+    """
+    path = _path(session.partial_name)
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            block = stream.read(min(READ_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            digest.update(block)
+            written += len(block)
+
+        if expected_digest is not None and digest.digest() != expected_digest:
+            f.truncate(offset)
+            raise UploadError("分片校验失败，请重新发送", status_code=460)
+    return offset + written
+
+
+def finalize(session):
+    """
+    校验整个文件 (如提供了 SHA-256) 并改名为正式文件，返回相对 MEDIA_ROOT 的文件名
+    """
+    path = _path(session.partial_name)
+    if session.checksum:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                digest.update(block)
+        if digest.hexdigest() != session.checksum.lower():
+            raise UploadError("文件校验失败，请重新上传", status_code=460)
+
+    name = f"lesson_videos_mp4/{session.id.hex}_{get_valid_filename(session.filename)}"
+    os.replace(path, _path(name))
+    return name
+
+
+def discard(session):
+    """删除会话的临时文件，返回是否删除了文件"""
+    try:
+        os.remove(_path(session.partial_name))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def cleanup_expired(max_age=None):
+    """
+    删除超过 max_age 秒 (默认 LESSON_UPLOAD_EXPIRY) 没有进展的未完成会话及其临时文件，
+    并删除没有对应会话的 .part 孤儿文件，返回删除的临时文件数
+    """
+    if max_age is None:
+        max_age = getattr(settings, 'LESSON_UPLOAD_EXPIRY', 60 * 60 * 24)
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    removed = 0
+
+    expired = list(UploadSession.objects.filter(status=UploadSession.STATUS_UPLOADING, updated_at__lt=cutoff))
+    for session in expired:
+        removed += discard(session)
+    UploadSession.objects.filter(pk__in=[session.pk for session in expired]).delete()
+
+    directory = _path(PARTIAL_DIR)
+    if not os.path.isdir(directory):
+        return removed
+    live = {
+        f'{pk}.part' for pk in
+        UploadSession.objects.filter(status=UploadSession.STATUS_UPLOADING).values_list('pk', flat=True)
+    }
+    for entry in os.scandir(directory):
+        # 按修改时间过滤，避免误删刚创建、会话尚未提交的文件
+        if entry.name.endswith('.part') and entry.name not in live and entry.stat().st_mtime < cutoff.timestamp():
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
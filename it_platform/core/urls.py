@@ -7,6 +7,7 @@ router = DefaultRouter()
 router.register(r'courses', views.CourseViewSet, basename='course')
 router.register(r'modules', views.ModuleViewSet, basename='module')
 router.register(r'lessons', views.LessonViewSet, basename='lesson')
+router.register(r'lesson-uploads', views.LessonUploadViewSet, basename='lesson-upload')
 router.register(r'categories', views.CategoryViewSet, basename='category')
 router.register(r'applications', views.InstructorApplicationViewSet, basename='application')
 router.register(r'comments', views.CommentViewSet, basename='comment')
@@ -26,9 +27,16 @@ router.register(r'badges', views.BadgeViewSet, basename='badge')
 urlpatterns = [
     path('', include(router.urls)),
     path('ai/ask/', views.AskAIView.as_view(), name='ai-ask'),
+    path('realtime/ticket/', views.RealtimeTicketView.as_view(), name='realtime-ticket'),
+    path('realtime/stream/', views.realtime_stream, name='realtime-stream'),
+    path('lessons/<int:lesson_id>/video/', views.LessonVideoView.as_view(), name='lesson-video'),
+    path('lessons/<int:lesson_id>/video/url/', views.LessonVideoURLView.as_view(), name='lesson-video-url'),
+    path('lessons/<int:lesson_id>/hls/<str:sig>/<path:name>', views.LessonHLSView.as_view(), name='lesson-hls'),
+    path('leaderboard/', views.LeaderboardView.as_view(), name='leaderboard'),
     path('users/me/', views.UserView.as_view(), name='user-me'),
     path('users/change-password/', ChangePasswordView.as_view(), name='change-password'),
     path('users/search/', UserSearchView.as_view(), name='user-search'),
+    path('users/typeahead/', views.UserTypeaheadView.as_view(), name='user-typeahead'),
 
     path('instructor/courses/', views.InstructorCourseListView.as_view(), name='instructor-courses'),
     path('instructor/analytics/', views.InstructorAnalyticsView.as_view(), name='instructor-analytics'),
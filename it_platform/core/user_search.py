@@ -0,0 +1,128 @@
+"""
+用户检索 (搜索好友 / 输入联想)
+
+每个用户在 core_usersearchterm 中有若干检索词：完整的用户名、昵称，以及它们各个后缀的前
+MAX_INFIX_LENGTH 个字符 (用于匹配中间片段，如 "三丰" 命中 "张三丰"；截断后检索词总长度随名称
+线性增长)；安装了 pypinyin 时再加入中文昵称的全拼与首字母。
+查询按优先级逐层对 (weight, term) 索引做范围扫描，不再对用户表做 icontains 全表扫描；
+超过 MAX_INFIX_LENGTH 的中间片段查询按截断后的前缀扫描，再核对候选用户的完整名称。
+"""
+import re
+from django.core.cache import cache
+from .models import CustomUser, UserSearchTerm
+
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:
+    lazy_pinyin = None
+
+MAX_TERM_LENGTH = 32
+MAX_INFIX_LENGTH = 8
+TYPEAHEAD_CACHE_KEY = 'user_typeahead:{}:{}'
+TYPEAHEAD_CACHE_TIMEOUT = 30
+
+_CJK_RE = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+_SPACE_RE = re.compile(r'\s+')
+# 范围查询的上界：所有以 q 开头的字符串都小于 q + 该字符
+_MAX_CHAR = '\U0010ffff'
+
+
+def normalize(text):
+    return _SPACE_RE.sub('', (text or '').lower())[:MAX_TERM_LENGTH]
+
+
+def user_terms(username, nickname):
+    """返回 {检索词: 优先级}，同一检索词保留最高优先级 (数值最小)"""
+    terms = {}
+
+    def add(term, weight):
+        term = term[:MAX_TERM_LENGTH]
+        if term and weight < terms.get(term, weight + 1):
+            terms[term] = weight
+
+    username, nickname = normalize(username), normalize(nickname)
+    add(username, UserSearchTerm.WEIGHT_USERNAME)
+    add(nickname, UserSearchTerm.WEIGHT_NICKNAME)
+    for text in (username, nickname):
+        for i in range(1, len(text)):
+            add(text[i:i + MAX_INFIX_LENGTH], UserSearchTerm.WEIGHT_INFIX)
+    if lazy_pinyin is not None and _CJK_RE.search(nickname):
+        add(''.join(lazy_pinyin(nickname)), UserSearchTerm.WEIGHT_PINYIN)
+        add(''.join(lazy_pinyin(nickname, style=Style.FIRST_LETTER)), UserSearchTerm.WEIGHT_PINYIN)
+    return terms
+
+
+def index_user(user):
+    UserSearchTerm.objects.filter(user=user).delete()
+    UserSearchTerm.objects.bulk_create([
+        UserSearchTerm(user=user, term=term, weight=weight)
+        for term, weight in user_terms(user.username, user.nickname).items()
+    ])
+
+
+def rebuild_index(batch_size=1000):
+    UserSearchTerm.objects.all().delete()
+    count, batch = 0, []
+    for user_id, username, nickname in CustomUser.objects.values_list('id', 'username', 'nickname').iterator():
+        batch.extend(
+            UserSearchTerm(user_id=user_id, term=term, weight=weight)
+            for term, weight in user_terms(username, nickname).items()
+        )
+        count += 1
+        if len(batch) >= batch_size:
+            UserSearchTerm.objects.bulk_create(batch)
+            batch = []
+    UserSearchTerm.objects.bulk_create(batch)
+    return count
+
+
+def search_user_ids(query, limit=10, exclude_id=None):
+    """
+    返回匹配的用户ID：精确ID > 用户名前缀 > 昵称前缀 > 中间片段 > 拼音
+    每一层都是一次带 LIMIT 的索引范围扫描，结果足够时提前结束
+    """
+    q = normalize(query)
+    if not q:
+        return []
+    ids = []
+    if q.isdigit() and CustomUser.objects.filter(pk=int(q)).exclude(pk=exclude_id).exists():
+        ids.append(int(q))
+
+    for weight in (UserSearchTerm.WEIGHT_USERNAME, UserSearchTerm.WEIGHT_NICKNAME,
+                   UserSearchTerm.WEIGHT_INFIX, UserSearchTerm.WEIGHT_PINYIN):
+        if len(ids) >= limit:
+            break
+        prefix = q[:MAX_INFIX_LENGTH] if weight == UserSearchTerm.WEIGHT_INFIX else q
+        rows = UserSearchTerm.objects.filter(weight=weight, term__gte=prefix, term__lt=prefix + _MAX_CHAR)
+        if exclude_id is not None:
+            rows = rows.exclude(user_id=exclude_id)
+        # 同一用户可能有多个检索词命中，多取一些再去重
+        candidates = list(rows.order_by('term').values_list('user_id', flat=True)[:limit * 2])
+        if prefix != q:
+            candidates = _contains(candidates, q)
+        for user_id in candidates:
+            if user_id not in ids:
+                ids.append(user_id)
+    return ids[:limit]
+
+
+def _contains(user_ids, q):
+    """保留用户名或昵称 (规范化后) 包含 q 的用户，保持原有顺序"""
+    names = {
+        user_id: (username, nickname) for user_id, username, nickname in
+        CustomUser.objects.filter(pk__in=user_ids).values_list('id', 'username', 'nickname')
+    }
+    return [
+        user_id for user_id in user_ids
+        if user_id in names and any(q in normalize(name) for name in names[user_id])
+    ]
+
+
+def typeahead(query, limit=8):
+    """输入联想：相同前缀的请求在短时间内直接命中缓存"""
+    key = TYPEAHEAD_CACHE_KEY.format(limit, normalize(query))
+    ids = cache.get(key)
+    if ids is None:
+        ids = search_user_ids(query, limit=limit + 1)
+        cache.set(key, ids, TYPEAHEAD_CACHE_TIMEOUT)
+    return ids
@@ -0,0 +1,177 @@
+"""
+课程观看次数的写缓冲 (write-behind)
+
+缓冲由 settings.COURSE_VIEW_BUFFER 指定：配置了共享 Redis 时 record_view 只在 Redis 哈希中
+累加增量 (哈希本身即“有待落库的课程”集合)，由定时任务 / 管理命令批量合并回 Course.view_count。
+未配置时 (各进程缓存互不可见) 不做缓冲，直接用 F() 原子更新数据库，避免增量滞留在 web 进程中丢失。
+"""
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils.module_loading import import_string
+from .models import Course
+
+SEEN_KEY = 'course_views:seen:{}:{}'
+FLUSH_CHUNK_SIZE = 500
+
+
+class InMemoryViewBuffer:
+    """进程内缓冲，仅适用于测试或单进程部署"""
+
+    def __init__(self, **kwargs):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._taken = {}
+
+    def incr(self, course_id):
+        with self._lock:
+            self._pending[course_id] += 1
+
+    def get_many(self, course_ids):
+        with self._lock:
+            return {pk: self._pending[pk] for pk in course_ids if self._pending.get(pk)}
+
+    def take(self):
+        # 上一轮未确认 (落库失败) 的增量优先处理
+        with self._lock:
+            if not self._taken:
+                self._taken, self._pending = dict(self._pending), defaultdict(int)
+            return dict(self._taken)
+
+    def ack(self):
+        with self._lock:
+            self._taken = {}
+
+
+class RedisViewBuffer:
+    def __init__(self, location='redis://127.0.0.1:6379/1', key_prefix='course_views:', **kwargs):
+        import redis
+        self._client = redis.Redis.from_url(location)
+        self.pending_key = f'{key_prefix}pending'
+        self.processing_key = f'{key_prefix}processing'
+
+    def incr(self, course_id):
+        self._client.hincrby(self.pending_key, course_id, 1)
+
+    def get_many(self, course_ids):
+        course_ids = list(course_ids)
+        if not course_ids:
+            return {}
+        values = self._client.hmget(self.pending_key, course_ids)
+        return {pk: int(value) for pk, value in zip(course_ids, values) if value}
+
+    def take(self):
+        # RENAMENX 是原子的：只在没有未确认的 processing 哈希时改名，改名之后的新增量写入新的 pending 哈希，留到下一轮；
+        # pending 不存在 (没有新增量，或已被并发的另一轮改名) 时 Redis 返回错误，视为没有可取的增量
+        import redis
+        try:
+            self._client.renamenx(self.pending_key, self.processing_key)
+        except redis.ResponseError:
+            pass
+        return {int(pk): int(count) for pk, count in self._client.hgetall(self.processing_key).items()}
+
+    def ack(self):
+        self._client.delete(self.processing_key)
+
+
+_buffer = None
+_buffer_loaded = False
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """返回当前配置的缓冲，未配置时返回 None (直接写库)"""
+    global _buffer, _buffer_loaded
+    if not _buffer_loaded:
+        with _buffer_lock:
+            if not _buffer_loaded:
+                config = getattr(settings, 'COURSE_VIEW_BUFFER', None)
+                if config:
+                    config = dict(config)
+                    backend = import_string(config.pop('BACKEND'))
+                    _buffer = backend(**{key.lower(): value for key, value in config.items()})
+                _buffer_loaded = True
+    return _buffer
+
+
+def reset_buffer():
+    global _buffer, _buffer_loaded
+    _buffer = None
+    _buffer_loaded = False
+
+
+def _viewer_identity(request):
+    if request.user.is_authenticated:
+        return f'u{request.user.pk}'
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def record_course_view(course_id, request=None):
+    """
+    记录一次观看，返回是否计数 (去重窗口内的重复观看不计数)
+    课程不存在时抛出 Course.DoesNotExist，不为任意 ID 写入缓存
+    """
+    if not Course.objects.filter(pk=course_id).exists():
+        raise Course.DoesNotExist(course_id)
+
+    window = getattr(settings, 'COURSE_VIEW_DEDUP_SECONDS', 0)
+    if window and request is not None:
+        if not cache.add(SEEN_KEY.format(course_id, _viewer_identity(request)), 1, window):
+            return False
+
+    buffer = get_buffer()
+    if buffer is None:
+        Course.objects.filter(pk=course_id).update(view_count=F('view_count') + 1)
+    else:
+        buffer.incr(course_id)
+    return True
+
+
+def get_pending_views(course_ids):
+    """返回 {course_id: 尚未落库的观看增量}"""
+    buffer = get_buffer()
+    if buffer is None:
+        return {}
+    return buffer.get_many(course_ids)
+
+
+def apply_pending_views(courses):
+    """把未落库的增量叠加到课程对象的 view_count 上 (只影响展示)"""
+    pending = get_pending_views([course.pk for course in courses])
+    for course in courses:
+        course.view_count += pending.get(course.pk, 0)
+    return courses
+
+
+def flush_course_views():
+    """
+    将缓冲中的观看增量批量合并到数据库，返回合并的观看总数
+
+    只处理有增量的课程，每批执行一条 UPDATE ... CASE 语句；
+    全部批次在同一事务中写入，提交后才确认清除缓冲，失败时下一轮重试。
+    """
+    buffer = get_buffer()
+    if buffer is None:
+        return 0
+    pending = buffer.take()
+    if not pending:
+        return 0
+
+    course_ids = sorted(pending)
+    with transaction.atomic():
+        for start in range(0, len(course_ids), FLUSH_CHUNK_SIZE):
+            chunk = course_ids[start:start + FLUSH_CHUNK_SIZE]
+            delta = Case(
+                *[When(pk=pk, then=Value(pending[pk])) for pk in chunk],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+            Course.objects.filter(pk__in=chunk).update(view_count=F('view_count') + delta)
+    buffer.ack()
+    return sum(pending.values())
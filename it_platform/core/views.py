@@ -1,30 +1,51 @@
-import json
+from datetime import date, timedelta
 import openai
 from django.conf import settings
-from rest_framework import viewsets, permissions, status, filters, generics
+from rest_framework import viewsets, mixins, permissions, status, filters, generics
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, BasePermission, IsAdminUser, IsAuthenticatedOrReadOnly
 from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from django.db.models import Count, Sum, F, Q
+from rest_framework.authtoken.models import Token
+from django.db.models import Count, Sum, F, Q, Exists, OuterRef, Prefetch
+from django.db.models.functions import Greatest
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
+from django.utils._os import safe_join
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.handlers.asgi import ASGIRequest
 from .models import (
     Course, CustomUser, Module, Lesson, Enrollment,
     Category, InstructorApplication, Comment, Note, Assignment, Submission, Message, Friendship,
-    Banner, Announcement, VideoProgress, UserPoints, PointRecord, Badge, UserBadge
+    Banner, Announcement, VideoProgress, UserPoints, PointRecord, Badge, UserBadge, UploadSession,
+    Conversation
 )
 from .serializers import (
-    CourseDetailSerializer, CourseListSerializer, UserSerializer,
+    CourseDetailSerializer, CourseListSerializer, UserSerializer, UserCardSerializer,
     ModuleSerializer, LessonSerializer, CategorySerializer,
-    InstructorApplicationSerializer, CommentSerializer,
+    InstructorApplicationSerializer, CommentSerializer, ReplySerializer,
     ChangePasswordSerializer, NoteSerializer, AssignmentSerializer, SubmissionSerializer,
     AdminUserSerializer, MessageSerializer, FriendshipSerializer,
     BannerSerializer, AnnouncementSerializer, VideoProgressSerializer,
-    UserPointsSerializer, PointRecordSerializer, BadgeSerializer, UserBadgeSerializer
+    UserPointsSerializer, PointRecordSerializer, BadgeSerializer, UserBadgeSerializer, UploadSessionSerializer,
+    ConversationSerializer, InstructorQASerializer
+)
+from .tasks import process_video_upload, regrade_assignment_task
+from .view_counter import record_course_view, apply_pending_views
+from .rails import get_rail
+from .search import CourseSearchFilter, search_course_ids, highlight
+from .pagination import OptionalCursorPagination
+from .media import serve_file, sign_lesson, check_lesson_signature
+from . import (
+    uploads, realtime, friend_graph, user_search, points, badges, leaderboard, analytics, grading, comment_tree,
+    comment_cache, tiered_cache, transcoding
 )
-from .tasks import process_video_upload
 
 
 # --- 权限控制 ---
@@ -51,27 +72,51 @@ class IsCourseOwner(BasePermission):
 class CourseViewSet(viewsets.ModelViewSet):
     queryset = Course.objects.all().order_by('-created_at')
     parser_classes = [MultiPartParser, FormParser, JSONParser]
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['title', 'description', 'instructor__username']
+    filter_backends = [CourseSearchFilter]
 
     def get_queryset(self):
+        if self.action == 'retrieve':
+            return self._get_detail_queryset()
+
         queryset = Course.objects.all().order_by('-created_at').select_related(
             'instructor', 'category'
-        ).prefetch_related('likes', 'enrollments')
+        )
 
         category_slug = self.request.query_params.get('category')
         if category_slug:
             queryset = queryset.filter(category__slug=category_slug)
 
-        if self.action == 'popular':
-            queryset = queryset.annotate(view_count_annotated=F('view_count')).order_by('-view_count_annotated')
-        if self.action == 'top_liked':
-            queryset = queryset.annotate(like_count_annotated=Count('likes')).order_by('-like_count_annotated')
+        return queryset
+
+    def _get_detail_queryset(self):
+        """
+        详情页的固定查询计划：章节/课时、作业及当前用户的提交记录全部预取，
+        当前用户的点赞/收藏状态通过注解一次取回，查询数与课程规模无关
+        """
+        user = self.request.user
+        queryset = Course.objects.select_related('instructor', 'category').prefetch_related(
+            'modules__lessons', 'assignments'
+        )
 
+        if user.is_authenticated:
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'assignments__submissions',
+                    queryset=Submission.objects.filter(student=user),
+                    to_attr='my_submissions'
+                )
+            ).annotate(
+                is_liked=Exists(Course.likes.through.objects.filter(
+                    course_id=OuterRef('pk'), customuser_id=user.pk
+                )),
+                is_favorited=Exists(CustomUser.favorited_courses.through.objects.filter(
+                    course_id=OuterRef('pk'), customuser_id=user.pk
+                )),
+            )
         return queryset
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve', 'popular', 'newest', 'top_liked', 'record_view']:
+        if self.action in ['list', 'retrieve', 'popular', 'newest', 'top_liked', 'record_view', 'search']:
             return [permissions.AllowAny()]
 
         if self.action == 'create':
@@ -83,7 +128,7 @@ class CourseViewSet(viewsets.ModelViewSet):
         return [IsInstructorOrAdmin()]
 
     def get_serializer_class(self):
-        if self.action in ['list', 'popular', 'newest', 'top_liked']:
+        if self.action in ['list', 'popular', 'newest', 'top_liked', 'search']:
             return CourseListSerializer
         return CourseDetailSerializer
 
@@ -100,51 +145,75 @@ class CourseViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(instructor=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        apply_pending_views([instance])
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    # 首页榜单直接返回预序列化的缓存内容，见 core/rails.py
+    def _rail_response(self, kind):
+        content = get_rail(kind, self.request.query_params.get('category'))
+        return HttpResponse(content, content_type='application/json')
+
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
     def popular(self, request):
-        popular_courses = Course.objects.order_by('-view_count')[:3]
-        serializer = self.get_serializer(popular_courses, many=True)
-        return Response(serializer.data)
+        return self._rail_response('popular')
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
     def newest(self, request):
-        newest_courses = Course.objects.order_by('-created_at')[:3]
-        serializer = self.get_serializer(newest_courses, many=True)
-        return Response(serializer.data)
+        return self._rail_response('newest')
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
     def top_liked(self, request):
-        top_liked = Course.objects.annotate(like_count=Count('likes')).order_by('-like_count')[:3]
-        serializer = self.get_serializer(top_liked, many=True)
-        return Response(serializer.data)
+        return self._rail_response('top_liked')
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    def search(self, request):
+        """全文检索课程，按相关度排序并返回高亮片段；?prefix=0 关闭前缀匹配"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response([])
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 50)
+        except ValueError:
+            limit = 20
+        prefix = request.query_params.get('prefix', '1') != '0'
+
+        ids = search_course_ids(query, limit=limit, prefix=prefix)
+        courses = Course.objects.select_related('instructor', 'category').in_bulk(ids)
+        ranked = [courses[pk] for pk in ids if pk in courses]
+
+        results = []
+        for course, data in zip(ranked, self.get_serializer(ranked, many=True).data):
+            data['highlight'] = {
+                'title': highlight(course.title, query),
+                'description': highlight(course.description, query, snippet_length=80),
+            }
+            results.append(data)
+        return Response(results)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.AllowAny])
     def record_view(self, request, pk=None):
+        # 配置共享缓冲时观看次数先累加到 Redis，由 flush_course_views 定时批量落库
         try:
-            Course.objects.filter(pk=pk).update(view_count=F('view_count') + 1)
-            return Response({'status': 'view recorded'}, status=status.HTTP_200_OK)
-        except Exception:
+            record_course_view(int(pk), request)
+        except (TypeError, ValueError, Course.DoesNotExist):
             return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'view recorded'}, status=status.HTTP_200_OK)
 
 
 # --- 2. 分类视图 ---
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Category.objects.annotate(total_likes=Count('courses__likes')).order_by('-total_likes')
+    # total_likes 为冗余计数字段，列表无需再跨 分类→课程→点赞 聚合
+    queryset = Category.objects.order_by('-total_likes', '-order', 'id')
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
 
-    # 添加缓存 - 分类列表15分钟缓存
+    # 分类列表15分钟缓存 (两级缓存，见 core/tiered_cache.py)
+    @tiered_cache.cached_response(tiered_cache.NAMESPACE_CATEGORIES, timeout=60 * 15)
     def list(self, request, *args, **kwargs):
-        from django.core.cache import cache
-        cache_key = 'categories_list'
-        cached_data = cache.get(cache_key)
-        
-        if cached_data is not None:
-            return Response(cached_data)
-        
-        response = super().list(request, *args, **kwargs)
-        cache.set(cache_key, response.data, 60 * 15)  # 15分钟
-        return response
+        return super().list(request, *args, **kwargs)
 
 
 # --- 3. 章节视图 ---
@@ -181,6 +250,7 @@ class LessonViewSet(viewsets.ModelViewSet):
             content="视频正在处理中..."
         )
         if lesson.video_mp4_file:
+            Lesson.objects.filter(pk=lesson.pk).update(transcode_status=Lesson.TRANSCODE_PENDING)
             process_video_upload.delay(lesson.id, lesson.video_mp4_file.path)
 
     @action(detail=False, methods=['post'])
@@ -197,6 +267,193 @@ class LessonViewSet(viewsets.ModelViewSet):
         return Response({"status": "success", "deleted": deleted_count})
 
 
+# --- 4.1 课时视频流 (支持 Range 拖动) ---
+def _can_watch(user, lesson):
+    course = lesson.module.course
+    return user.is_authenticated and (
+        user.role == CustomUser.ROLE_ADMIN or course.instructor_id == user.id or
+        Enrollment.objects.filter(student=user, course=course).exists()
+    )
+
+
+class LessonVideoURLView(APIView):
+    """签发课时视频的短期播放地址 (<video> 无法携带 Authorization 头)"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, lesson_id):
+        lesson = Lesson.objects.select_related('module__course').filter(pk=lesson_id).first()
+        if lesson is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        if not _can_watch(request.user, lesson):
+            return Response({"detail": "请先报名该课程"}, status=status.HTTP_403_FORBIDDEN)
+        signature = sign_lesson(lesson.pk, request.user.pk)
+        url = reverse('lesson-video', kwargs={'lesson_id': lesson.pk})
+        # 本地转码的 HLS 签名放在路径中，播放列表里的相对地址 (子播放列表、分片) 会自动带上
+        if lesson.transcode_status == Lesson.TRANSCODE_READY and transcoding.has_playlist(lesson.pk):
+            hls = request.build_absolute_uri(reverse('lesson-hls', kwargs={
+                'lesson_id': lesson.pk, 'sig': signature, 'name': transcoding.MASTER_PLAYLIST
+            }))
+        else:
+            hls = lesson.video_m3u8_url or None
+        return Response({
+            "mp4": request.build_absolute_uri(f"{url}?sig={signature}") if lesson.video_mp4_file else None,
+            "hls": hls,
+            "expires_in": settings.LESSON_MEDIA_URL_TTL,
+        })
+
+
+class LessonVideoView(APIView):
+    """携带有效签名 (?sig=) 或以已报名用户身份请求时返回视频"""
+    permission_classes = [permissions.AllowAny]
+    # 播放器拖动时会发起大量 Range 请求，不计入接口频率限制
+    throttle_classes = []
+
+    def get(self, request, lesson_id):
+        lesson = Lesson.objects.select_related('module__course').filter(pk=lesson_id).first()
+        if lesson is None or not lesson.video_mp4_file:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        if not check_lesson_signature(request.query_params.get('sig'), lesson.pk):
+            if not request.user.is_authenticated:
+                return Response(status=status.HTTP_401_UNAUTHORIZED)
+            if not _can_watch(request.user, lesson):
+                return Response({"detail": "请先报名该课程"}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            return serve_file(request, lesson.video_mp4_file.name)
+        except FileNotFoundError:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+
+class LessonHLSView(APIView):
+    """按路径中的课时签名返回 HLS 播放列表与分片 (文件不在 MEDIA_ROOT 下，不能直接访问)"""
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    throttle_classes = []
+
+    def get(self, request, lesson_id, sig, name):
+        if not check_lesson_signature(sig, lesson_id):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        try:
+            safe_join(transcoding.lesson_dir(lesson_id), name)
+            return serve_file(
+                request, f'{lesson_id}/{name}', root=settings.HLS_ROOT, accel_prefix=settings.HLS_ACCEL_PREFIX
+            )
+        except (SuspiciousFileOperation, FileNotFoundError, IsADirectoryError):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+
+# --- 4.2 课时视频分片上传 (可断点续传) ---
+class LessonUploadViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    POST 创建上传会话 -> PATCH 按 Upload-Offset 追加分片 -> HEAD/GET 查询已接收偏移量以续传；
+    全部接收后自动创建课时并提交转码任务
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsInstructorOrAdmin]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def _offset_headers(self, response, session):
+        response['Upload-Offset'] = str(session.offset)
+        response['Upload-Length'] = str(session.total_size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def perform_create(self, serializer):
+        module = serializer.validated_data['module']
+        user = self.request.user
+        if user.role != CustomUser.ROLE_ADMIN and module.course.instructor_id != user.id:
+            raise PermissionDenied("只能向自己的课程上传视频")
+        session = serializer.save(user=user)
+        uploads.start(session)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response['Location'] = reverse('lesson-upload-detail', kwargs={'pk': response.data['id']})
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        session = self.get_object()
+        return self._offset_headers(Response(self.get_serializer(session).data), session)
+
+    def partial_update(self, request, *args, **kwargs):
+        session = self.get_object()
+        if session.status == UploadSession.STATUS_COMPLETED:
+            return self._offset_headers(Response(self.get_serializer(session).data), session)
+
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({"detail": "缺少 Upload-Offset 或 Content-Length"}, status=status.HTTP_400_BAD_REQUEST)
+        if offset != session.offset:
+            # 偏移量不一致 (如重复发送的分片)，客户端应先 HEAD 获取当前偏移量
+            return self._offset_headers(
+                Response({"detail": "偏移量不一致"}, status=status.HTTP_409_CONFLICT), session
+            )
+        if offset + length > session.total_size:
+            return Response({"detail": "分片超出文件大小"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            expected = uploads.parse_checksum(request.headers.get('Upload-Checksum'))
+        except uploads.UploadError as e:
+            return Response({"detail": str(e)}, status=e.status_code)
+
+        # 先以旧偏移量为条件占用会话再写入数据，并发请求不会写入同一位置
+        if not uploads.claim(session, offset):
+            session.refresh_from_db()
+            if session.status == UploadSession.STATUS_COMPLETED:
+                return self._offset_headers(Response(self.get_serializer(session).data), session)
+            return self._offset_headers(
+                Response({"detail": "偏移量不一致或分片正在写入"}, status=status.HTTP_409_CONFLICT), session
+            )
+        new_offset = offset
+        completing = False
+        try:
+            new_offset = uploads.write_chunk(session, request.stream, offset, length, expected)
+            completing = new_offset == session.total_size
+        except uploads.UploadError as e:
+            return Response({"detail": str(e)}, status=e.status_code)
+        finally:
+            # 收齐后不释放占用，直到 _complete 保存完成状态
+            uploads.release(session, offset, new_offset, hold=completing)
+
+        if completing:
+            try:
+                self._complete(session)
+            except uploads.UploadError as e:
+                uploads.discard(session)
+                session.delete()
+                return Response({"detail": str(e)}, status=e.status_code)
+
+        return self._offset_headers(Response(self.get_serializer(session).data), session)
+
+    def _complete(self, session):
+        name = uploads.finalize(session)
+        lesson = Lesson.objects.create(
+            module=session.module,
+            title=session.title,
+            order=session.order,
+            lesson_type=Lesson.LESSON_TEXT,
+            content="视频正在处理中...",
+            video_mp4_file=name,
+            transcode_status=Lesson.TRANSCODE_PENDING,
+        )
+        session.lesson = lesson
+        session.status = UploadSession.STATUS_COMPLETED
+        session.save(update_fields=['lesson', 'status', 'updated_at'])
+        process_video_upload.delay(lesson.id, lesson.video_mp4_file.path)
+
+    def destroy(self, request, *args, **kwargs):
+        session = self.get_object()
+        if session.status == UploadSession.STATUS_UPLOADING:
+            uploads.discard(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # --- 5. 讲师申请视图 ---
 class InstructorApplicationViewSet(viewsets.ModelViewSet):
     queryset = InstructorApplication.objects.all().order_by('-created_at')
@@ -232,8 +489,8 @@ class InstructorCourseListView(ListAPIView):
     def get_queryset(self):
         user = self.request.user
         if user.is_staff:
-            return Course.objects.select_related('instructor', 'category').prefetch_related('likes').order_by('-created_at')
-        return Course.objects.filter(instructor=user).select_related('instructor', 'category').prefetch_related('likes').order_by('-created_at')
+            return Course.objects.select_related('instructor', 'category').order_by('-created_at')
+        return Course.objects.filter(instructor=user).select_related('instructor', 'category').order_by('-created_at')
 
 
 # --- 7. 用户个人信息视图 ---
@@ -268,22 +525,21 @@ class ChangePasswordView(APIView):
 class CommentViewSet(viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('-created_at', '-id')
     filter_backends = [filters.SearchFilter]
     search_fields = ['content', 'user__username', 'lesson__title']
 
     def get_queryset(self):
         # 1. 确定基础查询集
-        if self.request.user.is_authenticated and (
-                self.request.user.is_staff or self.request.user.role == CustomUser.ROLE_ADMIN):
+        if self._is_admin():
             # 管理员可以看到所有（用于审核管理）
-            queryset = Comment.objects.all().select_related('user', 'lesson').order_by('-created_at')
-        else:
-            # 普通用户只返回“顶级评论”，子回复通过 parent 字段嵌套在序列化器中返回
-            queryset = Comment.objects.select_related(
-                'user', 'reply_to_user'
-            ).prefetch_related(
+            queryset = Comment.objects.all().select_related('user', 'lesson', 'reply_to_user').prefetch_related(
                 'replies__user', 'replies__reply_to_user'
-            ).filter(parent__isnull=True).order_by('-created_at')
+            ).order_by('-created_at')
+        else:
+            # 普通用户只返回“顶级评论”，每条附带前几条回复，由 list() 分页后批量加载
+            queryset = Comment.objects.filter(parent__isnull=True).order_by('-created_at')
 
         # 2. 【关键】应用过滤：无论是否管理员，都必须响应 lesson_id 参数
         lesson_id = self.request.query_params.get('lesson_id')
@@ -293,15 +549,63 @@ class CommentViewSet(viewsets.ModelViewSet):
         # 3. 支持按课程ID筛选
         course_id = self.request.query_params.get('course_id')
         if course_id:
-            queryset = queryset.filter(lesson__module__course_id=course_id)
+            queryset = queryset.filter(course_id=course_id)
 
         # 4. 支持按分类筛选
         category_slug = self.request.query_params.get('category')
         if category_slug:
-            queryset = queryset.filter(lesson__module__course__category__slug=category_slug)
+            queryset = queryset.filter(course__category__slug=category_slug)
 
         return queryset
 
+    def _is_admin(self):
+        user = self.request.user
+        return user.is_authenticated and (user.is_staff or user.role == CustomUser.ROLE_ADMIN)
+
+    def _cacheable_page(self):
+        """只按 lesson_id 查看讨论区前几页的非管理员请求可以走缓存，返回页码，否则返回 None"""
+        params = self.request.query_params
+        if self._is_admin() or not params.get('lesson_id', '').isdigit() or set(params) - {'lesson_id', 'page'}:
+            return None
+        page = params.get('page', '1')
+        if not page.isdigit() or not 1 <= int(page) <= comment_cache.cached_pages():
+            return None
+        return int(page)
+
+    def list(self, request, *args, **kwargs):
+        page_number = self._cacheable_page()
+        if page_number is None:
+            return self._thread_list(request)
+        content = comment_cache.get_page(
+            int(request.query_params['lesson_id']), page_number,
+            lambda: JSONRenderer().render(self._thread_list(request).data), host=request.get_host()
+        )
+        return HttpResponse(content, content_type='application/json')
+
+    def _thread_list(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        comments = list(page if page is not None else queryset)
+        if not self._is_admin():
+            comment_tree.load_threads(comments)
+        serializer = self.get_serializer(comments, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def replies(self, request, pk=None):
+        """分页返回某条顶级评论下的全部回复 (按时间正序)"""
+        root = self.get_object()
+        self.cursor_ordering = ('created_at', 'id')
+        queryset = Comment.objects.filter(parent_id=root.pk).order_by('created_at', 'id')
+        page = self.paginate_queryset(queryset)
+        replies = comment_tree.attach_user_cards(list(page if page is not None else queryset))
+        data = ReplySerializer(replies, many=True, context={'request': request}).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
     def perform_create(self, serializer):
         parent = serializer.validated_data.get('parent')
         reply_to_user = serializer.validated_data.get('reply_to_user')
@@ -325,39 +629,55 @@ class ToggleLikeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, course_id):
-        try:
-            course = Course.objects.get(pk=course_id)
-            user = request.user
-            if user in course.likes.all():
-                course.likes.remove(user)
+        course = Course.objects.filter(pk=course_id).values('category_id').first()
+        if course is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        # 直接操作中间表，并按实际增删的行数用 F() 原子更新课程与分类的冗余计数
+        through = Course.likes.through
+        with transaction.atomic():
+            deleted, _ = through.objects.filter(course_id=course_id, customuser_id=request.user.id).delete()
+            if deleted:
+                delta = -deleted
                 liked = False
             else:
-                course.likes.add(user)
+                _, created = through.objects.get_or_create(course_id=course_id, customuser_id=request.user.id)
+                delta = 1 if created else 0
                 liked = True
-            return Response({"liked": liked, "like_count": course.likes.count()})
-        except Course.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
+            if delta:
+                Course.objects.filter(pk=course_id).update(like_count=F('like_count') + delta)
+                if course['category_id']:
+                    Category.objects.filter(pk=course['category_id']).update(total_likes=F('total_likes') + delta)
+                    tiered_cache.invalidate_on_commit(tiered_cache.NAMESPACE_CATEGORIES)
+
+        like_count = Course.objects.filter(pk=course_id).values_list('like_count', flat=True).first()
+        return Response({"liked": liked, "like_count": like_count})
 
 
 class ToggleFavoriteView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, course_id):
-        try:
-            course = Course.objects.get(pk=course_id)
-            user = request.user
-            if course in user.favorited_courses.all():
-                user.favorited_courses.remove(course)
+        if not Course.objects.filter(pk=course_id).exists():
+            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        user = request.user
+        through = CustomUser.favorited_courses.through
+        with transaction.atomic():
+            deleted, _ = through.objects.filter(customuser_id=user.id, course_id=course_id).delete()
+            if deleted:
+                Course.objects.filter(pk=course_id).update(favorite_count=F('favorite_count') - deleted)
                 favorited = False
             else:
-                user.favorited_courses.add(course)
+                _, created = through.objects.get_or_create(customuser_id=user.id, course_id=course_id)
+                if created:
+                    Course.objects.filter(pk=course_id).update(favorite_count=F('favorite_count') + 1)
                 favorited = True
-            return Response({
-                "favorited": favorited,
-                "favorites_list": list(user.favorited_courses.values_list('id', flat=True))
-            })
-        except Course.DoesNotExist:
-            return Response(status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "favorited": favorited,
+            "favorites_list": list(user.favorited_courses.values_list('id', flat=True))
+        })
 
 
 class FavoriteCourseListView(ListAPIView):
@@ -365,7 +685,7 @@ class FavoriteCourseListView(ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return self.request.user.favorited_courses.all().order_by('-created_at').prefetch_related('likes')
+        return self.request.user.favorited_courses.all().order_by('-created_at').select_related('instructor', 'category')
 
 
 # --- 11. 注册 ---
@@ -393,6 +713,8 @@ class RegisterView(APIView):
 class UserManagementViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all().order_by('-date_joined')
     permission_classes = [IsAdminRole]
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('-date_joined', '-id')
     filter_backends = [filters.SearchFilter]
     search_fields = ['username', 'email', 'nickname']
 
@@ -466,10 +788,28 @@ class AssignmentViewSet(viewsets.ModelViewSet):
         
         return qs
 
+    def perform_update(self, serializer):
+        old_quiz_data = serializer.instance.quiz_data
+        assignment = serializer.save()
+        # 修改了选择题答案：提交后异步重新评分全部已有提交
+        if assignment.assignment_type == Assignment.TYPE_CHOICE and assignment.quiz_data != old_quiz_data:
+            transaction.on_commit(lambda: regrade_assignment_task.delay(assignment.pk))
+
+    @action(detail=True, methods=['post'])
+    def regrade(self, request, pk=None):
+        """按当前答案重新评分该作业的全部提交"""
+        assignment = self.get_object()
+        if assignment.assignment_type != Assignment.TYPE_CHOICE:
+            return Response({"detail": "只有选择题作业支持自动重新评分"}, status=status.HTTP_400_BAD_REQUEST)
+        regrade_assignment_task.delay(assignment.pk)
+        return Response({"status": "queued"}, status=status.HTTP_202_ACCEPTED)
+
 
 class SubmissionViewSet(viewsets.ModelViewSet):
     serializer_class = SubmissionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('-submitted_at', '-id')
     parser_classes = [JSONParser, MultiPartParser, FormParser]
 
     def get_queryset(self):
@@ -480,6 +820,7 @@ class SubmissionViewSet(viewsets.ModelViewSet):
             qs = Submission.objects.filter(assignment__course__instructor=user).order_by('-submitted_at')
         else:
             qs = Submission.objects.filter(student=user).order_by('-submitted_at')
+        qs = qs.select_related('student', 'assignment__course')
 
         course_id = self.request.query_params.get('course_id')
         if course_id:
@@ -494,86 +835,133 @@ class SubmissionViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         assignment = serializer.validated_data.get('assignment')
-        user_content_raw = serializer.validated_data.get('content', '')
-        status_to_save = Submission.STATUS_PENDING
-        grade_to_save = None
-        feedback_to_save = ""
-
-        if assignment.assignment_type == Assignment.TYPE_CHOICE and assignment.quiz_data:
-            try:
-                quiz_list = json.loads(assignment.quiz_data)
-                user_answers = json.loads(user_content_raw)
-                correct_count = 0
-                total_count = len(quiz_list)
-                if total_count > 0:
-                    for idx, question in enumerate(quiz_list):
-                        correct_key = question.get('answer', '').upper()
-                        student_key = user_answers.get(str(idx), '').upper()
-                        if correct_key and student_key == correct_key:
-                            correct_count += 1
-                    grade_to_save = int((correct_count / total_count) * 100)
-                    status_to_save = Submission.STATUS_PASSED if grade_to_save >= 60 else Submission.STATUS_REJECTED
-                    feedback_to_save = f"系统自动批改：共 {total_count} 题，答对 {correct_count} 题。"
-                else:
-                    feedback_to_save = "系统错误：题目数据为空"
-            except Exception as e:
-                print(f"Auto-grade error: {e}")
-                feedback_to_save = "自动批改出错，请联系讲师人工审核。"
+        # 答案解析结果按作业缓存，批改只是逐题比较
+        status_to_save, grade_to_save, feedback_to_save = grading.grade_submission(
+            assignment, serializer.validated_data.get('content', '')
+        )
 
         serializer.save(
             student=self.request.user,
             status=status_to_save,
             grade=grade_to_save,
-            feedback=feedback_to_save
+            feedback=feedback_to_save,
+            auto_graded=assignment.assignment_type == Assignment.TYPE_CHOICE and bool(assignment.quiz_data)
         )
 
+    def perform_update(self, serializer):
+        # 讲师修改批改结果后不再被自动重新评分覆盖
+        graded_fields = {'status', 'grade', 'feedback'} & set(serializer.validated_data)
+        if graded_fields and serializer.instance.student_id != self.request.user.id:
+            serializer.save(auto_graded=False)
+        else:
+            serializer.save()
+
 
 # --- 15. 讲师数据看板接口 ---
 class InstructorAnalyticsView(APIView):
+    """
+    讲师数据看板：累计数据读取课程上的冗余计数，趋势读取预聚合的汇总表 (core/analytics.py)
+    ?days=30 或 ?start=YYYY-MM-DD&end=YYYY-MM-DD 指定区间，?course=<id> 只看单门课程，
+    ?granularity=hour 返回小时序列 (区间不超过 7 天)
+    """
     permission_classes = [IsInstructorOrAdmin]
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 366
+    MAX_HOURLY_DAYS = 7
+
+    def _parse_range(self, params):
+        today = timezone.localdate()
+        try:
+            if params.get('start') or params.get('end'):
+                start = date.fromisoformat(params.get('start') or params.get('end'))
+                end = date.fromisoformat(params.get('end')) if params.get('end') else today
+            else:
+                days = int(params.get('days', self.DEFAULT_DAYS))
+                start, end = today - timedelta(days=max(days, 1) - 1), today
+        except ValueError:
+            return None
+        if start > end or (end - start).days >= self.MAX_DAYS:
+            return None
+        return start, end
 
     def get(self, request):
         user = request.user
         courses = Course.objects.filter(instructor=user)
 
-        total_students = Enrollment.objects.filter(course__in=courses).values('student').distinct().count()
-        total_views = courses.aggregate(Sum('view_count'))['view_count__sum'] or 0
-        total_likes_real = 0
-        for c in courses:
-            total_likes_real += c.likes.count()
+        date_range = self._parse_range(request.query_params)
+        if date_range is None:
+            return Response({"detail": "时间区间无效"}, status=status.HTTP_400_BAD_REQUEST)
+        start, end = date_range
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in ('day', 'hour') or (
+                granularity == 'hour' and (end - start).days >= self.MAX_HOURLY_DAYS):
+            return Response({"detail": "小时粒度仅支持 7 天以内的区间"}, status=status.HTTP_400_BAD_REQUEST)
 
+        course_id = request.query_params.get('course')
+        if course_id:
+            if not course_id.isdigit():
+                return Response({"detail": "course 参数必须是课程ID"}, status=status.HTTP_400_BAD_REQUEST)
+            courses = courses.filter(pk=int(course_id))
+            if not courses.exists():
+                return Response({"detail": "课程不存在"}, status=status.HTTP_404_NOT_FOUND)
+
+        totals = courses.aggregate(
+            total_students=Sum('enrollment_count'), total_views=Sum('view_count'), total_likes=Sum('like_count')
+        )
         course_performance = courses.annotate(
-            likes_num=Count('likes'),
-            students_num=Count('enrollments')
-        ).values('title', 'view_count', 'likes_num', 'students_num').order_by('-view_count')[:5]
+            likes_num=F('like_count'),
+            students_num=F('enrollment_count')
+        ).values('id', 'title', 'view_count', 'likes_num', 'students_num').order_by('-view_count')[:5]
 
+        summary, series = analytics.course_series(
+            list(courses.values_list('pk', flat=True)), start, end, granularity
+        )
         return Response({
-            "total_students": total_students,
-            "total_views": total_views,
-            "total_likes": total_likes_real,
-            "course_data": list(course_performance)
+            "total_students": totals['total_students'] or 0,
+            "total_views": totals['total_views'] or 0,
+            "total_likes": totals['total_likes'] or 0,
+            "course_data": list(course_performance),
+            "range": {"start": start, "end": end, "granularity": granularity},
+            "summary": summary,
+            "series": series
         })
 
 
 # --- 16. 答疑控制台接口 ---
 class InstructorQAView(ListAPIView):
-    serializer_class = CommentSerializer
+    """
+    讲师答疑列表：默认只返回待回复的学员提问 (?status=all 返回全部评论)
+    直接按评论上的冗余讲师字段过滤，沿 (讲师, 是否待回复, 时间) 索引翻页
+    """
+    serializer_class = InstructorQASerializer
     permission_classes = [IsInstructorOrAdmin]
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        return Comment.objects.filter(
-            lesson__module__course__instructor=self.request.user
-        ).exclude(user=self.request.user).order_by('-created_at')
+        user = self.request.user
+        queryset = Comment.objects.filter(instructor=user)
+        if self.request.query_params.get('status') == 'all':
+            queryset = queryset.exclude(user=user)
+        else:
+            queryset = queryset.filter(is_unanswered=True)
+        return queryset.select_related('user', 'lesson', 'course').order_by('-created_at', '-id')
 
 
 # --- 17. 站内信视图 ---
 class MessageViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = OptionalCursorPagination
+    cursor_ordering = ('-created_at', '-id')
+    HISTORY_PAGE_SIZE = 50
+    HISTORY_MAX_PAGE_SIZE = 200
 
     def get_queryset(self):
         user = self.request.user
-        return Message.objects.filter(Q(sender=user) | Q(receiver=user)).order_by('-created_at')
+        return Message.objects.filter(Q(sender=user) | Q(receiver=user)).select_related(
+            'sender', 'receiver'
+        ).order_by('-created_at')
 
     def create(self, request, *args, **kwargs):
         receiver_username = request.data.get('receiver_username')
@@ -583,42 +971,81 @@ class MessageViewSet(viewsets.ModelViewSet):
         except CustomUser.DoesNotExist:
             return Response({"detail": "用户不存在"}, status=status.HTTP_400_BAD_REQUEST)
 
-        is_friend = Friendship.objects.filter(
-            (Q(from_user=sender, to_user=receiver) | Q(from_user=receiver, to_user=sender)),
-            status=Friendship.STATUS_ACCEPTED
-        ).exists()
-
-        if not is_friend:
+        if not friend_graph.are_friends(sender.id, receiver.id):
             return Response({"detail": "你们不是好友，无法发送消息"}, status=status.HTTP_403_FORBIDDEN)
 
         return super().create(request, *args, **kwargs)
 
     @action(detail=False, methods=['get'])
     def conversations(self, request):
-        user = request.user
-        sent_ids = Message.objects.filter(sender=user).values_list('receiver', flat=True)
-        received_ids = Message.objects.filter(receiver=user).values_list('sender', flat=True)
-        contact_ids = set(list(sent_ids) + list(received_ids))
-        contacts = CustomUser.objects.filter(id__in=contact_ids)
-        serializer = UserSerializer(contacts, many=True)
-        return Response(serializer.data)
+        """会话列表 (按最近消息排序，含最后一条消息摘要与未读数)"""
+        queryset = Conversation.objects.filter(owner=request.user).select_related('peer').order_by(
+            '-last_message_at', '-id'
+        )
+        self.cursor_ordering = ('-last_message_at', '-id')
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(ConversationSerializer(page, many=True).data)
+        return Response(ConversationSerializer(queryset, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def unread(self, request):
+        """未读消息总数"""
+        total = Conversation.objects.filter(owner=request.user).aggregate(total=Sum('unread_count'))['total']
+        return Response({'unread': total or 0})
 
     @action(detail=False, methods=['get'])
     def history(self, request):
+        """
+        与某个联系人的聊天记录 (按时间正序)，默认返回最近 limit 条
+        ?before=<消息ID> 向前翻页；?after=<消息ID> 或 ?since_id=<消息ID> 只取更新的消息 (增量同步)
+        响应头 X-Has-More 表示该方向是否还有更多消息
+        """
         target_id = request.query_params.get('target_id')
         if not target_id: return Response([])
         user = request.user
-        msgs = Message.objects.filter(
+        try:
+            limit = min(int(request.query_params.get('limit', self.HISTORY_PAGE_SIZE)), self.HISTORY_MAX_PAGE_SIZE)
+            after = request.query_params.get('after') or request.query_params.get('since_id')
+            before = request.query_params.get('before')
+            after = int(after) if after else None
+            before = int(before) if before else None
+        except ValueError:
+            return Response({"detail": "参数格式错误"}, status=status.HTTP_400_BAD_REQUEST)
+
+        thread = Message.objects.filter(
             (Q(sender=user) & Q(receiver_id=target_id)) |
             (Q(sender_id=target_id) & Q(receiver=user))
-        ).order_by('created_at')
-        Message.objects.filter(sender_id=target_id, receiver=user, is_read=False).update(is_read=True)
-        serializer = self.get_serializer(msgs, many=True)
-        return Response(serializer.data)
+        ).select_related('sender', 'receiver')
+
+        if after is not None:
+            msgs = list(thread.filter(id__gt=after).order_by('created_at', 'id')[:limit + 1])
+            has_more = len(msgs) > limit
+            msgs = msgs[:limit]
+        else:
+            if before is not None:
+                thread = thread.filter(id__lt=before)
+            msgs = list(thread.order_by('-created_at', '-id')[:limit + 1])
+            has_more = len(msgs) > limit
+            msgs = msgs[:limit][::-1]
+
+        # 已读标记到本次返回的最新一条为止 (一条范围 UPDATE)，之后到达的消息保持未读
+        if msgs:
+            marked = Message.objects.filter(
+                sender_id=target_id, receiver=user, is_read=False, id__lte=max(m.id for m in msgs)
+            ).update(is_read=True)
+            if marked:
+                Conversation.objects.filter(owner=user, peer_id=target_id).update(
+                    unread_count=Greatest(F('unread_count') - marked, 0)
+                )
+
+        response = Response(self.get_serializer(msgs, many=True).data)
+        response['X-Has-More'] = '1' if has_more else '0'
+        return response
 
     @action(detail=False, methods=['get'])
     def inbox(self, request):
-        msgs = Message.objects.filter(receiver=request.user).order_by('-created_at')
+        msgs = Message.objects.filter(receiver=request.user).select_related('sender', 'receiver').order_by('-created_at')
         page = self.paginate_queryset(msgs)
         if page is not None:
             return self.get_paginated_response(self.get_serializer(page, many=True).data)
@@ -626,7 +1053,7 @@ class MessageViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def sent(self, request):
-        msgs = Message.objects.filter(sender=request.user).order_by('-created_at')
+        msgs = Message.objects.filter(sender=request.user).select_related('sender', 'receiver').order_by('-created_at')
         page = self.paginate_queryset(msgs)
         if page is not None:
             return self.get_paginated_response(self.get_serializer(page, many=True).data)
@@ -636,8 +1063,12 @@ class MessageViewSet(viewsets.ModelViewSet):
     def mark_read(self, request, pk=None):
         msg = self.get_object()
         if msg.receiver == request.user:
-            msg.is_read = True
-            msg.save()
+            if not msg.is_read:
+                msg.is_read = True
+                msg.save(update_fields=['is_read'])
+                Conversation.objects.filter(
+                    owner=request.user, peer_id=msg.sender_id, unread_count__gt=0
+                ).update(unread_count=F('unread_count') - 1)
             return Response({'status': 'marked as read'})
         return Response({'status': 'forbidden'}, status=403)
 
@@ -651,42 +1082,36 @@ class UserSearchView(APIView):
         if not query:
             return Response([])
 
-        users = CustomUser.objects.filter(
-            Q(username__icontains=query) |
-            Q(nickname__icontains=query) |
-            Q(id__iexact=query)
-        ).exclude(id=request.user.id)[:10]
+        user_ids = user_search.search_user_ids(query, limit=10, exclude_id=request.user.id)
+        users_by_id = CustomUser.objects.in_bulk(user_ids)
+        users = [users_by_id[user_id] for user_id in user_ids if user_id in users_by_id]
 
-        results = []
-        my_friendships = Friendship.objects.filter(
-            Q(from_user=request.user) | Q(to_user=request.user)
-        )
+        # 好友状态从缓存的邻接集合批量解析，不再逐个用户查询
+        statuses = friend_graph.friendship_statuses(request.user.id, [u.id for u in users])
+        results = UserCardSerializer(users, many=True).data
+        for u_data in results:
+            u_data['friendship_status'] = statuses[u_data['id']]
+        return Response(results)
 
-        for u in users:
-            status_str = 'none'
-            rel = my_friendships.filter(
-                (Q(from_user=request.user, to_user=u) | Q(from_user=u, to_user=request.user)),
-                status=Friendship.STATUS_ACCEPTED
-            ).first()
 
-            if rel:
-                status_str = 'friend'
-            else:
-                sent = my_friendships.filter(from_user=request.user, to_user=u,
-                                             status=Friendship.STATUS_PENDING).exists()
-                if sent:
-                    status_str = 'sent'
-                else:
-                    received = my_friendships.filter(from_user=u, to_user=request.user,
-                                                     status=Friendship.STATUS_PENDING).exists()
-                    if received:
-                        status_str = 'received'
-
-            u_data = UserSerializer(u).data
-            u_data['friendship_status'] = status_str
-            results.append(u_data)
+class UserTypeaheadView(APIView):
+    """输入联想：只返回用户卡片，前端输入时防抖调用"""
+    permission_classes = [permissions.IsAuthenticated]
+    TYPEAHEAD_LIMIT = 8
 
-        return Response(results)
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response([])
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.TYPEAHEAD_LIMIT)), 1), 20)
+        except ValueError:
+            limit = self.TYPEAHEAD_LIMIT
+
+        user_ids = [user_id for user_id in user_search.typeahead(query, limit) if user_id != request.user.id]
+        users_by_id = CustomUser.objects.only('id', 'username', 'nickname', 'avatar').in_bulk(user_ids[:limit])
+        users = [users_by_id[user_id] for user_id in user_ids[:limit] if user_id in users_by_id]
+        return Response(UserCardSerializer(users, many=True).data)
 
 
 # --- 19. 好友管理视图 ---
@@ -698,7 +1123,7 @@ class FriendshipViewSet(viewsets.ModelViewSet):
         user = self.request.user
         return Friendship.objects.filter(
             Q(from_user=user) | Q(to_user=user)
-        )
+        ).select_related('from_user', 'to_user')
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset().filter(status=Friendship.STATUS_ACCEPTED))
@@ -711,18 +1136,8 @@ class FriendshipViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def friends(self, request):
-        user = request.user
-        friendships = Friendship.objects.filter(
-            (Q(from_user=user) | Q(to_user=user)),
-            status=Friendship.STATUS_ACCEPTED
-        )
-        friend_users = []
-        for f in friendships:
-            if f.from_user == user:
-                friend_users.append(f.to_user)
-            else:
-                friend_users.append(f.from_user)
-        serializer = UserSerializer(friend_users, many=True)
+        friend_users = CustomUser.objects.filter(id__in=friend_graph.friend_ids(request.user.id)).order_by('id')
+        serializer = UserCardSerializer(friend_users, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
@@ -730,7 +1145,7 @@ class FriendshipViewSet(viewsets.ModelViewSet):
         requests = Friendship.objects.filter(
             to_user=request.user,
             status=Friendship.STATUS_PENDING
-        ).order_by('-created_at')
+        ).select_related('from_user', 'to_user').order_by('-created_at')
         serializer = self.get_serializer(requests, many=True)
         return Response(serializer.data)
 
@@ -884,68 +1299,90 @@ class PointsViewSet(viewsets.ViewSet):
         if action_type not in ['watch', 'comment', 'submit', 'login']:
             return Response({"detail": "无效的积分类型"}, status=400)
 
-        # 积分规则
-        points_map = {
-            'watch': 5,
-            'comment': 3,
-            'submit': 10,
-            'login': 2
-        }
-        points = points_map.get(action_type, 0)
-
-        # 更新用户积分
-        user_points, _ = UserPoints.objects.get_or_create(user=request.user)
-        user_points.total_points += points
-        user_points.level = 1 + user_points.total_points // 100  # 每100分升一级
-        
-        # 更新连续学习天数
-        today = timezone.now().date()
-        if user_points.last_active_date:
-            if user_points.last_active_date == today - timezone.timedelta(days=1):
-                user_points.continuous_days += 1
-            elif user_points.last_active_date != today:
-                user_points.continuous_days = 1
-        else:
-            user_points.continuous_days = 1
-        user_points.last_active_date = today
-        user_points.save()
-
-        # 记录积分变化
-        PointRecord.objects.create(
-            user=request.user,
-            action=action_type,
-            points=points,
-            description=f"获得{points}积分"
-        )
+        # 客户端重试时通过 Idempotency-Key 请求头 (或 idempotency_key 字段) 去重
+        idempotency_key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+        if idempotency_key is not None and not isinstance(idempotency_key, str):
+            return Response({"detail": "幂等键必须是字符串"}, status=400)
+        if idempotency_key and len(idempotency_key) > 64:
+            return Response({"detail": "幂等键过长"}, status=400)
+
+        # 与课程相关的行为计入该课程分类的排行榜
+        category_id = None
+        course_id = request.data.get('course_id')
+        if course_id:
+            try:
+                course_id = int(course_id)
+            except (TypeError, ValueError):
+                return Response({"detail": "course_id 必须是整数"}, status=400)
+            category_id = Course.objects.filter(pk=course_id).values_list('category_id', flat=True).first()
+
+        result = points.award(request.user, action_type, idempotency_key=idempotency_key, category_id=category_id)
+        user_points = result.user_points
 
         # 检查并解锁勋章
-        self._check_badges(request.user, user_points)
+        if not result.duplicate:
+            self._check_badges(request.user, user_points)
 
         return Response({
-            "points_added": points,
+            "points_added": result.points_added,
             "total_points": user_points.total_points,
-            "level": user_points.level
+            "level": user_points.level,
+            "duplicate": result.duplicate
         })
 
     def _check_badges(self, user, user_points):
         """检查并解锁勋章"""
-        badges = Badge.objects.all()
-        for badge in badges:
-            # 跳过已获得的勋章
-            if UserBadge.objects.filter(user=user, badge=badge).exists():
-                continue
-            
-            # 检查条件
-            unlocked = False
-            if badge.condition_type == 'points' and user_points.total_points >= badge.condition_value:
-                unlocked = True
-            elif badge.condition_type == 'continuous_days' and user_points.continuous_days >= badge.condition_value:
-                unlocked = True
-            elif badge.condition_type == 'level' and user_points.level >= badge.condition_value:
-                unlocked = True
-
-            if unlocked:
-                UserBadge.objects.create(user=user, badge=badge)
+        return badges.evaluate(user, user_points)
+
+
+# --- 23.1 积分排行榜 ---
+class LeaderboardView(APIView):
+    """
+    ?board=global (总榜) / weekly (本周) / category (分类榜，需 ?category=<slug>)
+    ?offset= &limit= 分页；登录用户额外返回自己的名次
+    """
+    permission_classes = [permissions.AllowAny]
+    PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+
+    def get(self, request):
+        board_type = request.query_params.get('board', leaderboard.BOARD_GLOBAL)
+        if board_type == leaderboard.BOARD_WEEKLY:
+            board = leaderboard.weekly_board()
+        elif board_type == leaderboard.BOARD_CATEGORY:
+            category = Category.objects.filter(slug=request.query_params.get('category')).first()
+            if category is None:
+                return Response({"detail": "分类不存在"}, status=status.HTTP_404_NOT_FOUND)
+            board = leaderboard.category_board(category.id)
+        elif board_type == leaderboard.BOARD_GLOBAL:
+            board = leaderboard.global_board()
+        else:
+            return Response({"detail": "无效的榜单类型"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            limit = min(max(int(request.query_params.get('limit', self.PAGE_SIZE)), 1), self.MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({"detail": "分页参数无效"}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = leaderboard.get_page(board, offset, limit)
+        users = CustomUser.objects.in_bulk([user_id for user_id, _ in entries])
+        results = [
+            {"rank": offset + i + 1, "score": score, "user": UserCardSerializer(users[user_id]).data}
+            for i, (user_id, score) in enumerate(entries) if user_id in users
+        ]
+
+        me = None
+        if request.user.is_authenticated:
+            ranked = leaderboard.get_rank(board, request.user.id)
+            if ranked:
+                me = {"rank": ranked[0], "score": ranked[1]}
+        return Response({
+            "board": board_type,
+            "total": leaderboard.get_count(board),
+            "results": results,
+            "me": me
+        })
 
 
 # --- 24. 勋章管理 ---
@@ -986,4 +1423,42 @@ class AskAIView(APIView):
             answer = response.choices[0].message.content
             return Response({"answer": answer})
         except Exception as e:
-            return Response({"answer": f"AI 连接失败: {str(e)}"}, status=200)
\ No newline at end of file
+            return Response({"answer": f"AI 连接失败: {str(e)}"}, status=200)
+
+# --- 26. 实时推送 (SSE) ---
+class RealtimeTicketView(APIView):
+    """签发建立推送连接用的短期票据；未开启实时推送时返回 501，前端据此改为不连接"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        if not realtime.is_enabled():
+            return Response({"detail": "实时推送未开启"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        return Response({
+            "ticket": realtime.issue_ticket(request.user.pk),
+            "expires_in": getattr(settings, 'REALTIME_TICKET_TTL', 60),
+        })
+
+
+async def realtime_stream(request):
+    """
+    Server-Sent Events 推送流：新私信、好友申请、评论回复、作业批改结果。
+    连接凭据为 /api/realtime/ticket/ 签发的 ?ticket= (也兼容 Authorization 头)。
+    只在 ASGI 下提供：WSGI 会把无限的异步生成器整体缓冲，永远不会发出响应，此时返回 501。
+    """
+    if not realtime.is_enabled() or not isinstance(request, ASGIRequest):
+        return JsonResponse({"detail": "实时推送需要以 ASGI 方式部署"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    user_id = realtime.check_ticket(request.GET.get('ticket'))
+    if user_id is None:
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Token '):
+            token = await Token.objects.filter(key=header[len('Token '):].strip()).afirst()
+            user_id = token.user_id if token else None
+    if user_id is None or not await CustomUser.objects.filter(pk=user_id, is_active=True).aexists():
+        return JsonResponse({"detail": "身份认证信息未提供或无效"}, status=status.HTTP_401_UNAUTHORIZED)
+
+    response = StreamingHttpResponse(realtime.event_stream(user_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 禁止 nginx 缓冲，事件需要即时送达
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+实时推送接口 /api/realtime/stream/ 是长连接的异步视图，只在 ASGI 下提供 (需设置 REALTIME_ENABLED=True)：
+    uvicorn it_platform.asgi:application --workers 4
+多个 worker 时需配置 REALTIME_REDIS_URL，使事件能投递到任意进程上的连接。
+以 WSGI 部署时该接口返回 501，前端不会建立推送连接。
 """
 
 import os
@@ -152,6 +152,9 @@ CORS_ALLOWED_ORIGINS = [
 # 允许携带凭证 (Cookie等)
 CORS_ALLOW_CREDENTIALS = True
 
+# 允许前端读取的自定义响应头 (聊天记录分页、分片上传续传)
+CORS_EXPOSE_HEADERS = ['X-Has-More', 'Upload-Offset', 'Upload-Length', 'Location']
+
 
 # ==============================================================================
 # 9. DRF (REST Framework) 配置
@@ -198,41 +201,161 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_ACCEPT_CONTENT = ['json']
 
+# 定时任务 (需要运行 celery beat)
+CELERY_BEAT_SCHEDULE = {
+    # 将缓存中累积的课程观看次数批量写回数据库
+    'flush-course-views': {
+        'task': 'core.tasks.flush_course_views_task',
+        'schedule': 60.0,
+    },
+    # 重建首页榜单缓存 (popular / newest / top_liked)
+    'refresh-homepage-rails': {
+        'task': 'core.tasks.refresh_homepage_rails_task',
+        'schedule': 300.0,
+    },
+    # 增量汇总讲师数据看板的小时/每日统计
+    'rollup-course-stats': {
+        'task': 'core.tasks.rollup_course_stats_task',
+        'schedule': 300.0,
+    },
+    # 按数据库对账重建积分排行榜
+    'reconcile-leaderboards': {
+        'task': 'core.tasks.reconcile_leaderboards_task',
+        'schedule': 600.0,
+    },
+    # 清理过期的分片上传会话与临时文件
+    'cleanup-upload-sessions': {
+        'task': 'core.tasks.cleanup_upload_sessions_task',
+        'schedule': 3600.0,
+    },
+}
+
 
 # ==============================================================================
 # 11. 缓存配置 (新增)
 # ==============================================================================
 
-# 使用内存缓存（不需要Redis），简化配置
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000
+# 共享缓存：配置 CACHE_REDIS_URL 后所有进程共用 Redis；
+# 未配置时退回本地内存缓存 (每个进程各自一份，仅适用于开发/测试)
+try:
+    from decouple import config
+    CACHE_REDIS_URL = config('CACHE_REDIS_URL', default='')
+except ImportError:
+    CACHE_REDIS_URL = ''
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'it_platform',
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000
+            }
         }
     }
-}
 
-# 如果需要使用Redis缓存，请先确保Redis服务运行，然后使用以下配置：
-# CACHES = {
-#     'default': {
-#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-#         'LOCATION': 'redis://127.0.0.1:6379/1',
-#         'KEY_PREFIX': 'it_platform',
-#         'TIMEOUT': 300,
-#     }
-# }
+# 两级缓存 (core/tiered_cache.py)：进程内 LRU (L1) + 上面的共享缓存 (L2)
+#   L1_TIMEOUT: L1 条目最长保留时间 (秒)
+#   VERSION_CHECK_INTERVAL: 各进程重新读取命名空间版本号的间隔 (秒)，即跨进程失效的最大延迟
+TIERED_CACHE = {
+    'L2': 'default',
+    'L1_MAX_ENTRIES': 1000,
+    'L1_TIMEOUT': 30,
+    'VERSION_CHECK_INTERVAL': 2,
+}
 
 
 # ==============================================================================
 # 11. 其他配置
 # ==============================================================================
 
+# 随部署环境变化的配置项 (视频分发方式、实时推送、积分排行榜、首页榜单的站点地址)，含义见下方各项说明
+try:
+    from decouple import config
+    MEDIA_ACCEL_REDIRECT = config('MEDIA_ACCEL_REDIRECT', default='')
+    REALTIME_ENABLED = config('REALTIME_ENABLED', default=False, cast=bool)
+    REALTIME_REDIS_URL = config('REALTIME_REDIS_URL', default='')
+    LEADERBOARD_REDIS_URL = config('LEADERBOARD_REDIS_URL', default='')
+    SITE_URL = config('SITE_URL', default='')
+except ImportError:
+    MEDIA_ACCEL_REDIRECT = ''
+    REALTIME_ENABLED = False
+    REALTIME_REDIS_URL = ''
+    LEADERBOARD_REDIS_URL = ''
+    SITE_URL = ''
+
+# 课时视频分发：部署在反向代理之后时，由代理负责实际的文件传输
+#   'nginx'  -> 返回 X-Accel-Redirect: MEDIA_ACCEL_PREFIX + 文件名 (需配置 internal location)
+#   'apache' -> 返回 X-Sendfile: 文件绝对路径 (需启用 mod_xsendfile)
+#   ''       -> 由 Django 直接分段传输
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# 课时视频签名播放地址的有效期 (秒)，签名只对单个课时有效
+LESSON_MEDIA_URL_TTL = 60 * 60 * 2
+
+# HLS 转码：转码器实现 (测试可用 core.transcoding.FakeTranscoder) 与码率档位 (名称, 高度, 视频码率)
+# 输出目录不在 MEDIA_ROOT 下，只能经签名接口访问；使用 nginx 时 HLS_ACCEL_PREFIX 需配置为指向 HLS_ROOT 的 internal location
+HLS_TRANSCODER = 'core.transcoding.FFmpegTranscoder'
+HLS_ROOT = BASE_DIR / 'protected_media' / 'lesson_hls'
+HLS_ACCEL_PREFIX = '/protected-hls/'
+HLS_RENDITIONS = [
+    ('360p', 360, '800k'),
+    ('720p', 720, '2800k'),
+    ('1080p', 1080, '5000k'),
+]
+
 # 文件上传大小限制 (50MB)
 FILE_UPLOAD_MAX_MEMORY_SIZE = 52428800
 DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800
 
+# 分片上传 (/api/lesson-uploads/) 的单个视频大小上限 (5GB)，分片直接写入磁盘，不受上面的内存限制
+LESSON_UPLOAD_MAX_SIZE = 5 * 1024 ** 3
+# 单个分片写入的最长占用时间 (秒)，以及未完成的上传会话在多久没有进展后被清理 (秒)
+LESSON_UPLOAD_LEASE_SECONDS = 15 * 60
+LESSON_UPLOAD_EXPIRY = 60 * 60 * 24
+
+# 实时推送 (SSE)：推送流是长连接，只有以 ASGI 方式部署 (uvicorn / daphne) 时才能开启 REALTIME_ENABLED；
+# 默认进程内通道层，仅适用于单进程；多个 ASGI 进程部署时配置 REALTIME_REDIS_URL
+if REALTIME_REDIS_URL:
+    REALTIME_CHANNEL_LAYER = {'BACKEND': 'core.realtime.RedisChannelLayer', 'LOCATION': REALTIME_REDIS_URL}
+else:
+    REALTIME_CHANNEL_LAYER = {'BACKEND': 'core.realtime.InMemoryChannelLayer', 'CAPACITY': 100}
+# 推送连接空闲时发送保活注释的间隔 (秒)，需小于反向代理的读超时
+REALTIME_KEEPALIVE_SECONDS = 15
+# 建立推送连接的票据有效期 (秒)
+REALTIME_TICKET_TTL = 60
+
+# 积分排行榜：配置 LEADERBOARD_REDIS_URL 时使用 Redis ZSET，否则使用进程内有序列表 (仅适用于单进程)
+if LEADERBOARD_REDIS_URL:
+    LEADERBOARD_STORE = {'BACKEND': 'core.leaderboard.RedisLeaderboardStore', 'LOCATION': LEADERBOARD_REDIS_URL}
+else:
+    LEADERBOARD_STORE = {'BACKEND': 'core.leaderboard.InMemoryLeaderboardStore'}
+# 进程内榜单看不到其他进程的加分，读取时每隔该时间 (秒) 按数据库重建一次 (Redis 存储由 beat 定时对账)
+LEADERBOARD_REBUILD_INTERVAL = 60
+
+# 课程观看去重窗口 (秒)：同一用户/IP 在窗口内重复观看只计一次，0 表示不去重
+COURSE_VIEW_DEDUP_SECONDS = 0
+# 观看次数写缓冲：只有配置了共享 Redis 时才启用 (各进程与 celery 都能看到同一份增量)，否则直接写库
+COURSE_VIEW_BUFFER = (
+    {'BACKEND': 'core.view_counter.RedisViewBuffer', 'LOCATION': CACHE_REDIS_URL} if CACHE_REDIS_URL else None
+)
+
+# 首页榜单：每个榜单的课程数量与缓存时间 (秒)；
+# 榜单在请求之外预先序列化，配置 SITE_URL (如 https://api.example.com，主机名需在 ALLOWED_HOSTS 中) 后封面等文件地址为绝对地址，否则为相对路径
+HOMEPAGE_RAIL_SIZE = 3
+HOMEPAGE_RAIL_TIMEOUT = 60 * 10
+
+# 课时讨论区：缓存前几页评论列表，以及缓存内容的刷新间隔 (秒)
+COMMENT_CACHE_PAGES = 2
+COMMENT_CACHE_TIMEOUT = 60
+
 # 默认主键类型
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
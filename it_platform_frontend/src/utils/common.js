@@ -25,6 +25,20 @@ export const getFullMediaUrl = (relativePath) => {
 // 导出别名，方便语义化使用
 export const getFullCoverImagePath = getFullMediaUrl
 
+/**
+ * 从签名播放地址中选择视频源
+ * 转码完成且浏览器原生支持 HLS (Safari / iOS / 部分 Android) 时优先使用自适应码率的 HLS，否则回退到 MP4
+ * @param {Object} lesson - 课时 (需要 transcode_status)
+ * @param {Object} urls - /api/lessons/<id>/video/url/ 的返回值 { mp4, hls }
+ * @returns {string|null} 播放地址
+ */
+export const pickVideoSource = (lesson, urls) => {
+  const canPlayHls = typeof document !== 'undefined' &&
+    document.createElement('video').canPlayType('application/vnd.apple.mpegurl') !== ''
+  if (urls.hls && lesson.transcode_status === 'ready' && (canPlayHls || !urls.mp4)) return urls.hls
+  return urls.mp4 || urls.hls || null
+}
+
 /**
  * 图片加载失败回退
  */
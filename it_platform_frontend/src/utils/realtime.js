@@ -0,0 +1,61 @@
+// src/utils/realtime.js
+import apiClient from '@/api'
+
+const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://127.0.0.1:8000'
+const RECONNECT_DELAY = 5000
+
+/**
+ * 订阅后端实时推送 (Server-Sent Events)
+ * 先用登录 Token 换取短期连接票据，后端未开启推送 (如以 WSGI 部署) 时不建立连接；
+ * 票据过期导致重连失败时重新申请票据
+ * @param {Object} handlers - 事件类型到回调的映射，如 { 'message.new': (data) => {} }
+ * @returns {Function} 关闭连接的函数
+ */
+export const connectRealtime = (handlers) => {
+  if (!localStorage.getItem('token') || typeof EventSource === 'undefined') return () => {}
+
+  const cleanBase = API_BASE_URL.endsWith('/') ? API_BASE_URL.slice(0, -1) : API_BASE_URL
+  let source = null
+  let closed = false
+  let retryTimer = null
+
+  const open = async () => {
+    let ticket
+    try {
+      const res = await apiClient.post('/api/realtime/ticket/')
+      ticket = res.data.ticket
+    } catch (e) {
+      // 501: 后端未提供推送流，不再尝试；其他错误稍后重试
+      if (!closed && e.response?.status !== 501 && e.response?.status !== 401) {
+        retryTimer = setTimeout(open, RECONNECT_DELAY)
+      }
+      return
+    }
+    if (closed) return
+
+    source = new EventSource(`${cleanBase}/api/realtime/stream/?ticket=${encodeURIComponent(ticket)}`)
+    Object.entries(handlers).forEach(([eventType, handler]) => {
+      source.addEventListener(eventType, (event) => {
+        try {
+          handler(JSON.parse(event.data))
+        } catch (e) {
+          console.error('实时事件处理失败:', e)
+        }
+      })
+    })
+    // 网络断开时浏览器会自动重连；连接被拒绝 (如票据过期) 后进入 CLOSED 状态，需要重新申请票据
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && !closed) {
+        retryTimer = setTimeout(open, RECONNECT_DELAY)
+      }
+    }
+  }
+
+  open()
+
+  return () => {
+    closed = true
+    clearTimeout(retryTimer)
+    if (source) source.close()
+  }
+}